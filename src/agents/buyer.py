@@ -1,34 +1,38 @@
 from src.agents.trading_agent import TradingAgent
-from src.order import Order
+import functools
 
 class Buyer(TradingAgent):
     def __init__(self, config):
         super().__init__(config)
+        self.log_prefix = "Buyer,{}".format(self.product_id)
 
-    def log_error(self, msg):
-        self.logger.log_error("Buyer,{}".format(self.product_id), msg)
+    def log_error(self, msg, *args):
+        self.logger.log_error(self.log_prefix, msg, *args)
     
-    def log_warn(self, msg):
-        self.logger.log_warn("Buyer,{}".format(self.product_id), msg)
+    def log_warn(self, msg, *args):
+        self.logger.log_warn(self.log_prefix, msg, *args)
 
-    def log_info(self, msg):
-        self.logger.log_info("Buyer,{}".format(self.product_id), msg)
+    def log_info(self, msg, *args):
+        self.logger.log_info(self.log_prefix, msg, *args)
 
     def is_buyer(self):
         return True
 
-    def place_limit_order(self, price, size):
-        self.exchange.place_limit_order(product_id=self.product_id, side="buy", price=price, size=size, post_only=True, on_order_placed=self.on_order_placed_limit)
+    def place_limit_order(self, order):
+        return self.exchange.place_limit_order(product_id=self.product_id, side="buy", price=order.price, size=order.order_size, post_only=True, client_oid=order.client_oid,
+                                               on_order_placed=functools.partial(self.on_order_placed_limit, order))
 
-    def replace_limit_order(self, price, size):
-        self.exchange.replace_limit_order(prev_order=self.order, product_id=self.product_id, side="buy", price=price, size=size, post_only=True, on_order_placed=self.on_order_placed_limit)
+    # The old order is cancelled at the same time the new one is placed
+    def replace_limit_order(self, prev_order, order):
+        return self.exchange.replace_limit_order(prev_order=prev_order, product_id=self.product_id, side="buy", price=order.price, size=order.order_size, post_only=True, client_oid=order.client_oid,
+                                                 on_order_placed=functools.partial(self.on_order_placed_limit, order), on_order_cancelled=functools.partial(self.on_order_cancelled, prev_order))
 
-    def calculate_price(self, msg, tick_price, tick_price_changes):
+    def calculate_price(self, tick, tick_price, tick_price_changes):
         # Calculate our custom alpha offset that we want to buy at
         alpha = max(tick_price_changes*self.dynamic_thresh_multiplier, self.base_pct_chng_mean*self.base_thresh_multiplier)
 
         # Make sure our calculated price isn't more than 1 step better than the best price being offered currently (fail-safe)
-        bid = min(tick_price * (1 - alpha), float(msg["best_bid"]) + self.quote_increment)     
+        bid = min(tick_price * (1 - alpha), self.best_bid(tick) + self.quote_increment)     
         
         return round(bid, self.quote_increment) 
 
@@ -40,19 +44,16 @@ class Buyer(TradingAgent):
         return round(size, self.base_increment)
 
     # Validate that the order we placed had no errors, or respond to the error
-    def on_order_placed_limit(self, resp):
+    def on_order_placed_limit(self, order, resp):
         try:
-            # Save order id and update balances of wallet
-            self.order = Order(price=float(resp["price"]), order_id=resp["id"], order_size=float(resp["size"]), outstanding_order_size=float(resp["size"])-float(resp["filled_size"]))
-
-            self.exchange.hold[self.base_currency] += float(resp["size"]) * float(resp["price"])
-            self.exchange.available[self.base_currency] -= float(resp["size"]) * float(resp["price"])
-            self.log_info("buy {} @ {} success".format(resp["size"], resp["price"]))
+            # Save order id, the exchange's wallet puts the funds on hold
+            self.order_opened(order, resp)
+            self.log_info("buy {} @ {} success", resp["size"], resp["price"])
         except KeyError:
             self.log_warn("buy order failed to be placed!")
 
             # Re-initalize order to empty state
-            self.order = Order()
+            self.order_done(order)
 
             # Determine what went wrong and take remedial action
             if resp["message"] == "Post only mode":
@@ -69,10 +70,20 @@ class Buyer(TradingAgent):
                 self.log_error("order failed for unknown reason")
                 self.log_error(resp)
 
+        self.requote()
+
+    # The exchange's wallet releases whatever the cancelled order still had on hold
+    def on_order_cancelled(self, order, resp):
+        if self.order_cancelled(order, resp):
+            self.log_info("cancel buy {} @ {} done", order.outstanding_order_size, order.price)
+        else:
+            self.log_warn("cancel buy {} @ {} failed, order kept open: {}", order.outstanding_order_size, order.price, resp)
+        self.requote()
+
     # This is only used when we run out of USD and have to emergency sell some coin
     def on_order_placed_market(self, resp):
         try:
-            self.log_info("sell {} @ {} success".format(resp["size"], resp["price"]))
+            self.log_info("sell {} @ {} success", resp["size"], resp["price"])
         except KeyError:
             self.log_error("market sell failed")
             self.log_error(resp)
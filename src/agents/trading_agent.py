@@ -1,11 +1,13 @@
-from src.order import Order
+from src.order import Order, OPEN, PENDING_CANCEL, DONE
 import abc
 
 MILLI = (10**-6)
 
 class TradingAgent(metaclass=abc.ABCMeta):
     def __init__(self, config):
+        # Our current quote, and every order of ours that isn't done yet keyed by client_oid
         self.order = Order()
+        self.orders = {}
 
         self.product_id = config["PRODUCT"]
         self.target_currency, self.base_currency = self.product_id.split("-")
@@ -17,6 +19,14 @@ class TradingAgent(metaclass=abc.ABCMeta):
         self.dynamic_thresh_multiplier = config["DTM"]
         self.portfolio_ratio = config["PR"]
 
+        # Latest (price, size) we want to quote, only the newest one is ever acted on,
+        # and when the tick it came from was received
+        self.desired_quote = None
+        self.desired_quote_time = None
+
+        # Optional level 2 order book of our product, kept current between trades by the exchange
+        self.book = None
+
         self.closed = False
 
     def close(self):
@@ -28,67 +38,152 @@ class TradingAgent(metaclass=abc.ABCMeta):
     def __del__(self):
         self.close()
 
+    # msg is formatted with args only if the line is logged
     @abc.abstractmethod
-    def log_error(self, msg):
+    def log_error(self, msg, *args):
         return
 
     @abc.abstractmethod
-    def log_warn(self, msg):
+    def log_warn(self, msg, *args):
         return
 
     @abc.abstractmethod
-    def log_info(self, msg):
+    def log_info(self, msg, *args):
         return
 
     @abc.abstractmethod
     def is_buyer(self):
         return
 
-    def on_tick(self, msg, tick_price, tick_price_changes):
+    # tick is a Tick record of the trade that just printed
+    def on_tick(self, tick, tick_price, tick_price_changes):
         try:
             # Calculate price and volume we would trade at for a new order
-            new_order_price = self.calculate_price(msg, tick_price, tick_price_changes)
+            new_order_price = self.calculate_price(tick, tick_price, tick_price_changes)
             new_order_size = self.calculate_size(new_order_price)
 
-            # If order is not opened, order price will be -1 and this will always be false
-            price_threshold = abs( new_order_price - self.order.price ) / self.order.price >= self.p_diff_thresh
-            
-            try:
-                size_threshold = abs( self.order.outstanding_order_size - new_order_size) / self.order.outstanding_order_size >= self.v_diff_thresh
-            # If outstanding order volume is 0, then order was filled and we need to put a new one on
-            except ZeroDivisionError:
-                self.order = Order()
-
-            # Check if we haven't placed an order yet and if so place one
-            if not self.order.opened():
-                self.order = Order(price=new_order_price, order_size=new_order_size, outstanding_order_size=new_order_size)
-                self.place_limit_order(new_order_price, new_order_size)
-                self.log_info("new order_price({}) order_size({})".format(new_order_price, new_order_size))
-                
-            # Check if we need to update our order and if so replace our order
-            elif price_threshold or size_threshold:
-                self.order = Order(price=new_order_price, order_size=new_order_size, outstanding_order_size=new_order_size)
-                self.replace_limit_order(new_order_price, new_order_size)
-                self.log_info("replace order_price({}) order_size({})".format(new_order_price, new_order_size))
-
-            # No action needed right now
-            else:
-                self.log_info("noop order_price({}) order_size({})".format(new_order_price, new_order_size))
+            # Overwrite whatever quote we wanted before, the exchange reconciles it against
+            # our live order once it has the rate budget to act on it
+            self.desired_quote = (new_order_price, new_order_size)
+            self.desired_quote_time = tick.received
+            self.exchange.update_quote(self)
 
         except (AttributeError, KeyError) as e:
-            self.log_info("data structures not ready yet")
-            print(e)
+            self.log_info("data structures not ready yet: {}", repr(e))
+
+    # Act on the latest desired quote, returns the exchange request that was made if any
+    def reconcile_quote(self):
+        if self.desired_quote is None:
+            return None
+
+        # Never send a request for an order that is still waiting on the last one, the desired
+        # quote stays put and is looked at again once the exchange has answered
+        if self.order.in_flight():
+            return None
+
+        new_order_price, new_order_size = self.desired_quote
+        self.desired_quote = None
+
+        # If order is not opened, order price will be -1 and this will always be false
+        price_threshold = abs( new_order_price - self.order.price ) / self.order.price >= self.p_diff_thresh
+        
+        try:
+            size_threshold = abs( self.order.outstanding_order_size - new_order_size) / self.order.outstanding_order_size >= self.v_diff_thresh
+        # If outstanding order volume is 0, then order was filled and we need to put a new one on
+        except ZeroDivisionError:
+            self.order_done(self.order)
+
+        # Check if we haven't placed an order yet and if so place one
+        if not self.order.opened():
+            self.order = self.new_order(new_order_price, new_order_size)
+            req = self.place_limit_order(self.order)
+            self.log_info("new order_price({}) order_size({})", new_order_price, new_order_size)
+            return req
+            
+        # Check if we need to update our order and if so replace our order,
+        # self.order becomes the new order right away so it never holds a price we aren't quoting
+        elif price_threshold or size_threshold:
+            prev_order = self.order
+            prev_order.state = PENDING_CANCEL
+            self.order = self.new_order(new_order_price, new_order_size)
+            req = self.replace_limit_order(prev_order, self.order)
+            self.log_info("replace order_price({}) order_size({})", new_order_price, new_order_size)
+            return req
+
+        # No action needed right now
+        else:
+            self.log_info("noop order_price({}) order_size({})", new_order_price, new_order_size)
+            return None
+
+    # Start tracking an order we are about to send
+    def new_order(self, price, size):
+        order = Order.pending(price, size)
+        self.orders[order.client_oid] = order
+        return order
+
+    # The exchange accepted an order, resp is its answer to the place request
+    def order_opened(self, order, resp):
+        order.order_id = resp["id"]
+        order.price = float(resp["price"])
+        order.order_size = float(resp["size"])
+        order.outstanding_order_size = float(resp["size"]) - float(resp["filled_size"])
+        order.state = OPEN
+
+    # Stop tracking an order, if it was our current quote we no longer have one
+    def order_done(self, order):
+        order.state = DONE
+        self.orders.pop(order.client_oid, None)
+        if self.order is order:
+            self.order = Order()
+
+    # A cancel answered with the list of cancelled order ids went through, errors come back as a dict
+    # with a message. After an error the order may still be resting, so it is OPEN again and the watchdog
+    # or the order reconciliation sorts it out. Returns whether the cancel went through
+    def order_cancelled(self, order, resp):
+        if isinstance(resp, list):
+            self.order_done(order)
+            return True
+
+        order.state = OPEN
+        return False
+
+    # Quotes that came in while a request was in flight were held back, act on the latest one once the exchange answered
+    def requote(self):
+        if self.desired_quote is not None and not self.order.in_flight():
+            self.exchange.update_quote(self)
+
+    # Order of ours with the given exchange id, None if we don't know it
+    def find_order(self, order_id):
+        for order in self.orders.values():
+            if order.order_id == order_id:
+                return order
+        return None
+
+    # Best bid and ask from the order book when we have one, otherwise from the last tick
+    def best_bid(self, tick):
+        if self.book is not None and self.book.ready:
+            bid = self.book.best_bid()
+            if bid is not None:
+                return bid
+        return tick.best_bid
+
+    def best_ask(self, tick):
+        if self.book is not None and self.book.ready:
+            ask = self.book.best_ask()
+            if ask is not None:
+                return ask
+        return tick.best_ask
 
     @abc.abstractmethod
-    def place_limit_order(self, price, size):
+    def place_limit_order(self, order):
         return
 
     @abc.abstractmethod
-    def replace_limit_order(self, price, size):
+    def replace_limit_order(self, prev_order, order):
         return
 
     @abc.abstractmethod
-    def calculate_price(self, msg, tick_price, tick_price_changes):
+    def calculate_price(self, tick, tick_price, tick_price_changes):
         return
 
     @abc.abstractmethod
@@ -97,7 +192,12 @@ class TradingAgent(metaclass=abc.ABCMeta):
 
     # Validate that the order we placed had no errors, or respond to the error
     @abc.abstractmethod
-    def on_order_placed_limit(self, resp):
+    def on_order_placed_limit(self, order, resp):
+        return
+
+    # The exchange answered our cancel of order, it won't trade any more
+    @abc.abstractmethod
+    def on_order_cancelled(self, order, resp):
         return
 
     # This is only used when we run out of coin and have to emergency buy some
@@ -105,27 +205,41 @@ class TradingAgent(metaclass=abc.ABCMeta):
     def on_order_placed_market(self, resp):
         return
 
-    # When we get an order filled, log info about it and decrease the outstanding order size
-    def on_fill(self, msg):
-        self.log_info("fill size({}) price({}) side({}) maker_fee_rate({})".format(msg["size"], msg["price"], msg["side"], msg["maker_fee_rate"]))
-        self.order.outstanding_order_size -= float(msg["size"])
+    # When we get an order filled, log info about it and decrease the outstanding order size.
+    # fill is a Fill record
+    def on_fill(self, fill):
+        self.log_info("fill size({}) price({}) side({}) maker_fee_rate({})", fill.size, fill.price, fill.side, fill.maker_fee_rate)
+
+        # The fill can be for an order we are cancelling as well as for our current quote
+        if fill.maker_order_id is not None:
+            order = self.find_order(fill.maker_order_id)
+        else:
+            order = self.order
+
+        if order is not None:
+            order.outstanding_order_size -= fill.size
 
     # Match channel doesn't guarantee delivery so we need to watch our open orders
     # and make sure we stay in a good state
     def on_order_watchdog(self, orders):
-        # Order got filled or closed and we missed it
-        # so we need to make sure we place an order
-        if len(orders) == 0:
-            self.order = Order()
+        # The list of orders may be older than a request we are waiting on, leave it until we hear back
+        if self.order.in_flight():
+            return
+
+        # Orders we still think are open but the exchange doesn't list got filled or closed and we missed it
+        listed = set([order["id"] for order in orders])
+        for order in list(self.orders.values()):
+            if order.state == OPEN and order.order_id not in listed:
+                self.order_done(order)
+
         # Check consistency of open orders with the information we have stored
-        else:
-            cancelled_orders = 0
-            for order in orders:
-                if not order["id"] == self.order.order_id:
-                    self.exchange.cancel_order(order_id=order["id"])
-                    cancelled_orders += 1
-
-            # This is bad news, it means all outstanding orders
-            # were unknown by our trading algorithm
-            if cancelled_orders == len(orders):
-                self.order = Order()
\ No newline at end of file
+        cancelled_orders = 0
+        for order in orders:
+            if not order["id"] == self.order.order_id:
+                self.exchange.cancel_order(order_id=order["id"])
+                cancelled_orders += 1
+
+        # This is bad news, it means all outstanding orders
+        # were unknown by our trading algorithm
+        if len(orders) > 0 and cancelled_orders == len(orders):
+            self.log_warn("none of the {} open orders were known, cancelled them all", len(orders))
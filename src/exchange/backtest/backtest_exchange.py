@@ -1,38 +1,82 @@
 import os
 import asyncio
-from agents.buyer import Buyer
-from agents.seller import Seller
+from src.agents.buyer import Buyer
+from src.agents.seller import Seller
+from src.exchange.backtest.tick_columns import SIDES, encode_side
+from src.exchange.backtest.tick_store import open_ticks, parse_time
+from src.exchange.backtest.tick_stream import TickStream, tick_extent
+from src.exchange.backtest.backtest_recorder import BacktestRecorder, ORDER_PLACED, ORDER_CANCELLED
+from src.exchange.backtest.sim_event_loop import SimEventLoop
+from src.exchange.backtest.order_book import SimOrderBook, SIZE_EPSILON
+from src.exchange.wallet import Wallet
+from src.records import Tick, Fill
+from src.rolling_stats import RollingStats
 import pandas as pd
+import os.path as pth
 import random
 from threading import Thread
 import time
-from functools import partial
 
 class BacktestExchange:
-    def __init__(self, logger, config):
+    # ticks and wallet_sheet can be handed in already loaded (e.g. by the parameter sweep),
+    # otherwise they are read from the config / PATH_TO_TICKS and PATH_TO_WALLET_CSV.
+    # ticks is a dict of product id to tick source, or a single source for the first product.
+    # A tick source is a TickColumns, a TickStore or any iterable of TickColumns chunks.
+    # quiet turns off the per step prints and log lines, the equity curve and trade ledger are
+    # recorded either way (sampled every sample_interval ms) and written out when the run ends.
+    # Both default to the optional BACKTEST_QUIET and BACKTEST_SAMPLE_MS system variables
+    def __init__(self, logger, config, ticks=None, wallet_sheet=None, quiet=None, sample_interval=None):
         self.opened = False
         self.closed = False
 
         self.logger = logger
         self.logger.exchange = self
 
-        self.tick_sheet = pd.read_csv(self.get_system_variable("PATH_TO_TICKS_CSV"))
-        self.wallet_sheet = pd.read_csv(self.get_system_variable("PATH_TO_WALLET_CSV"))
-
         # Get list of currencies we are trading
         self.product_ids = []
         self.configs = {}
         for row in config.to_dict(orient="records"):
-            self.product_ids.append(row["Product"])
-            self.configs[row["Product"]] = row
+            self.product_ids.append(row["PRODUCT"])
+            self.configs[row["PRODUCT"]] = row
         self.currency_ids = self.products_to_currencies(self.product_ids)
 
+        # Each product can have its own tick source in the TICKS column of the config (a ticks csv or a tick store),
+        # without any the ticks at PATH_TO_TICKS are for the first product
+        if ticks is None:
+            start = parse_time(os.environ.get("BACKTEST_START"))
+            end = parse_time(os.environ.get("BACKTEST_END"))
+
+            ticks = {}
+            for prod_id in self.product_ids:
+                path = self.configs[prod_id].get("TICKS")
+                if isinstance(path, str) and not path == "":
+                    ticks[prod_id] = open_ticks(path, start, end)
+            if len(ticks) == 0:
+                ticks[self.product_ids[0]] = open_ticks(self.get_ticks_path(), start, end)
+        elif not isinstance(ticks, dict):
+            ticks = {self.product_ids[0]: ticks}
+
+        # Ticks from every product are merged by timestamp and read a chunk at a time
+        tick_count, time_span = tick_extent(ticks)
+        self.tick_stream = TickStream(ticks)
+        if self.tick_stream.next_time() is None:
+            raise Exception("no ticks to backtest")
+
+        if wallet_sheet is None:
+            wallet_sheet = pd.read_csv(self.get_system_variable("PATH_TO_WALLET_CSV"))
+        self.wallet_sheet = wallet_sheet
+
+        # Rolling tick statistics for every product, computed the same way as the live TickerClient
+        self.tick_stats = {}
+        for prod_id in self.product_ids:
+            self.tick_stats[prod_id] = RollingStats.from_config(self.configs[prod_id])
+
         # Setup agents for trading
         self.agents = []
         self.prodid_to_agents = {}
         for prod_id in self.product_ids:
             # Only add trading agents for products we actually want to trade, we can also just gather data
-            if self.configs[prod_id]["Trade"]:
+            if self.configs[prod_id]["TRADE"]:
                 b = Buyer(self.configs[prod_id])
                 s = Seller(self.configs[prod_id])
                 b.exchange = self
@@ -45,37 +89,69 @@ class BacktestExchange:
                 s.quote_increment = 5
                 s.base_increment = 2
                 s.base_min_size = 0.0001
+                b.tick_stats = self.tick_stats[prod_id]
+                s.tick_stats = self.tick_stats[prod_id]
                 self.agents.append(b)
                 self.agents.append(s)
                 self.prodid_to_agents[prod_id] = [b, s]
 
-        # Setup wallet with data from our wallet csv
-        self.available = {}
-        self.hold = {}
-        self.balance = {}
+        # Setup wallet with data from our wallet csv, the same wallet the live exchange keeps
+        self.wallet = Wallet()
         for row in self.wallet_sheet.to_dict(orient="records"):
-            self.available[row["Currency"]] = row["Available"]
-            self.hold[row["Currency"]] = row["OnHold"]
-            self.balance[row["Currency"]] = row["Available"] + row["OnHold"]
+            self.wallet.set(row["Currency"], row["Available"], row["OnHold"])
+        self.available = self.wallet.available
+        self.hold = self.wallet.hold
+        self.balance = self.wallet.balance
 
         # Set fee rates
         self.maker_fee_rate = 0.001
         self.taker_fee_rate = 0.002
 
-        # Data structure to hold future events we want to do
-        # Each element is a tuple of (simulation_time, callback)
-        self.sim_event_loop_tasks = []
-
         # Data structure holding our open orders
         # Key is order id, value is dict of info
         self.open_orders = {}
 
-        # Setup simulation time and row pointer
-        self.i = 0
-        self.t = self.tick_sheet["time"][0]
-
-        # Simulation thread that will call do_time_step() until we run out of data in ticks.csv
-        self.thread = Thread(target=self.simulate)
+        # Open orders again, indexed by product and price for matching against ticks
+        self.books = {}
+        for prod_id in self.product_ids:
+            self.books[prod_id] = SimOrderBook()
+
+        # Setup simulation time and the last prices we have seen for each product,
+        # prices start at each product's first tick so the portfolio can be valued from the start
+        self.t = self.tick_stream.next_time()
+        self.last_price = {}
+        self.last_bid = {}
+        self.last_ask = {}
+        for prod_id, cursor in self.tick_stream.cursors.items():
+            if cursor.has_ticks():
+                self.last_price[prod_id] = float(cursor.ticks.avg_price[cursor.i])
+                self.last_bid[prod_id] = float(cursor.ticks.bid[cursor.i])
+                self.last_ask[prod_id] = float(cursor.ticks.ask[cursor.i])
+
+        # Scheduler for future events we want to do, runs in simulation time
+        self.sim_loop = SimEventLoop(self.t)
+
+        # Simulated delay (ms) before agents see a tick or fill
+        self.latency = 1
+
+        # Next run of the order watchdog, it reschedules itself for as long as the simulation runs
+        self.watchdog_handle = None
+
+        # Counters for summarizing a run
+        self.order_count = 0
+        self.cancel_count = 0
+        self.fill_count = 0
+
+        # Equity curve and trade ledger
+        if quiet is None:
+            quiet = os.environ.get("BACKTEST_QUIET", "").lower() in ("1", "true", "yes")
+        if sample_interval is None:
+            sample_interval = int(os.environ.get("BACKTEST_SAMPLE_MS", 1000))
+        self.quiet = quiet
+        self.recorder = BacktestRecorder(self.currency_ids, self.product_ids, sample_interval=sample_interval, tick_count=tick_count, time_span=time_span)
+
+        # Simulation thread that will call run() until we run out of ticks
+        self.thread = Thread(target=self.run)
         self.thread.name = "BacktestExchange"
 
     # Delay loop based initialization until we are in asyncio context
@@ -84,10 +160,13 @@ class BacktestExchange:
     def open(self):
         if not self.opened:
             self.loop = asyncio.get_running_loop()
-            self.order_watchdog()
             self.thread.start()
             self.opened = True
 
+    # Still running, the backtest is over once the simulation thread runs out of ticks
+    def alive(self):
+        return self.thread.is_alive()
+
     # Safety net in case we forget to call close
     def __del__(self):
         self.close()
@@ -95,17 +174,19 @@ class BacktestExchange:
     # Tear down object, not much to do here
     def close(self):
         if not self.closed:
-            self.thread.join()
+            # The simulation thread only exists once open() was called
+            if self.opened:
+                self.thread.join()
             self.closed = True
 
-    def log_error(self, msg):
-        self.logger.log_error("BacktestExchange", msg)
+    def log_error(self, msg, *args):
+        self.logger.log_error("BacktestExchange", msg, *args)
     
-    def log_warn(self, msg):
-        self.logger.log_warn("BacktestExchange", msg)
+    def log_warn(self, msg, *args):
+        self.logger.log_warn("BacktestExchange", msg, *args)
 
-    def log_info(self, msg):
-        self.logger.log_info("BacktestExchange", msg)
+    def log_info(self, msg, *args):
+        self.logger.log_info("BacktestExchange", msg, *args)
 
     def products_to_currencies(self, products):
         ret = set()
@@ -117,48 +198,57 @@ class BacktestExchange:
 
         return ret
 
+    # PATH_TO_TICKS can point at a ticks csv or a tick store folder, PATH_TO_TICKS_CSV is still accepted
+    def get_ticks_path(self):
+        if "PATH_TO_TICKS" not in os.environ and "PATH_TO_TICKS_CSV" in os.environ:
+            return os.environ["PATH_TO_TICKS_CSV"]
+        return self.get_system_variable("PATH_TO_TICKS")
+
     def get_system_variable(self, name):
         try:
             return os.environ[name]
         except KeyError:
-            self.log_warn('"{}" does not exist!'.format(name))
+            self.log_warn('"{}" does not exist!', name)
             val = input("{}:".format(name))
             return val
 
-    def calculate_fill(self, side, size, price, product_id):
-        target, base = product_id.split("-")
+    # Fill of one of our resting orders, or a trade without one when order_id is None (market orders)
+    def calculate_fill(self, side, size, price, product_id, order_id=None):
+        if not side in ("buy", "sell"):
+            raise Exception("side argument must be either buy or sell")
 
-        if side == "buy":
-            # subtract from base, add to target
-            self.available[base] -= price*size
-            self.available[target] += size
-        
-        elif side == "sell":
-            # subtract from target, add to base
-            self.available[target] -= size
-            self.available[base] += price*size
+        # fee comes out of base
+        fee = price*size*self.taker_fee_rate
+        if order_id is None:
+            self.wallet.trade(product_id, side, price, size, fee)
         else:
-            raise Exception("side argument must be either buy or sell")   
+            self.wallet.fill(order_id, price, size, fee)
+        self.recorder.record_fill(self.t, product_id, side, price, size, fee)
 
-        # take fee out of base
-        self.available[base] -= price*size*self.taker_fee_rate    
+    # The simulated exchange has no rate limit, so an agent's desired quote is acted on straight away
+    def update_quote(self, agent):
+        agent.reconcile_quote()
 
-        # recalculate total balances
-        self.balance[target] = self.available[target] + self.hold[target]
-        self.balance[base] = self.available[base] + self.hold[base]     
-
-    def cancel_order(self, order_id):
+    def cancel_order(self, order_id, on_order_cancelled=None):
         # delete key if it exists from open orders
-        self.open_orders.pop(order_id, None)
+        order = self.open_orders.pop(order_id, None)
+        if order is not None:
+            self.books[order["product_id"]].remove(order)
+            self.wallet.cancel(order_id)
+            self.cancel_count += 1
+            self.recorder.record_order(self.t, order["product_id"], order["side"], ORDER_CANCELLED, order["price"], order["size"])
+            resp = [order_id]
+        else:
+            resp = {"message": "order not found"}
+
+        if on_order_cancelled is not None:
+            on_order_cancelled(resp)
         
     def place_market_order(self, on_order_placed, size, side, product_id, **kwargs):
-        last_bid = self.tick_sheet["bid"][self.i]
-        last_ask = self.tick_sheet["ask"][self.i]
-
         if side == "buy":
-            price = last_ask
+            price = self.last_ask[product_id]
         elif side == "sell":
-            price = last_bid
+            price = self.last_bid[product_id]
         else:
             raise Exception("side argument must be either buy or sell")
 
@@ -173,16 +263,20 @@ class BacktestExchange:
         order = {}
         order["size"] = size
         order["side"] = side
+        order["side_code"] = encode_side(side)
         order["price"] = price
         order["product_id"] = product_id
 
-        new_id = random.randint(0, 1000000)
+        new_id = str(random.randint(0, 1000000))
         while new_id in self.open_orders:
-            new_id = random.randint(0, 1000000)
+            new_id = str(random.randint(0, 1000000))
 
-        new_id = str(new_id)
         order["id"] = new_id
         self.open_orders[new_id] = order
+        self.wallet.place(new_id, product_id, side, price, size)
+        self.books.setdefault(product_id, SimOrderBook()).add(order)
+        self.order_count += 1
+        self.recorder.record_order(self.t, product_id, side, ORDER_PLACED, price, size)
 
         resp = {}
         resp["id"] = new_id
@@ -191,9 +285,9 @@ class BacktestExchange:
         resp["filled_size"] = 0.0
         on_order_placed(resp)
 
-    def replace_limit_order(self, prev_order, on_order_placed, size, side, price, product_id, **kwargs):
+    def replace_limit_order(self, prev_order, on_order_placed, size, side, price, product_id, on_order_cancelled=None, **kwargs):
         self.place_limit_order(size=size, side=side, price=price, product_id=product_id, on_order_placed=on_order_placed)
-        self.cancel_order(prev_order.order_id)
+        self.cancel_order(prev_order.order_id, on_order_cancelled)
         
     # Periodically list our open order to see if we have 0 or >1 orders open and act accordingly
     def order_watchdog(self):
@@ -208,85 +302,139 @@ class BacktestExchange:
 
         # Reschedule callback to trigger after 15 seconds of simulation time have passed
         FIFTEEN_S_IN_MS = 15 * 1000
-        self.sim_event_loop_tasks.append((self.t + FIFTEEN_S_IN_MS, self.order_watchdog))
-
-    # Can increse delta_t for faster simulations, decrese delta_t for more accurate simulations
-    def do_time_step(self, delta_t=1):
-        print(self.t, self.i)
-        # print(len(self.agents))
-
-        # Check sim event loop for tasks we need to do
-        del_list = []
-        for i,task in enumerate(self.sim_event_loop_tasks):
-            if task[0] <= self.t:
-                task[1]()
-                del_list.append(i)
-        
-        new_list = []
-        for i,task in enumerate(self.sim_event_loop_tasks):
-            if i not in del_list:
-                new_list.append(task)
-
-        self.sim_event_loop_tasks = new_list
-
-        # Process the ticks that have come in
-        while self.t == int(self.tick_sheet["time"][self.i]/delta_t):
-            # Check if any open orders filled 
-            for order_id,order in self.open_orders.items():
-                # The taker has to be on the other side of our order
-                if not (order["side"] == self.tick_sheet["taker_side"][self.i]):
-                    # Iff we have a order with worse price than the tick, our order gets executed
-                    if (order["side"] == "buy" and self.tick_sheet["price"][self.i] < order["price"]) or (order["side"] == "sell" and self.tick_sheet["price"][self.i] > order["price"]):
-                        fill_size = max(order["size"], self.tick_sheet["size"][self.i])
-                        print("fill size {}".format(fill_size))
-                        # self.tick_sheet["size"] = self.tick_sheet["size"][self.i] - fill_size
-                        self.calculate_fill(side=order["side"], size=fill_size, price=order["price"], product_id=order["product_id"])
-
-                        # Reduce size of order by fill size
-                        self.open_orders[order_id]["size"] -= fill_size
-
-                        # Transmit fill to agents (function call should go into the sim event loop tasks list, with a small delay)
-                        fill_msg = {}
-                        fill_msg["size"] = fill_size
-                        fill_msg["price"] = order["price"]
-                        fill_msg["side"] = order["side"]
-                        fill_msg["maker_fee_rate"] = self.maker_fee_rate
-                        agents_for_this_product = [ a for a in self.agents if a.product_id == order["product_id"] ]
-                        for agent in agents_for_this_product:
-                            if (agent.is_buyer() and order["side"] == "buy") or (not agent.is_buyer() and order["side"] == "sell"):
-                                self.sim_event_loop_tasks.append((self.t + delta_t, partial(agent.on_fill, fill_msg)))
-
-            # Check to see if any of the open orders were fully filled
-            new_oos = {}
-            for k,v in self.open_orders.items():
-                if v["size"] > 0 and abs(v["size"]) > 10**-8:
-                    new_oos[k] = v
-            self.open_orders = new_oos
-
-            # Transmit tick to agents (function call should go into the sim event loop tasks list, with a small delay)
-            tick_msg = {}
-            tick_msg["price"] = self.tick_sheet["price"][self.i]
-            tick_msg["taker_side"] = self.tick_sheet["taker_side"][self.i]
-            tick_msg["size"] = self.tick_sheet["size"][self.i]
-            tick_msg["best_bid"] = self.tick_sheet["bid"][self.i]
-            tick_msg["best_ask"] = self.tick_sheet["ask"][self.i]
-
-            # agents_for_this_product = [ a for a in self.agents if a.product_id == order["product_id"] ]
-            for agent in self.agents:
-                self.sim_event_loop_tasks.append((self.t + delta_t, partial(agent.on_tick, tick_msg, self.tick_sheet["avg_price"][self.i])))
+        self.watchdog_handle = self.sim_loop.call_later(FIFTEEN_S_IN_MS, self.order_watchdog)
 
-            # Look at the next entry in the tick sheet
-            self.i += 1
+    # Process everything that happens at simulation time self.t
+    def do_time_step(self):
+        if not self.quiet:
+            print(self.t)
 
-        # Increment time by delta_t
-        self.t += delta_t
+        # Run the tasks in the sim event loop that are due
+        self.sim_loop.run_until(self.t)
+
+        # Ticks from every product that are due by now, merged by timestamp
+        cursor = self.tick_stream.pop_due(self.t)
+        while cursor is not None:
+            self.process_ticks(cursor)
+            self.tick_stream.push(cursor)
+            cursor = self.tick_stream.pop_due(self.t)
 
         # Print the current value of the portfolio
-        print("usd bal {} btc bal {}".format(self.balance["USD"], self.balance["BTC"]))
-        self.log_info("portfolio value : {}".format(self.balance["USD"]+self.balance["BTC"]*self.tick_sheet["avg_price"][self.i]))
+        if not self.quiet:
+            print(" ".join(["{} bal {}".format(c, self.balance[c]) for c in sorted(self.currency_ids)]))
+            self.log_info("portfolio value : {}", self.portfolio_value())
+
+        # Sample the equity curve
+        if self.recorder.sample_due(self.t):
+            self.recorder.sample(self.t, self.portfolio_value(), self.balance)
+
+    # Process one product's ticks that are due by now, up to the end of the cursor's current chunk
+    def process_ticks(self, cursor):
+        # Pull everything into locals once, the loop below only does numpy scalar lookups
+        product_id = cursor.product_id
+        ticks = cursor.ticks
+        n_ticks = len(ticks)
+        tick_time = ticks.time
+        tick_price = ticks.price
+        tick_size = ticks.size
+        tick_taker_side = ticks.taker_side
+        book = self.books[product_id]
+        stats = self.tick_stats[product_id]
+        agents = self.prodid_to_agents.get(product_id, [])
+
+        while cursor.i < n_ticks and tick_time[cursor.i] <= self.t:
+            # Agents expect python floats like the live feed gives them, numpy scalars don't raise ZeroDivisionError
+            i = cursor.i
+            price = float(tick_price[i])
+            size = float(tick_size[i])
+            taker_side = tick_taker_side[i]
+
+            # Only the resting orders this trade crosses are touched, the trade size is shared between them
+            for order,fill_size in book.match(taker_side, price, size):
+                if not self.quiet:
+                    print("fill size {}".format(fill_size))
+                self.fill_count += 1
+                self.calculate_fill(side=order["side"], size=fill_size, price=order["price"], product_id=product_id, order_id=order["id"])
+
+                # The book already removed fully filled orders from its price levels
+                if order["size"] <= SIZE_EPSILON:
+                    del self.open_orders[order["id"]]
+                    self.wallet.cancel(order["id"])
+
+                # Transmit fill to agents (function call goes into the sim event loop with a small delay)
+                fill = Fill(product_id, order["id"], order["side"], order["price"], fill_size, self.maker_fee_rate)
+                for agent in agents:
+                    if (agent.is_buyer() and order["side"] == "buy") or (not agent.is_buyer() and order["side"] == "sell"):
+                        self.sim_loop.call_at(self.t + self.latency, agent.on_fill, fill)
+
+            # Transmit tick to this product's agents (function call goes into the sim event loop with a small delay)
+            tick = Tick(product_id, price, size, SIDES[taker_side], float(ticks.bid[i]), float(ticks.ask[i]))
+
+            last_price = float(ticks.avg_price[i])
+            self.last_price[product_id] = last_price
+            self.last_bid[product_id] = tick.best_bid
+            self.last_ask[product_id] = tick.best_ask
+
+            # Same rolling mean of tick to tick price changes that the TickerClient calculates
+            stats.update(price)
+            if stats.ready():
+                tick_price_changes = stats.mean_change()
+                for agent in agents:
+                    self.sim_loop.call_at(self.t + self.latency, agent.on_tick, tick, last_price, tick_price_changes)
+
+            # Look at the next entry in the tick sheet
+            cursor.i += 1
 
+    # Value of a currency in the quote currency it is ultimately priced in, following
+    # products like ETH-BTC then BTC-USD. Currencies we have no price for are worth face value
+    def currency_price(self, currency, seen=()):
+        for prod_id in self.product_ids:
+            target, base = prod_id.split("-")
+            if target == currency and prod_id in self.last_price and base not in seen:
+                return self.last_price[prod_id] * self.currency_price(base, seen + (currency,))
+        return 1.0
+
+    # Value of the wallet with every product marked at its latest price
+    def portfolio_value(self):
+        value = 0.0
+        for c in self.currency_ids:
+            value += self.balance.get(c, 0.0) * self.currency_price(c)
+        return value
+
+    # Run the whole backtest synchronously, open() calls this from the simulation thread
+    def run(self):
+        self.order_watchdog()
+        self.simulate()
+        self.finish()
+
+    # Record the final state, write out the equity curve and trade ledger and log the summary
+    def finish(self):
+        self.recorder.sample(self.t, self.portfolio_value(), self.balance)
+
+        log_folder = getattr(self.logger, "log_folder", None)
+        if log_folder is not None:
+            self.recorder.save(pth.join(log_folder, "backtest.npz"))
+
+        self.log_info("summary : {}", self.recorder.summary())
+
+    # Time of the next thing that can change state, either a tick or a scheduled event
+    def next_event_time(self):
+        t = self.tick_stream.next_time()
+        next_task = self.sim_loop.next_time()
+        if next_task is not None and next_task < t:
+            t = next_task
+        return t
+
+    # Jump the clock from event to event instead of stepping through empty time
     def simulate(self):
-        k = 0
-        while self.i < self.tick_sheet.shape[0] and k < 10000:
+        while self.tick_stream.next_time() is not None:
+            self.t = self.next_event_time()
+            self.do_time_step()
+
+        # Fills and ticks of the last ticks reach the agents after them, run whatever is still scheduled.
+        # The watchdog would keep rescheduling itself, it stops with the ticks
+        if self.watchdog_handle is not None:
+            self.watchdog_handle.cancel()
+        while self.sim_loop.next_time() is not None:
+            self.t = self.sim_loop.next_time()
             self.do_time_step()
-            k += 1        
\ No newline at end of file
@@ -0,0 +1,88 @@
+from src.exchange.backtest.tick_columns import encode_side
+import numpy as np
+
+ORDER_PLACED = 0
+ORDER_CANCELLED = 1
+
+# Append-only numpy record array that doubles its capacity when it fills up
+class RecordBuffer:
+    def __init__(self, dtype, capacity=1024):
+        self.data = np.zeros(max(capacity, 1), dtype=dtype)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def append(self, row):
+        if self.n == self.data.shape[0]:
+            self.data = np.concatenate((self.data, np.zeros_like(self.data)))
+        self.data[self.n] = row
+        self.n += 1
+
+    def values(self):
+        return self.data[:self.n]
+
+# Most samples the equity curve can take over tick_count ticks spanning time_span ms: at most one per tick
+# and one per sample_interval, plus the last one taken when the run ends. None if the ticks aren't known up front
+def equity_capacity(tick_count, time_span, sample_interval):
+    if tick_count is None or time_span is None:
+        return None
+    return min(tick_count, time_span // max(sample_interval, 1) + 1) + 1
+
+# Records what happened during a backtest into preallocated numpy buffers instead of log lines:
+#   equity  portfolio value and balances, sampled every sample_interval ms of simulation time
+#   fills   every fill with its fee
+#   orders  every order placed or cancelled
+# Everything is written once at the end to a compressed .npz file. Given the tick count and time span of
+# the run the equity buffer is sized for every sample up front, fills and orders depend on what the agents
+# do and still grow as needed
+class BacktestRecorder:
+    def __init__(self, currencies, product_ids, sample_interval=1000, capacity=1024, tick_count=None, time_span=None):
+        self.currencies = sorted(currencies)
+        self.product_ids = list(product_ids)
+        self.product_index = {p: k for k, p in enumerate(self.product_ids)}
+        self.sample_interval = sample_interval
+        self.next_sample = None
+
+        equity_size = equity_capacity(tick_count, time_span, sample_interval)
+        self.equity = RecordBuffer([("time", np.int64), ("equity", np.float64), ("balances", np.float64, (len(self.currencies),))],
+                                   capacity if equity_size is None else equity_size)
+        self.fills = RecordBuffer([("time", np.int64), ("product", np.int16), ("side", np.int8), ("price", np.float64), ("size", np.float64), ("fee", np.float64)], capacity)
+        self.orders = RecordBuffer([("time", np.int64), ("product", np.int16), ("side", np.int8), ("action", np.int8), ("price", np.float64), ("size", np.float64)], capacity)
+
+    # True if the equity curve is due a sample at time t
+    def sample_due(self, t):
+        return self.next_sample is None or t >= self.next_sample
+
+    def sample(self, t, equity, balance):
+        self.equity.append((t, equity, [balance.get(c, 0.0) for c in self.currencies]))
+        self.next_sample = t + self.sample_interval
+
+    def record_fill(self, t, product_id, side, price, size, fee):
+        self.fills.append((t, self.product_index.get(product_id, -1), encode_side(side), price, size, fee))
+
+    def record_order(self, t, product_id, side, action, price, size):
+        self.orders.append((t, self.product_index.get(product_id, -1), encode_side(side), action, price, size))
+
+    def save(self, path):
+        np.savez_compressed(path, equity=self.equity.values(), fills=self.fills.values(), orders=self.orders.values(),
+                            currencies=np.array(self.currencies), product_ids=np.array(self.product_ids))
+
+    # Summary statistics of the run, all computed on the buffers without python loops.
+    # Ratios over a zero equity come out as nan or inf instead of raising
+    def summary(self):
+        equity = self.equity.values()["equity"]
+        fills = self.fills.values()
+
+        stats = {}
+        stats["start_equity"] = float(equity[0]) if len(equity) else float("nan")
+        stats["end_equity"] = float(equity[-1]) if len(equity) else float("nan")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            stats["return"] = float(np.float64(stats["end_equity"]) / stats["start_equity"] - 1)
+            stats["max_drawdown"] = float(np.max(1 - equity / np.maximum.accumulate(equity))) if len(equity) else 0.0
+            notional = fills["price"] * fills["size"]
+            stats["turnover"] = float(notional.sum() / equity.mean()) if len(equity) else 0.0
+        stats["fee_total"] = float(fills["fee"].sum())
+        stats["fill_count"] = len(fills)
+        stats["order_count"] = int(np.count_nonzero(self.orders.values()["action"] == ORDER_PLACED))
+        return stats
@@ -0,0 +1,69 @@
+from sortedcontainers import SortedDict
+from src.exchange.backtest.tick_columns import SIDE_BUY, SIDE_SELL
+
+# Sizes smaller than this are treated as zero, same tolerance as Order.filled()
+SIZE_EPSILON = 10**-8
+
+# Resting orders for one product, kept per side in price sorted levels so a
+# trade only has to look at the orders it actually crosses.
+# Each level is a dict of order_id -> order, insertion order gives time priority.
+class SimOrderBook:
+    def __init__(self):
+        self.bids = SortedDict()
+        self.asks = SortedDict()
+
+    def add(self, order):
+        book = self.bids if order["side_code"] == SIDE_BUY else self.asks
+
+        level = book.get(order["price"])
+        if level is None:
+            level = {}
+            book[order["price"]] = level
+        level[order["id"]] = order
+
+    def remove(self, order):
+        book = self.bids if order["side_code"] == SIDE_BUY else self.asks
+
+        level = book.get(order["price"])
+        if level is None or level.pop(order["id"], None) is None:
+            return False
+
+        if not level:
+            del book[order["price"]]
+        return True
+
+    # Fill the resting orders that a trade of size at price crosses, best price first.
+    # A buy order fills if a seller traded below its price, a sell order fills if a buyer
+    # traded above its price. Returns a list of (order, fill_size), fully filled orders are removed.
+    def match(self, taker_side, price, size):
+        fills = []
+
+        if taker_side == SIDE_SELL:
+            book = self.bids
+            best = -1
+        else:
+            book = self.asks
+            best = 0
+
+        while size > SIZE_EPSILON and book:
+            level_price, level = book.peekitem(best)
+            if (taker_side == SIDE_SELL and not level_price > price) or (taker_side == SIDE_BUY and not level_price < price):
+                break
+
+            for order_id in list(level):
+                order = level[order_id]
+                fill_size = min(order["size"], size)
+                order["size"] -= fill_size
+                size -= fill_size
+                fills.append((order, fill_size))
+
+                if order["size"] <= SIZE_EPSILON:
+                    del level[order_id]
+
+                if size <= SIZE_EPSILON:
+                    break
+
+            if not level:
+                del book[level_price]
+
+        return fills
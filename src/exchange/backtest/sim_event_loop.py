@@ -0,0 +1,66 @@
+import heapq
+import itertools
+
+# Handle returned by call_at/call_later, same idea as asyncio.TimerHandle
+class SimTimerHandle:
+    __slots__ = ("when", "callback", "args", "_cancelled")
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+        self.callback = None
+        self.args = None
+
+    def cancelled(self):
+        return self._cancelled
+
+# Scheduler for the backtest, events are kept in a heap ordered by (sim_time, sequence)
+# so events due at the same time always run in the order they were scheduled.
+# Time is in the same units as the tick sheet (milliseconds).
+class SimEventLoop:
+    def __init__(self, t=0):
+        self.t = t
+        self.queue = []
+        self.seq = itertools.count()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def time(self):
+        return self.t
+
+    def call_at(self, when, callback, *args):
+        handle = SimTimerHandle(when, callback, args)
+        heapq.heappush(self.queue, (when, next(self.seq), handle))
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.t + delay, callback, *args)
+
+    def call_soon(self, callback, *args):
+        return self.call_at(self.t, callback, *args)
+
+    # Time of the earliest pending event, None if nothing is scheduled
+    def next_time(self):
+        queue = self.queue
+        while queue and queue[0][2].cancelled():
+            heapq.heappop(queue)
+
+        if queue:
+            return queue[0][0]
+        return None
+
+    # Advance the clock to t and run every event that is due by then,
+    # events scheduled by a callback for a time <= t run in the same pass
+    def run_until(self, t):
+        self.t = t
+        queue = self.queue
+        while queue and queue[0][0] <= t:
+            handle = heapq.heappop(queue)[2]
+            if not handle.cancelled():
+                handle.callback(*handle.args)
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+# taker_side is stored as an int8 code so the matching loop compares small ints instead of strings
+SIDE_BUY = 0
+SIDE_SELL = 1
+SIDES = ("buy", "sell")
+
+def encode_side(side):
+    if side == "buy":
+        return SIDE_BUY
+    elif side == "sell":
+        return SIDE_SELL
+    else:
+        raise Exception("side argument must be either buy or sell")
+
+# Columns of the ticks csv and the dtype each one is held in
+COLUMNS = (("time", np.int64), ("price", np.float64), ("size", np.float64), ("taker_side", np.int8),
+           ("bid", np.float64), ("ask", np.float64), ("avg_price", np.float64))
+
+# Tick sheet held as contiguous typed arrays, one per column of the ticks csv
+class TickColumns:
+    def __init__(self, time, price, size, taker_side, bid, ask, avg_price):
+        self.time = np.ascontiguousarray(time, dtype=np.int64)
+        self.price = np.ascontiguousarray(price, dtype=np.float64)
+        self.size = np.ascontiguousarray(size, dtype=np.float64)
+        self.taker_side = np.ascontiguousarray(taker_side, dtype=np.int8)
+        self.bid = np.ascontiguousarray(bid, dtype=np.float64)
+        self.ask = np.ascontiguousarray(ask, dtype=np.float64)
+        self.avg_price = np.ascontiguousarray(avg_price, dtype=np.float64)
+
+    def __len__(self):
+        return self.time.shape[0]
+
+    # Rows lo:hi as views, nothing is copied
+    def slice(self, lo, hi):
+        cols = {}
+        for name, _ in COLUMNS:
+            cols[name] = getattr(self, name)[lo:hi]
+        return TickColumns(**cols)
+
+    @classmethod
+    def concatenate(cls, chunks):
+        cols = {}
+        for name, _ in COLUMNS:
+            cols[name] = np.concatenate([getattr(c, name) for c in chunks])
+        return cls(**cols)
+
+    @classmethod
+    def from_frame(cls, df):
+        taker_side = df["taker_side"].to_numpy()
+        is_buy = taker_side == "buy"
+        if not (is_buy | (taker_side == "sell")).all():
+            raise Exception("taker_side column must be either buy or sell")
+
+        return cls(time=df["time"].to_numpy(),
+                   price=df["price"].to_numpy(),
+                   size=df["size"].to_numpy(),
+                   taker_side=np.where(is_buy, SIDE_BUY, SIDE_SELL),
+                   bid=df["bid"].to_numpy(),
+                   ask=df["ask"].to_numpy(),
+                   avg_price=df["avg_price"].to_numpy())
+
+    @classmethod
+    def from_csv(cls, path):
+        return cls.from_frame(pd.read_csv(path))
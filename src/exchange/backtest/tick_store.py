@@ -0,0 +1,129 @@
+from src.exchange.backtest.tick_columns import TickColumns, COLUMNS
+
+import argparse
+import os
+import os.path as pth
+import numpy as np
+import pandas as pd
+
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+# Ticks stored column by column, one folder per UTC day:
+#   root/index.csv             day, start_time, end_time, rows for every day folder
+#   root/YYYYMMDD/<column>.npy one array per column of the ticks csv
+# Columns are opened memory mapped, so only the pages a backtest touches are read from disk
+class TickStore:
+    def __init__(self, root):
+        self.root = root
+        self.index = pd.read_csv(pth.join(root, "index.csv"), dtype={"day": str})
+
+    def __len__(self):
+        return int(self.index["rows"].sum())
+
+    def day_columns(self, day):
+        cols = {}
+        for name, _ in COLUMNS:
+            cols[name] = np.load(pth.join(self.root, day, "{}.npy".format(name)), mmap_mode="r")
+        return TickColumns(**cols)
+
+    # Iterate over the ticks with start <= time < end one day at a time,
+    # the index is used to skip days outside the range without opening them
+    def chunks(self, start=None, end=None):
+        for row in self.index.itertuples():
+            if start is not None and row.end_time < start:
+                continue
+            if end is not None and row.start_time >= end:
+                break
+
+            ticks = self.day_columns(row.day)
+            lo = 0 if start is None else np.searchsorted(ticks.time, start, side="left")
+            hi = len(ticks) if end is None else np.searchsorted(ticks.time, end, side="left")
+            if lo < hi:
+                yield ticks.slice(lo, hi)
+
+# Backtest range boundaries are given as dates/timestamps ("20210105", "2021-01-05 12:00") or epoch ms, None means open ended
+def parse_time(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str) and not value.isdigit():
+        return pd.Timestamp(value).value // 10**6
+    if len(str(value)) == 8:
+        return pd.Timestamp(str(value)).value // 10**6
+    return int(value)
+
+def day_name(day_number):
+    return pd.Timestamp(int(day_number) * MS_PER_DAY, unit="ms").strftime("%Y%m%d")
+
+# Convert a ticks csv (time, price, size, taker_side, bid, ask, avg_price) into a TickStore,
+# the csv is read in chunks so it never has to fit in memory, only one day at a time does
+def write_tick_store(csv_path, root, chunksize=1000000):
+    return write_tick_chunks((TickColumns.from_frame(df) for df in pd.read_csv(csv_path, chunksize=chunksize)), root)
+
+# Write TickColumns chunks that are sorted by time across chunks as well into a TickStore
+def write_tick_chunks(chunks, root):
+    os.makedirs(root, exist_ok=True)
+
+    index = []
+    pending = []
+    pending_day = None
+    last_time = None
+
+    def flush():
+        ticks = TickColumns.concatenate(pending)
+        day = day_name(pending_day)
+        os.makedirs(pth.join(root, day), exist_ok=True)
+        for name, _ in COLUMNS:
+            np.save(pth.join(root, day, "{}.npy".format(name)), getattr(ticks, name))
+        index.append((day, int(ticks.time[0]), int(ticks.time[-1]), len(ticks)))
+
+    for ticks in chunks:
+        if len(ticks) == 0:
+            continue
+
+        if (last_time is not None and ticks.time[0] < last_time) or (np.diff(ticks.time) < 0).any():
+            raise Exception("ticks must be sorted by time")
+        last_time = ticks.time[-1]
+
+        # Split the chunk where the day changes
+        days = ticks.time // MS_PER_DAY
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        for lo, hi in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(ticks)]))):
+            if pending_day is not None and days[lo] != pending_day:
+                flush()
+                pending = []
+            pending_day = days[lo]
+            pending.append(ticks.slice(lo, hi))
+
+    if pending:
+        flush()
+
+    pd.DataFrame(index, columns=["day", "start_time", "end_time", "rows"]).to_csv(pth.join(root, "index.csv"), index=False)
+    return TickStore(root)
+
+# Read a ticks csv as TickColumns chunks of chunksize rows limited to start <= time < end
+def read_csv_chunks(path, start=None, end=None, chunksize=1000000):
+    for df in pd.read_csv(path, chunksize=chunksize):
+        ticks = TickColumns.from_frame(df)
+        lo = 0 if start is None else np.searchsorted(ticks.time, start, side="left")
+        hi = len(ticks) if end is None else np.searchsorted(ticks.time, end, side="left")
+        if lo < hi:
+            yield ticks.slice(lo, hi)
+        if hi < len(ticks):
+            break
+
+# Open ticks for a backtest from either a TickStore folder or a ticks csv,
+# returns an iterable of TickColumns chunks limited to start <= time < end
+def open_ticks(path, start=None, end=None):
+    if pth.isdir(path):
+        return TickStore(path).chunks(start, end)
+    return read_csv_chunks(path, start, end)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('csv_path', help='path to ticks csv to convert')
+    parser.add_argument('store_path', help='folder to write the tick store to')
+    parser.add_argument('--chunksize', type=int, default=1000000, help='rows of the csv to read at a time')
+    args = parser.parse_args()
+
+    store = write_tick_store(args.csv_path, args.store_path, chunksize=args.chunksize)
+    print("wrote {} ticks over {} days to {}".format(len(store), len(store.index), args.store_path))
@@ -0,0 +1,83 @@
+from src.exchange.backtest.tick_columns import TickColumns
+from src.exchange.backtest.tick_store import TickStore
+import heapq
+
+# Position in one product's ticks, which arrive as a sequence of TickColumns chunks
+class TickCursor:
+    def __init__(self, k, product_id, chunks):
+        self.k = k
+        self.product_id = product_id
+        self.chunks = iter(chunks)
+        self.ticks = None
+        self.i = 0
+
+    # Move on to the next chunk once the current one is used up, returns False when there are no ticks left
+    def has_ticks(self):
+        while self.ticks is None or self.i >= len(self.ticks):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return False
+            self.ticks = chunk
+            self.i = 0
+        return True
+
+    def time(self):
+        return self.ticks.time[self.i]
+
+# (tick count, ms from the first to the last tick) across per product tick sources, (None, None) if any
+# of them is a stream of chunks that can't be measured without reading it
+def tick_extent(sources):
+    count = 0
+    first = None
+    last = None
+    for source in sources.values():
+        if isinstance(source, TickColumns):
+            if len(source) == 0:
+                continue
+            count += len(source)
+            start, end = int(source.time[0]), int(source.time[-1])
+        elif isinstance(source, TickStore):
+            if len(source.index) == 0:
+                continue
+            count += len(source)
+            start, end = int(source.index["start_time"].min()), int(source.index["end_time"].max())
+        else:
+            return None, None
+        first = start if first is None else min(first, start)
+        last = end if last is None else max(last, end)
+
+    return count, (last - first if first is not None else 0)
+
+# k-way merge of per product tick sources by timestamp.
+# Each source is a TickColumns, a TickStore or an iterable of TickColumns chunks and is read
+# one chunk at a time, so memory stays bounded by a chunk per product.
+# Ticks with the same timestamp come out in the order the sources were given.
+class TickStream:
+    def __init__(self, sources):
+        self.cursors = {}
+        self.heap = []
+        for k, (product_id, source) in enumerate(sources.items()):
+            if isinstance(source, TickColumns):
+                source = [source]
+            elif isinstance(source, TickStore):
+                source = source.chunks()
+
+            cursor = TickCursor(k, product_id, source)
+            self.cursors[product_id] = cursor
+            self.push(cursor)
+
+    def push(self, cursor):
+        if cursor.has_ticks():
+            heapq.heappush(self.heap, (cursor.time(), cursor.k, cursor))
+
+    # Time of the earliest tick across all products, None once every source is used up
+    def next_time(self):
+        if self.heap:
+            return self.heap[0][0]
+        return None
+
+    # Take the cursor with the earliest tick if that tick is due by t, push() it back after reading from it
+    def pop_due(self, t):
+        if self.heap and self.heap[0][0] <= t:
+            return heapq.heappop(self.heap)[2]
+        return None
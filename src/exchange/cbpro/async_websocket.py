@@ -0,0 +1,322 @@
+from cbpro.websocket_client import get_auth_headers
+from urllib.parse import urlsplit
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import ssl
+import struct
+import time
+
+# orjson parses the feed several times faster when it is installed, json is the fallback
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# The websockets library does the protocol when it is installed, WebsocketConnection is the fallback
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+# Frame opcodes we deal with, RFC 6455 section 5.2
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# Key the server hashes with ours to prove it speaks websocket, RFC 6455 section 1.3
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Seconds between keepalive pings
+PING_INTERVAL = 30.0
+
+# Largest message we accept, level2 snapshots of busy products are a few MB
+MAX_MESSAGE_SIZE = 64 * 2**20
+
+class ConnectionClosed(Exception):
+    pass
+
+# Websocket connection over asyncio streams, just enough of RFC 6455 for a feed client:
+# text and binary messages (fragmented or not), ping/pong and the closing handshake.
+# Frames we send are masked as clients must, frames from the server never are
+class WebsocketConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+
+    @classmethod
+    async def connect(cls, url, timeout=10.0):
+        parts = urlsplit(url)
+        secure = parts.scheme == "wss"
+        port = parts.port or (443 if secure else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        ctx = ssl.create_default_context() if secure else None
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(parts.hostname, port, ssl=ctx), timeout)
+
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = ("GET {} HTTP/1.1\r\n"
+                   "Host: {}\r\n"
+                   "Upgrade: websocket\r\n"
+                   "Connection: Upgrade\r\n"
+                   "Sec-WebSocket-Key: {}\r\n"
+                   "Sec-WebSocket-Version: 13\r\n\r\n").format(path, parts.netloc, key)
+        writer.write(request.encode())
+
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        lines = head.decode("latin-1").split("\r\n")
+        if len(lines[0].split(" ")) < 2 or lines[0].split(" ")[1] != "101":
+            writer.close()
+            raise ConnectionClosed("websocket handshake failed: {}".format(lines[0]))
+
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+        if headers.get("sec-websocket-accept") != accept:
+            writer.close()
+            raise ConnectionClosed("websocket handshake failed: bad Sec-WebSocket-Accept")
+
+        return cls(reader, writer)
+
+    async def send_frame(self, opcode, payload):
+        header = bytearray([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header.append(0x80 | length)
+        elif length < 2**16:
+            header.append(0x80 | 126)
+            header += struct.pack("!H", length)
+        else:
+            header.append(0x80 | 127)
+            header += struct.pack("!Q", length)
+
+        mask = os.urandom(4)
+        header += mask
+        self.writer.write(bytes(header) + mask_payload(mask, payload))
+        await self.writer.drain()
+
+    async def send(self, text):
+        await self.send_frame(OP_TEXT, text.encode())
+
+    async def ping(self, payload=b""):
+        await self.send_frame(OP_PING, payload)
+
+    async def read_frame(self):
+        b0, b1 = await self.reader.readexactly(2)
+        fin = b0 & 0x80
+        opcode = b0 & 0x0F
+        length = b1 & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await self.reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await self.reader.readexactly(8))[0]
+
+        if length > MAX_MESSAGE_SIZE:
+            raise ConnectionClosed("frame of {} bytes is too big".format(length))
+
+        mask = await self.reader.readexactly(4) if b1 & 0x80 else None
+        payload = await self.reader.readexactly(length)
+        if mask is not None:
+            payload = mask_payload(mask, payload)
+        return fin, opcode, payload
+
+    # Next text or binary message, control frames in between are answered along the way
+    async def recv(self):
+        fragments = []
+        message_opcode = None
+        size = 0
+        while True:
+            fin, opcode, payload = await self.read_frame()
+
+            if opcode == OP_PING:
+                await self.send_frame(OP_PONG, payload)
+            elif opcode == OP_PONG:
+                continue
+            elif opcode == OP_CLOSE:
+                code = struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else 1005
+                await self.close(code)
+                raise ConnectionClosed("closed by server with code {}".format(code))
+            else:
+                if opcode != OP_CONTINUATION:
+                    message_opcode = opcode
+                fragments.append(payload)
+                size += len(payload)
+                if size > MAX_MESSAGE_SIZE:
+                    raise ConnectionClosed("message of more than {} bytes".format(MAX_MESSAGE_SIZE))
+
+                if fin:
+                    data = b"".join(fragments)
+                    return data.decode() if message_opcode == OP_TEXT else data
+
+    async def close(self, code=1000):
+        if self.closed:
+            return
+        self.closed = True
+
+        try:
+            await self.send_frame(OP_CLOSE, struct.pack("!H", code))
+        except (ConnectionError, RuntimeError):
+            pass
+        self.writer.close()
+
+# The websockets library behind the interface of WebsocketConnection. Its own keepalive is off as the
+# client sends the pings
+class LibraryConnection:
+    def __init__(self, ws):
+        self.ws = ws
+
+    @classmethod
+    async def connect(cls, url, timeout=10.0):
+        return cls(await asyncio.wait_for(websockets.connect(url, max_size=MAX_MESSAGE_SIZE, ping_interval=None), timeout))
+
+    async def send(self, text):
+        await self.ws.send(text)
+
+    async def ping(self, payload=b""):
+        await self.ws.ping(payload)
+
+    async def recv(self):
+        try:
+            return await self.ws.recv()
+        except websockets.exceptions.ConnectionClosed as e:
+            raise ConnectionClosed(str(e))
+
+    async def close(self, code=1000):
+        await self.ws.close(code)
+
+# Open a connection to url. Everything the client needs of one is send, recv, ping and close,
+# so this is the only place that knows which implementation of the protocol is used
+async def open_connection(url):
+    if websockets is not None:
+        return await LibraryConnection.connect(url)
+    return await WebsocketConnection.connect(url)
+
+def mask_payload(mask, payload):
+    # XOR a whole int at a time instead of byte by byte
+    length = len(payload)
+    key = int.from_bytes((mask * (length // 4 + 1))[:length], "big")
+    return (int.from_bytes(payload, "big") ^ key).to_bytes(length, "big")
+
+# Replacement for cbpro.WebsocketClient that runs as a task on the asyncio loop instead of in its own thread.
+# It has the same attributes and callbacks: on_open is called by start, on_message gets every decoded
+# message, on_error is called when the connection fails (which stops the client) and on_close once it is gone.
+# Every callback runs on the loop, so nothing has to cross threads
+class AsyncWebsocketClient:
+    # Coroutine function opening the connection, tests swap in a fake one
+    connect = staticmethod(open_connection)
+
+    def __init__(self, url="wss://ws-feed.pro.coinbase.com", products=None, channels=None, auth=False, api_key="", api_secret="", api_passphrase=""):
+        self.url = url
+        self.products = products
+        self.channels = channels
+        self.stop = True
+        self.error = None
+        self.ws = None
+        self.task = None
+
+        # time.monotonic() time the message being handled came in
+        self.received = None
+        self.auth = auth
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.api_passphrase = api_passphrase
+
+    def start(self):
+        self.stop = False
+        self.on_open()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def close(self):
+        self.stop = True
+        if self.task is not None:
+            self.task.cancel()
+
+    # Still connected, or about to be
+    def alive(self):
+        return self.task is not None and not self.task.done()
+
+    def subscribe_message(self):
+        if self.products is None:
+            self.products = ["BTC-USD"]
+        elif not isinstance(self.products, list):
+            self.products = [self.products]
+
+        sub_params = {"type": "subscribe", "product_ids": self.products}
+        if self.channels is not None:
+            sub_params["channels"] = self.channels
+
+        if self.auth:
+            timestamp = str(time.time())
+            message = timestamp + "GET" + "/users/self/verify"
+            auth_headers = get_auth_headers(timestamp, message, self.api_key, self.api_secret, self.api_passphrase)
+            sub_params["signature"] = auth_headers["CB-ACCESS-SIGN"]
+            sub_params["key"] = auth_headers["CB-ACCESS-KEY"]
+            sub_params["passphrase"] = auth_headers["CB-ACCESS-PASSPHRASE"]
+            sub_params["timestamp"] = auth_headers["CB-ACCESS-TIMESTAMP"]
+
+        return sub_params
+
+    async def run(self):
+        keepalive = None
+        try:
+            self.ws = await self.connect(self.url)
+            await self.ws.send(json.dumps(self.subscribe_message()))
+            keepalive = asyncio.get_running_loop().create_task(self.keepalive())
+
+            while not self.stop:
+                data = await self.ws.recv()
+                self.received = time.monotonic()
+                try:
+                    msg = self.decode(data)
+                except ValueError as e:
+                    self.on_error(e, data)
+                else:
+                    self.on_message(msg)
+        except asyncio.CancelledError:
+            # Cleaned up below, whoever cancelled the task still has to see it was cancelled
+            raise
+        except Exception as e:
+            self.on_error(e)
+        finally:
+            if keepalive is not None:
+                keepalive.cancel()
+            if self.ws is not None:
+                try:
+                    await asyncio.wait_for(self.ws.close(), 1.0)
+                except (asyncio.TimeoutError, ConnectionError):
+                    pass
+            self.on_close()
+
+    def decode(self, data):
+        return json_loads(data)
+
+    async def keepalive(self):
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            await self.ws.ping(b"keepalive")
+
+    def on_open(self):
+        return
+
+    def on_message(self, msg):
+        return
+
+    def on_error(self, e, data=None):
+        self.error = e
+        self.stop = True
+
+    def on_close(self):
+        return
@@ -1,14 +1,33 @@
 import os
-import cbpro
 import asyncio
 import sys
+import time
 import traceback
 from datetime import datetime
 from pathlib import Path
 from src.agents.buyer import Buyer
 from src.agents.seller import Seller
-from src.exchange.leaky_bucket import LeakyBucket
+from src.exchange.rate_limiter import RateLimiter, PRIORITY_QUOTE
+from src.exchange.cbpro.cbpro_rest import AsyncRestClient
 from src.exchange.cbpro.cbpro_websocket import TickerClient
+from src.exchange.cbpro.l2_book import L2Book
+from src.exchange.cbpro.order_index import OrderIndex
+from src.exchange.cbpro.tick_recorder import TickRecorder
+from src.exchange.wallet import Wallet
+from src.latency import LatencyTracker
+from src.log_writer import LOG_INFO
+from src.records import Fill
+from src.rolling_stats import RollingStats
+
+# Bounds of the interval between REST reconciliations of the order index, in seconds
+RECONCILE_MIN_INTERVAL = 15.0
+RECONCILE_MAX_INTERVAL = 240.0
+
+# Seconds between REST account snapshots, the wallet is kept up to date by the user channel in between
+ACCOUNTS_INTERVAL = 60.0
+
+# Seconds between latency and dispatch queue reports
+METRICS_INTERVAL = 60.0
 
 class CBProExchange:
     def __init__(self, logger, config):
@@ -31,12 +50,45 @@ class CBProExchange:
             self.configs[row["PRODUCT"]] = row
         self.currency_ids = self.products_to_currencies(self.product_ids)
 
-        self.available = {}
-        self.hold = {}
-        self.balance = {}
+        # Balances are only changed by the wallet, from the main thread
+        self.wallet = Wallet()
+        self.available = self.wallet.available
+        self.hold = self.wallet.hold
+        self.balance = self.wallet.balance
+
+        # Rolling tick statistics for every product we watch, shared with that product's agents
+        self.tick_stats = {}
+        for prod_id in self.product_ids:
+            self.tick_stats[prod_id] = RollingStats.from_config(self.configs[prod_id])
+
+        # Level 2 order books of the products that set L2_LEVELS in their config
+        self.books = {}
+        for prod_id in self.product_ids:
+            book = L2Book.from_config(self.configs[prod_id])
+            if book is not None:
+                self.books[prod_id] = book
+
+        # Where the time goes between a tick arriving and our order reaching the exchange
+        self.latency = LatencyTracker()
 
-        self.rest_client = cbpro.AuthenticatedClient(self.api_key, self.api_secret, self.api_passphrase, api_url=self.rest_url)
-        self.rest_client.cancel_all()
+        # Capture of the feed to backtest on later, only when TICK_CAPTURE_DIR is set
+        self.recorder = TickRecorder.from_env()
+
+        # The loop isn't running yet so it is fine to block on clearing out old orders
+        self.rest_client = AsyncRestClient(self.api_key, self.api_secret, self.api_passphrase, self.rest_url)
+        self.rest_client.latency = self.latency
+        self.rest_client.send("delete", "/orders")
+
+        # REST requests that are in flight, so we can cancel them when we close
+        self.tasks = set()
+
+        # Agents that have a quote reconciliation running
+        self.quoting = set()
+
+        # Our open orders as the user channel reports them, checked against REST less often the longer it stays right
+        self.order_index = OrderIndex()
+        self.reconcile_interval = RECONCILE_MIN_INTERVAL
+        self.reconcile_handle = None
 
         self.agents = []
         self.prodid_to_agents = {}
@@ -49,14 +101,20 @@ class CBProExchange:
                 b.logger = logger
                 s.exchange = self
                 s.logger = logger
+                b.tick_stats = self.tick_stats[prod_id]
+                s.tick_stats = self.tick_stats[prod_id]
+                b.book = self.books.get(prod_id)
+                s.book = self.books.get(prod_id)
                 self.agents.append(b)
                 self.agents.append(s)
                 self.prodid_to_agents[prod_id] = [b, s]
 
     def exception_handler(func):
-        def ret(self, *args, **kwargs):
+        async def ret(self, *args, **kwargs):
             try:
-                func(self, *args, **kwargs)
+                await func(self, *args, **kwargs)
+            except asyncio.CancelledError:
+                raise
             except:
                 # Gather all the info we want to log
                 exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -72,9 +130,6 @@ class CBProExchange:
                 with open(exception_dump_file, "w") as f:
                     f.write(out)
                     traceback.print_tb(exc_traceback, file=f)
-
-                # Make sure that we release the leaky bucket in case the exception is thrown after we have acquired it
-                self.lb.release()
         return ret
 
     # Delay loop based initialization until we are in asyncio context
@@ -82,21 +137,28 @@ class CBProExchange:
         if not self.opened:
             self.loop = asyncio.get_running_loop()
 
-            # Max of 5 tokens, new token every 0.2 seconds
-            # Limits average request rate to 5/s with max bursts of 10/s 
-            self.lb = LeakyBucket(5, 0.2)
+            # Keeps us inside the exchange's request rate limits, cancels and reconciliation go ahead of new quotes
+            self.rate_limiter = RateLimiter()
+            self.rest_client.rate_limiter = self.rate_limiter
 
             self.ws_tickers = TickerClient()
             self.ws_tickers.exchange = self
             self.ws_tickers.logger = self.logger
             self.ws_tickers.loop = self.loop
+            self.ws_tickers.recorder = self.recorder
             self.ws_tickers.start()
 
             self.get_accounts()
             self.order_watchdog()
+            self.reconcile_orders()
+            self.loop.call_later(METRICS_INTERVAL, self.report_metrics)
 
             self.opened = True
 
+    # Still running, we stop once the websocket feed is gone
+    def alive(self):
+        return self.ws_tickers.alive()
+
     # Safety net in case we forget to call close
     def __del__(self):
         self.close()
@@ -104,19 +166,30 @@ class CBProExchange:
     # Tear down object
     def close(self):
         if not self.closed:
-            self.lb.close()
-            self.ws_tickers.close()
+            for task in self.tasks:
+                task.cancel()
+            self.rest_client.close()
+
+            if self.reconcile_handle is not None:
+                self.reconcile_handle.cancel()
+
+            if self.opened:
+                self.rate_limiter.close()
+                self.ws_tickers.close()
+
+            if self.recorder is not None:
+                self.recorder.close()
 
             self.closed = True
 
-    def log_error(self, msg):
-        self.logger.log_error("CBProExchange", msg)
+    def log_error(self, msg, *args):
+        self.logger.log_error("CBProExchange", msg, *args)
     
-    def log_warn(self, msg):
-        self.logger.log_warn("CBProExchange", msg)
+    def log_warn(self, msg, *args):
+        self.logger.log_warn("CBProExchange", msg, *args)
 
-    def log_info(self, msg):
-        self.logger.log_info("CBProExchange", msg)
+    def log_info(self, msg, *args):
+        self.logger.log_info("CBProExchange", msg, *args)
 
     def products_to_currencies(self, products):
         ret = set()
@@ -132,76 +205,207 @@ class CBProExchange:
         try:
             return os.environ[name]
         except KeyError:
-            self.log_warn('"{}" does not exist!'.format(name))
+            self.log_warn('"{}" does not exist!', name)
             val = input("{}:".format(name))
             return val
 
+    # Run a REST request coroutine as a task on the loop, the caller never waits on the round trip
+    def spawn(self, coro):
+        # Agents cancel their orders when they are torn down, which can happen after we closed
+        if self.closed:
+            coro.close()
+            return None
+
+        task = self.loop.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    # An agent has a new desired quote. Only one reconciliation runs per agent, quotes that come
+    # in while it waits for budget or for the last request to finish just overwrite the desired quote
+    def update_quote(self, agent):
+        if agent not in self.quoting:
+            self.quoting.add(agent)
+            self.spawn(self.reconcile_quote_async(agent))
+
+    def cancel_order(self, order_id, on_order_cancelled=None):
+        return self.spawn(self.cancel_order_async(order_id, on_order_cancelled))
+
+    def place_market_order(self, on_order_placed, **kwargs):
+        return self.spawn(self.place_market_order_async(on_order_placed, **kwargs))
+
+    def place_limit_order(self, on_order_placed, **kwargs):
+        return self.spawn(self.place_limit_order_async(on_order_placed, **kwargs))
+
+    def replace_limit_order(self, prev_order, on_order_placed, on_order_cancelled=None, **kwargs):
+        return self.spawn(self.replace_limit_order_async(prev_order, on_order_placed, on_order_cancelled, **kwargs))
+
     @exception_handler
-    def cancel_order(self, order_id):
-        # Use leaky bucket regulator when making REST call
-        self.lb.acquire()
-        self.rest_client.cancel_order(order_id)
-        self.lb.release()
-        
+    async def reconcile_quote_async(self, agent):
+        try:
+            while agent.desired_quote is not None:
+                # Decide what to send only once it can go out, by then the desired quote is as fresh as it gets
+                start = self.latency.now()
+                await self.rate_limiter.wait(priority=PRIORITY_QUOTE)
+                self.latency.since("quote_wait", agent.product_id, start)
+
+                tick_time = agent.desired_quote_time
+                req = agent.reconcile_quote()
+                # Nothing was sent, either nothing to do or the agent is still waiting on its last order
+                if req is None:
+                    break
+
+                if tick_time is not None:
+                    self.latency.since("tick_to_send", agent.product_id, tick_time)
+                await req
+                if tick_time is not None:
+                    self.latency.since("tick_to_ack", agent.product_id, tick_time)
+        finally:
+            self.quoting.discard(agent)
+
+    # A request that failed without an answer is answered the way the exchange reports errors,
+    # so whoever is waiting on it always hears back and their order doesn't stay in flight forever
+    async def answer(self, coro):
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.log_error("request failed: {}", repr(e))
+            return {"message": repr(e)}
+
+    # A successful cancel answers with the order id, errors come back as a dict with a message
+    def cancelled(self, order_id, resp):
+        if not isinstance(resp, dict):
+            self.order_index.remove(order_id)
+
     @exception_handler
-    def place_market_order(self, on_order_placed, **kwargs):
-        # Use leaky bucket regulator when making REST call
-        self.lb.acquire()
-        resp = self.rest_client.place_market_order(**kwargs)
-        self.lb.release()
-        on_order_placed(resp)
-        
+    async def cancel_order_async(self, order_id, on_order_cancelled=None):
+        resp = await self.answer(self.rest_client.cancel_order(order_id))
+        self.cancelled(order_id, resp)
+        if on_order_cancelled is not None:
+            on_order_cancelled(resp)
+
+    # on_order_placed runs on the loop as soon as the response arrives
     @exception_handler
-    def place_limit_order(self, on_order_placed, **kwargs):
-        # Use leaky bucket regulator when making REST call
-        self.lb.acquire()
-        resp = self.rest_client.place_limit_order(**kwargs)
-        self.lb.release()
+    async def place_market_order_async(self, on_order_placed, **kwargs):
+        resp = await self.answer(self.rest_client.place_market_order(**kwargs))
         on_order_placed(resp)
-        
+
     @exception_handler
-    def replace_limit_order(self, prev_order, on_order_placed, **kwargs):
-        self.lb.acquire(2)
-        resp = self.rest_client.place_limit_order(**kwargs)
-        self.rest_client.cancel_order(prev_order.order_id) #TODO : need to update wallet when we cancel the order
-        self.lb.release()
+    async def place_limit_order_async(self, on_order_placed, **kwargs):
+        resp = await self.answer(self.rest_client.place_limit_order(**kwargs))
+        self.order_index.track(resp)
         on_order_placed(resp)
 
-    # Every so often we need to get the balance of our funds
+    # The cancel and the new order go out at the same time, one round trip instead of two
     @exception_handler
+    async def replace_limit_order_async(self, prev_order, on_order_placed, on_order_cancelled=None, **kwargs):
+        place_resp, cancel_resp = await asyncio.gather(self.answer(self.rest_client.place_limit_order(**kwargs)), self.answer(self.rest_client.cancel_order(prev_order.order_id)))
+        self.order_index.track(place_resp)
+        self.cancelled(prev_order.order_id, cancel_resp)
+        on_order_placed(place_resp)
+        if on_order_cancelled is not None:
+            on_order_cancelled(cancel_resp)
+
+    # Every so often we check the balance of our funds against the exchange to correct any drift of the wallet
     def get_accounts(self):
         # Schedule the next call to this function before we do anything else in case we hit an exception
-        self.loop.call_later(5.0, self.get_accounts)
+        self.loop.call_later(ACCOUNTS_INTERVAL, self.get_accounts)
+        self.spawn(self.get_accounts_async())
 
-        # Use leaky bucket regulator when making REST call
-        self.lb.acquire()
-        resp = self.rest_client.get_accounts()
-        self.lb.release()
+    @exception_handler
+    async def get_accounts_async(self):
+        version = self.wallet.version
+        resp = await self.rest_client.get_accounts()
 
-        # Save wallet info 
+        accounts = {}
         for acct in resp:
             if acct["currency"] in self.currency_ids:
-                self.available[acct["currency"]] = float(acct["available"]) 
-                self.hold[acct["currency"]] = float(acct["hold"])
-                self.balance[acct["currency"]] = float(acct["balance"])
+                accounts[acct["currency"]] = (float(acct["available"]), float(acct["hold"]))
 
-                self.log_info("{} available({}) hold({}) balance({})".format(acct["currency"], self.available[acct["currency"]], self.hold[acct["currency"]], self.balance[acct["currency"]]))
+        drift = self.wallet.reconcile(accounts, version)
+        if drift is None:
+            self.log_info("wallet changed while fetching accounts, skipped")
+        else:
+            for currency in sorted(drift):
+                self.log_info("{} available({}) hold({}) balance({}) drift({})", currency, self.available[currency], self.hold[currency], self.balance[currency], drift[currency])
+        self.log_info("wallet {}", self.wallet.metrics())
         
-    # Periodically list our open order to see if we have 0 or >1 orders open and act accordingly
-    @exception_handler
+    # Periodically hand our open orders to the agents to see if they have 0 or >1 orders open and act accordingly,
+    # the order index is kept up to date by the user channel so this doesn't need a REST request
     def order_watchdog(self):
         # Schedule the next call to this function before we do anything else in case we hit an exception
         self.loop.call_later(15.0, self.order_watchdog)
 
-        self.lb.acquire(2)
-        orders = list(self.rest_client.get_orders())
-        self.lb.release()
-
-        # Kick off on order watchdog tasks
-        buy_orders = [ e for e in orders if e["side"] == "buy"]
-        sell_orders = [ e for e in orders if e["side"] == "sell"]
         for agent in self.agents:
-            if agent.is_buyer():
-                agent.on_order_watchdog( [ e for e in buy_orders if e["product_id"] == agent.product_id] )
+            side = "buy" if agent.is_buyer() else "sell"
+            agent.on_order_watchdog(self.order_index.open_orders(agent.product_id, side))
+
+    # Log a summary of the latency histograms since the last report, one line per stage and product,
+    # and how the tick dispatch queues are keeping up
+    def report_metrics(self):
+        # Schedule the next call to this function before we do anything else in case we hit an exception
+        self.loop.call_later(METRICS_INTERVAL, self.report_metrics)
+
+        # Every report resets what it measured, so nothing is asked for while the lines wouldn't be logged
+        if not self.logger.enabled("CBProExchange", LOG_INFO):
+            return
+
+        for product_id, queue in sorted(self.ws_tickers.queues.items()):
+            self.log_info("dispatch product_id({}) {}", product_id, " ".join(["{}({})".format(k, v) for k, v in queue.metrics().items()]))
+        self.log_info("log writer {}", " ".join(["{}({})".format(k, v) for k, v in self.logger.metrics().items()]))
+        if self.recorder is not None:
+            self.log_info("tick recorder {}", " ".join(["{}({})".format(k, v) for k, v in self.recorder.metrics().items()]))
+
+        for (stage, product_id), stats in self.latency.report().items():
+            self.log_info("latency stage({}) product_id({}) count({}) p50({:.3f}ms) p99({:.3f}ms) max({:.3f}ms)", stage, product_id, stats["count"], stats["p50"]*1000, stats["p99"]*1000, stats["max"]*1000)
+
+    # Called from MainThread with the user channel messages about our orders
+    def on_order_message(self, msg):
+        self.order_index.on_message(msg)
+        self.wallet.on_message(msg)
+
+        if msg["type"] == "match":
+            if "maker_fee_rate" not in msg:
+                self.log_warn("We were not the maker (GUI manual order or rebalance order?)")
+                return
+
+            # Look at agents for this product id only and kick off on fill tasks
+            fill = Fill.from_match(msg)
+            self.maker_fee_rate = fill.maker_fee_rate
+            for agent in self.prodid_to_agents.get(fill.product_id, []):
+                agent.on_fill(fill)
+
+    # We may have missed user channel messages, check the order index against REST soon
+    def order_stream_gap(self, reason):
+        self.log_warn("order stream gap: {}", reason)
+        self.reconcile_interval = RECONCILE_MIN_INTERVAL
+        if self.reconcile_handle is not None:
+            self.reconcile_handle.cancel()
+            self.reconcile_orders()
+
+    # Check the order index against the open orders REST lists
+    def reconcile_orders(self):
+        self.reconcile_handle = None
+        self.spawn(self.reconcile_orders_async())
+
+    @exception_handler
+    async def reconcile_orders_async(self):
+        try:
+            started = time.monotonic()
+            orders = await self.rest_client.get_orders(tokens=2)
+            fixes = self.order_index.reconcile(orders, started)
+
+            # Back off while the stream keeps the index right, come back quickly once it didn't
+            if fixes > 0:
+                self.log_warn("order index was off by {} orders", fixes)
+                self.reconcile_interval = RECONCILE_MIN_INTERVAL
             else:
-                agent.on_order_watchdog( [ e for e in sell_orders if e["product_id"] == agent.product_id] )
+                self.reconcile_interval = min(self.reconcile_interval * 2, RECONCILE_MAX_INTERVAL)
+
+            self.log_info("order index orders({}) messages({}) fixes({}) next_reconcile({}s)", len(self.order_index), self.order_index.message_count, self.order_index.fix_count, self.reconcile_interval)
+            self.log_info("rate limiter {}", self.rate_limiter.metrics())
+        finally:
+            if not self.closed and self.reconcile_handle is None:
+                self.reconcile_handle = self.loop.call_later(self.reconcile_interval, self.reconcile_orders)
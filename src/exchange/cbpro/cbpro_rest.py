@@ -0,0 +1,120 @@
+from cbpro.cbpro_auth import CBProAuth
+from concurrent.futures import ThreadPoolExecutor
+from src.exchange.rate_limiter import PRIORITY_CANCEL, PRIORITY_RECONCILE, PRIORITY_QUOTE
+import asyncio
+import json
+import requests
+import time
+from requests.adapters import HTTPAdapter
+
+# REST client for the Coinbase Pro API that never blocks the asyncio loop.
+# Requests go out over one keep-alive requests.Session whose connection pool holds max_in_flight
+# connections, and run on a pool of max_in_flight worker threads so that many requests can be in
+# flight at once while the loop keeps processing ticks. Every request has a timeout.
+# The async methods return the decoded json response, the same as cbpro.AuthenticatedClient.
+class AsyncRestClient:
+    def __init__(self, key, b64secret, passphrase, api_url, timeout=10.0, max_in_flight=8):
+        self.url = api_url.rstrip("/")
+        self.auth = CBProAuth(key, b64secret, passphrase)
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="AsyncRestClient")
+        self.in_flight = 0
+
+        # Requests handed to the workers that haven't finished, the ones still waiting are cancelled on close
+        self.pending = set()
+
+        # Optional RateLimiter, every request waits for its budget on the loop before it is handed to a worker
+        self.rate_limiter = None
+
+        # Optional LatencyTracker for the rate limit wait and the round trip of every request
+        self.latency = None
+
+        self.closed = False
+
+    def close(self):
+        if not self.closed:
+            # shutdown(cancel_futures=True) needs python 3.9
+            for future in list(self.pending):
+                future.cancel()
+            self.executor.shutdown(wait=False)
+            self.session.close()
+            self.closed = True
+
+    # Blocking request, used directly before the loop is running and by the worker threads
+    def send(self, method, endpoint, params=None, data=None):
+        r = self.session.request(method, self.url + endpoint, params=params, data=data, auth=self.auth, timeout=self.timeout)
+        return r.json()
+
+    # Blocking request that follows the cb-after header through every page
+    def send_paginated(self, endpoint, params=None):
+        params = dict(params or {})
+        results = []
+        while True:
+            r = self.session.get(self.url + endpoint, params=params, auth=self.auth, timeout=self.timeout)
+            results += r.json()
+            if not r.headers.get("cb-after") or params.get("before") is not None:
+                return results
+            params["after"] = r.headers["cb-after"]
+
+    # Run a blocking request on the worker pool and wait for it without blocking the loop
+    # product_id only says which product the latencies are recorded under
+    async def request(self, method, endpoint, params=None, data=None, tokens=1, priority=PRIORITY_QUOTE, product_id="-"):
+        return await self.run(self.send, method, endpoint, params, data, tokens=tokens, priority=priority, product_id=product_id)
+
+    async def run(self, func, *args, tokens=1, priority=PRIORITY_QUOTE, product_id="-"):
+        if self.rate_limiter is not None:
+            start = time.monotonic()
+            await self.rate_limiter.acquire(tokens, priority)
+            if self.latency is not None:
+                self.latency.since("rate_limit", product_id, start)
+
+        self.in_flight += 1
+        start = time.monotonic()
+        try:
+            future = self.executor.submit(func, *args)
+            self.pending.add(future)
+            future.add_done_callback(self.pending.discard)
+            return await asyncio.wrap_future(future)
+        finally:
+            self.in_flight -= 1
+            if self.latency is not None:
+                self.latency.since("rest", product_id, start)
+
+    async def place_limit_order(self, product_id, side, price, size, **kwargs):
+        params = {"product_id": product_id, "side": side, "type": "limit", "price": price, "size": size}
+        params.update(kwargs)
+        params = {k: v for k, v in params.items() if v is not None}
+        return await self.request("post", "/orders", data=json.dumps(params), product_id=product_id)
+
+    async def place_market_order(self, product_id, side, size=None, funds=None, **kwargs):
+        if not (size is None) ^ (funds is None):
+            raise Exception("either size or funds must be given for a market order (but not both)")
+
+        params = {"product_id": product_id, "side": side, "type": "market", "size": size, "funds": funds}
+        params.update(kwargs)
+        params = {k: v for k, v in params.items() if v is not None}
+        return await self.request("post", "/orders", data=json.dumps(params), product_id=product_id)
+
+    async def cancel_order(self, order_id):
+        return await self.request("delete", "/orders/" + order_id, priority=PRIORITY_CANCEL)
+
+    async def cancel_all(self, product_id=None):
+        params = None if product_id is None else {"product_id": product_id}
+        return await self.request("delete", "/orders", params=params, priority=PRIORITY_CANCEL)
+
+    async def get_accounts(self):
+        return await self.request("get", "/accounts", priority=PRIORITY_RECONCILE)
+
+    async def get_orders(self, product_id=None, status=None, tokens=1):
+        params = {}
+        if product_id is not None:
+            params["product_id"] = product_id
+        if status is not None:
+            params["status"] = status
+        return await self.run(self.send_paginated, "/orders", params, tokens=tokens, priority=PRIORITY_RECONCILE)
@@ -1,13 +1,15 @@
-import collections as col
 import numpy as np
-import cbpro
+import functools
+import json
+from src.exchange.cbpro.async_websocket import AsyncWebsocketClient
+from src.exchange.dispatch_queue import DispatchQueue
+from src.records import Tick
 
-TICK_LOOKBACK_SAMPLES = 6
+# Every callback in this class runs on the asyncio loop in the main thread, the websocket is read by a task on it
+class TickerClient(AsyncWebsocketClient):
+    # TickRecorder the feed is teed into, if any
+    recorder = None
 
-# WARNING : many callbackes in this class are called from the thread in the
-#           WebsocketClient class, not the main thread
-class TickerClient(cbpro.WebsocketClient):
-    # Called from MainThread
     def on_open(self):
         # Need to hold the exchange credentials
         self.auth = True
@@ -18,70 +20,77 @@ class TickerClient(cbpro.WebsocketClient):
         self.products = self.exchange.product_ids
         self.channels = ["ticker", "status", "user"]
 
-        # Set up data structures to hold the recent samples
-        self.samples = {}
-        for product_id in self.products:
-            self.samples[product_id] = col.deque()
-        
+        # Only ask for the order book if a product wants one, it is by far the busiest channel
+        if len(self.exchange.books) > 0:
+            self.channels.append("level2")
+
+        # Last tick of every product, handed to its agents again when the top of the book moves between trades
+        self.last_ticks = {}
+
+        # Products whose book went stale and is waiting for a new snapshot
+        self.snapshot_requests = set()
+        self.make_queues()
+
         self.logger.log_info("TickerClient", "-- Match Socket Opened --")
 
-    # Called from WebsocketClient thread
     def on_error(self, e, data=None):
         self.error = e
         self.stop = True
-        self.logger.log_error("TickerClient", "{} - data: {}".format(e, data))
+        self.logger.log_error("TickerClient", "{} - data: {}", e, data)
+
+        # Whatever happened to our orders from here on we won't hear about
+        self.exchange.order_stream_gap(repr(e))
 
-    # Called from WebsocketClient thread
     def on_message(self, msg):
         if msg["type"] == "ticker":
-            product_id = msg["product_id"]
-            ts = msg["side"]
-
-            if ts == "buy":
-                ms = "sell"
-            else:
-                ms = "buy"
-
-            msg["taker_side"] = ts
-            msg["maker_side"] = ms
-
-            # Update list of samples and get rolling average volume and price
-            self.samples[product_id].append(float(msg["price"]))
-
-            if len(self.samples[product_id]) > TICK_LOOKBACK_SAMPLES:
-                self.samples[product_id].popleft()
-            elif len(self.samples[product_id]) == 1:
+            # Everything past here works on the decoded record, the numbers are only parsed once
+            tick = Tick.from_ticker(msg, self.received)
+            product_id = tick.product_id
+            self.exchange.latency.since("decode", product_id, tick.received)
+            if self.recorder is not None:
+                self.record(self.recorder.record_tick, tick, msg.get("time"))
+
+            # Update the rolling stats and get the mean of the recent tick to tick price changes
+            stats = self.exchange.tick_stats[product_id]
+            stats.update(tick.price)
+            if not stats.ready():
                 return
 
-            tick_price_changes = 0
-            for i,p in enumerate(self.samples[product_id]):
-                if i == 0:
-                    prev_p = p
-                else:
-                    tick_price_changes += (p-prev_p)/prev_p
-                    prev_p = p
-            tick_price_changes /= len(self.samples[product_id])-1
+            tick_price_changes = stats.mean_change()
 
-            self.exchange.log_info("tick product_id({}) tick_price_changes({}) price({}) taker_side({}) size({}) bid({}) ask({})".format(product_id, tick_price_changes, msg["price"], msg["side"], msg["last_size"], msg["best_bid"], msg["best_ask"]))
+            self.logger.log_info("TickerClient", "tick product_id({}) tick_price_changes({}) price({}) taker_side({}) size({}) bid({}) ask({})", product_id, tick_price_changes, tick.price, tick.taker_side, tick.size, tick.best_bid, tick.best_ask)
 
             # Only need to do this part if we have a trading agent associated with this product
             if product_id in self.exchange.prodid_to_agents:
-                # Look at agents for this product id only and kick off on tick tasks
-                for agent in self.exchange.prodid_to_agents[product_id]:
-                    # Want to launch this in the main thread, so need to use threadsafe version of call soon
-                    self.loop.call_soon_threadsafe(agent.on_tick, msg, float(msg["price"]), tick_price_changes)
-
-        elif msg["type"] == "match":
-            try:
-                self.exchange.maker_fee_rate = float(msg["maker_fee_rate"])
-                self.on_fill(msg)
-            except KeyError:
-                self.exchange.log_warn("We were not the maker (GUI manual order or rebalance order?)")
+                self.last_ticks[product_id] = (tick, tick.price, tick_price_changes)
+                self.queue_tick(product_id)
 
-        elif msg["type"] == "status":
-            # Only way to do this without changing the WebsocketClient, do it in a path not triggered too often
-            self.thread.name = "TickerClient"
+        elif msg["type"] == "l2update":
+            if self.recorder is not None:
+                self.record(self.recorder.record_message, msg)
+            product_id = msg["product_id"]
+            book = self.exchange.books.get(product_id)
+            if book is not None:
+                if book.on_update(msg) and product_id in self.last_ticks:
+                    self.queue_tick(product_id)
+                if not book.ready:
+                    self.request_snapshot(product_id)
+
+        elif msg["type"] == "snapshot":
+            if self.recorder is not None:
+                self.record(self.recorder.record_message, msg)
+            book = self.exchange.books.get(msg["product_id"])
+            if book is not None:
+                book.on_snapshot(msg)
+                self.snapshot_requests.discard(msg["product_id"])
+
+        # User channel news about our orders for the order index and wallet
+        elif msg["type"] in ("received", "open", "done", "change", "match"):
+            if msg["type"] == "match" and self.recorder is not None:
+                self.record(self.recorder.record_message, msg)
+            self.exchange.on_order_message(msg)
 
+        elif msg["type"] == "status":
             # Grab the product meta-data for our trading agents
             products = msg["products"]
             for product in products:
@@ -93,27 +102,55 @@ class TickerClient(cbpro.WebsocketClient):
 
         
 
-    # Called from WebsocketClient thread (actually called from on_message)
-    def on_fill(self, msg):
-        # Look at agents for this product id only and kick off on fill tasks
-        target, base = msg["product_id"].split("-")
-        for agent in self.exchange.prodid_to_agents[msg["product_id"]]:
-            # Adjust wallet (fee comes out of base currency)
-            if msg["side"] == "buy":
-                self.exchange.hold[base] -= float(msg["size"]) * float(msg["price"])
-                self.exchange.available[base] -= self.exchange.maker_fee_rate * ( float(msg["size"]) * float(msg["price"]) )
-                self.exchange.available[target] += float(msg["size"])
-            if msg["side"] == "sell":
-                self.exchange.hold[target] -= float(msg["size"]) 
-                self.exchange.available[base] -= self.exchange.maker_fee_rate * ( float(msg["size"]) * float(msg["price"]) )
-                self.exchange.available[base] += float(msg["size"]) * float(msg["price"])
-            self.exchange.balance[base] = self.exchange.hold[base] + self.exchange.available[base]
-            self.exchange.balance[target] = self.exchange.hold[target] + self.exchange.available[target]
-
-            # Kick off on_fill callback
-            # Want to launch this in the main thread, so need to use threadsafe version of call soon
-            self.loop.call_soon_threadsafe(agent.on_fill, msg)
-
-    # Called from MainThread
+    # Capture is a side job, whatever goes wrong in the recorder is counted and logged but never stops the feed
+    def record(self, method, *args):
+        try:
+            method(*args)
+        except Exception as e:
+            self.recorder.count_error()
+            self.logger.log_error("TickerClient", "tick recorder failed: {}", repr(e))
+
+    # The level2 channel only sends a snapshot when we subscribe, so get a new one by subscribing again.
+    # Until it comes the book isn't ready and the agents fall back to the top of the book from the ticks
+    def request_snapshot(self, product_id):
+        if product_id in self.snapshot_requests:
+            return
+        self.snapshot_requests.add(product_id)
+        self.logger.log_warn("TickerClient", "book product_id({}) went stale, asking for a new snapshot", product_id)
+        self.loop.create_task(self.resubscribe_book(product_id))
+
+    async def resubscribe_book(self, product_id):
+        try:
+            await self.ws.send(json.dumps({"type": "unsubscribe", "product_ids": [product_id], "channels": ["level2"]}))
+            await self.ws.send(json.dumps({"type": "subscribe", "product_ids": [product_id], "channels": ["level2"]}))
+        except Exception as e:
+            # Ask again on the next update
+            self.snapshot_requests.discard(product_id)
+            self.logger.log_error("TickerClient", "book product_id({}) resubscribe failed: {}", product_id, repr(e))
+
+    # Ticks waiting for every product with agents, bounded so a busy loop conflates or drops them instead of
+    # falling behind. By default the latest tick replaces one still waiting, so agents never work through
+    # a backlog of stale ticks, see the DISPATCH_POLICY and DISPATCH_QUEUE config columns
+    def make_queues(self):
+        self.queues = {}
+        for product_id in self.exchange.prodid_to_agents:
+            self.queues[product_id] = DispatchQueue.from_config(self.exchange.configs[product_id], functools.partial(self.dispatch_tick, product_id), self.loop)
+
+    # Dispatching waits for the next loop iteration, so a burst of messages read in one go only reaches the agents once
+    def queue_tick(self, product_id):
+        self.queues[product_id].put(self.last_ticks[product_id])
+
+    # Hands a queued tick of a product to its agents
+    def dispatch_tick(self, product_id, item, queued):
+        tick, price, tick_price_changes = item
+        latency = self.exchange.latency
+        latency.since("dispatch", product_id, queued)
+
+        # Look at agents for this product id only and kick off on tick tasks
+        for agent in self.exchange.prodid_to_agents[product_id]:
+            start = latency.now()
+            agent.on_tick(tick, price, tick_price_changes)
+            latency.since("on_tick", product_id, start)
+
     def on_close(self):
         self.logger.log_info("TickerClient", "-- Match Socket Closed --")
\ No newline at end of file
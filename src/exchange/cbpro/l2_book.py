@@ -0,0 +1,117 @@
+from sortedcontainers import SortedDict
+
+# Levels served per side when the L2_LEVELS config column doesn't say
+L2_LEVELS = 50
+
+# Levels kept per side as a multiple of the levels served, the extra ones are there to refill the top
+# when levels near the spread are deleted
+BUFFER_FACTOR = 2
+
+# Local copy of one product's order book from the level2 channel:
+#   snapshot   the whole book, sent once when we subscribe
+#   l2update   the new size of some price levels, a size of 0 removes the level
+# Each side is a SortedDict of price -> size so every update is O(log n). Only the best
+# max_levels * BUFFER_FACTOR levels of a side are kept and only the best max_levels of those are
+# served. A level that falls off the end is gone until the channel sends an update for it, so once
+# a side was cut short its levels are only known to be the real ones while it has at least
+# max_levels left. When deletes take a cut side below that the book stops being ready, and it
+# stays that way until the next snapshot, the owner of the book has to ask for one
+class L2Book:
+    def __init__(self, max_levels=L2_LEVELS):
+        if max_levels < 1:
+            raise Exception("max_levels must be at least 1, got {}".format(max_levels))
+
+        self.max_levels = max_levels
+        self.keep_levels = max_levels * BUFFER_FACTOR
+        self.bids = SortedDict()
+        self.asks = SortedDict()
+
+        # Whether levels of a side were dropped since the last snapshot
+        self.bids_cut = False
+        self.asks_cut = False
+
+        self.ready = False
+        self.update_count = 0
+
+    # Number of levels from the optional L2_LEVELS config column, None if the product doesn't want a book
+    @classmethod
+    def from_config(cls, config):
+        levels = config.get("L2_LEVELS")
+        if levels is None or levels != levels or int(levels) <= 0:
+            return None
+        return cls(int(levels))
+
+    def on_snapshot(self, msg):
+        self.bids.clear()
+        self.asks.clear()
+        for price, size in msg["bids"][:self.keep_levels]:
+            self.bids[float(price)] = float(size)
+        for price, size in msg["asks"][:self.keep_levels]:
+            self.asks[float(price)] = float(size)
+        self.bids_cut = len(msg["bids"]) > self.keep_levels
+        self.asks_cut = len(msg["asks"]) > self.keep_levels
+        self.ready = True
+
+    # Apply an l2update, returns True if the best bid or ask price or size changed.
+    # Updates are ignored while the book isn't ready, it is rebuilt from the next snapshot
+    def on_update(self, msg):
+        if not self.ready:
+            return False
+
+        top = self.top()
+        for side, price, size in msg["changes"]:
+            if side == "buy":
+                self.bids_cut = self.set_level(self.bids, 0, float(price), float(size), self.bids_cut)
+            else:
+                self.asks_cut = self.set_level(self.asks, -1, float(price), float(size), self.asks_cut)
+        self.update_count += 1
+
+        if (self.bids_cut and len(self.bids) < self.max_levels) or (self.asks_cut and len(self.asks) < self.max_levels):
+            self.ready = False
+            return True
+        return self.top() != top
+
+    # worst is the index of the level furthest from the spread, returns whether the side is cut now
+    def set_level(self, book, worst, price, size, cut):
+        if size == 0.0:
+            book.pop(price, None)
+            return cut
+
+        book[price] = size
+        if len(book) > self.keep_levels:
+            book.popitem(worst)
+            return True
+        return cut
+
+    def top(self):
+        bid = self.bids.peekitem(-1) if self.bids else None
+        ask = self.asks.peekitem(0) if self.asks else None
+        return bid, ask
+
+    def best_bid(self):
+        return self.bids.peekitem(-1)[0] if self.bids else None
+
+    def best_ask(self):
+        return self.asks.peekitem(0)[0] if self.asks else None
+
+    # Size resting at exactly price on side ("buy" for bids, "sell" for asks), 0 if there is no such level
+    def depth_at(self, side, price):
+        book = self.bids if side == "buy" else self.asks
+        return book.get(price, 0.0)
+
+    # Total size of the best levels of side, at most max_levels of them
+    def depth(self, side, levels=1):
+        levels = min(levels, self.max_levels)
+        if side == "buy":
+            sizes = self.bids.values()[-levels:]
+        else:
+            sizes = self.asks.values()[:levels]
+        return sum(sizes)
+
+    # Mid price weighted towards the side with less size on it, where the next trade is more likely to go
+    def microprice(self):
+        if not self.bids or not self.asks:
+            return None
+        bid, bid_size = self.bids.peekitem(-1)
+        ask, ask_size = self.asks.peekitem(0)
+        return (bid * ask_size + ask * bid_size) / (bid_size + ask_size)
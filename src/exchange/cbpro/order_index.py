@@ -0,0 +1,126 @@
+import collections as col
+import time
+
+# Our open orders on the exchange, kept up to date from the user channel:
+#   received  a new order of ours was accepted by the matching engine
+#   open      the order is resting on the book
+#   change    the order's size or price changed
+#   match     part of the order filled
+#   done      the order is gone, filled or cancelled
+# Orders are indexed by id and by (product_id, side). Orders are stored as dicts with the same keys
+# the REST api uses for them, so they can be handed to on_order_watchdog as they are.
+# A REST snapshot of open orders is only needed now and then to catch messages we missed, see reconcile()
+class OrderIndex:
+    def __init__(self, done_memory=1000, clock=time.monotonic):
+        self.orders = {}
+        self.books = col.defaultdict(dict)
+        self.clock = clock
+
+        # Ids of orders we recently saw finish, so late news about them doesn't bring them back
+        self.done_ids = set()
+        self.done_order = col.deque()
+        self.done_memory = done_memory
+
+        self.message_count = 0
+        self.fix_count = 0
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __contains__(self, order_id):
+        return order_id in self.orders
+
+    def open_orders(self, product_id, side):
+        return list(self.books[(product_id, side)].values())
+
+    def add(self, order):
+        if order["id"] in self.done_ids:
+            return
+        if order["id"] not in self.orders:
+            order["seen"] = self.clock()
+            self.orders[order["id"]] = order
+            self.books[(order["product_id"], order["side"])][order["id"]] = order
+
+    def remove(self, order_id):
+        order = self.orders.pop(order_id, None)
+        if order is not None:
+            del self.books[(order["product_id"], order["side"])][order_id]
+
+        if order_id not in self.done_ids:
+            self.done_ids.add(order_id)
+            self.done_order.append(order_id)
+            if len(self.done_order) > self.done_memory:
+                self.done_ids.discard(self.done_order.popleft())
+
+    # Answer to a place order request, the user channel usually tells us first but not always
+    def track(self, resp):
+        if "id" in resp and resp.get("status") != "done":
+            self.add({"id": resp["id"], "product_id": resp["product_id"], "side": resp["side"], "price": resp["price"], "size": resp["size"],
+                      "remaining_size": float(resp["size"]) - float(resp.get("filled_size", 0.0)), "status": resp.get("status", "pending")})
+
+    # Apply a user channel message, returns False for message types that aren't about our orders
+    def on_message(self, msg):
+        msg_type = msg["type"]
+        if msg_type == "received":
+            # Market orders never rest on the book
+            if msg.get("order_type") == "limit":
+                self.add({"id": msg["order_id"], "product_id": msg["product_id"], "side": msg["side"], "price": msg["price"], "size": msg["size"],
+                          "remaining_size": float(msg["size"]), "client_oid": msg.get("client_oid", ""), "status": "received"})
+
+        elif msg_type == "open":
+            order = self.orders.get(msg["order_id"])
+            if order is None:
+                self.add({"id": msg["order_id"], "product_id": msg["product_id"], "side": msg["side"], "price": msg["price"], "size": msg["remaining_size"],
+                          "remaining_size": float(msg["remaining_size"]), "status": "open"})
+            else:
+                order["remaining_size"] = float(msg["remaining_size"])
+                order["status"] = "open"
+
+        elif msg_type == "change":
+            order = self.orders.get(msg["order_id"])
+            if order is not None:
+                if "new_size" in msg:
+                    order["remaining_size"] -= float(msg["old_size"]) - float(msg["new_size"])
+                    order["size"] = msg["new_size"]
+                if "new_price" in msg:
+                    order["price"] = msg["new_price"]
+
+        elif msg_type == "match":
+            order = self.orders.get(msg.get("maker_order_id"))
+            if order is not None:
+                order["remaining_size"] -= float(msg["size"])
+
+        elif msg_type == "done":
+            self.remove(msg["order_id"])
+
+        else:
+            return False
+
+        self.message_count += 1
+        return True
+
+    # Bring the index in line with a REST list of open orders requested at time started,
+    # returns how many orders were wrong which means the stream missed something
+    def reconcile(self, orders, started):
+        listed = {}
+        for order in orders:
+            listed[order["id"]] = order
+
+        fixes = 0
+
+        # Orders that finished without us hearing about it, anything newer than the snapshot may just not be in it yet
+        for order_id, order in list(self.orders.items()):
+            if order_id not in listed and order["seen"] < started:
+                self.remove(order_id)
+                fixes += 1
+
+        # Orders we never heard about, unless we saw them finish since the snapshot was taken
+        for order_id, order in listed.items():
+            if order_id not in self.orders and order_id not in self.done_ids:
+                order = dict(order)
+                order["remaining_size"] = float(order["size"]) - float(order.get("filled_size", 0.0))
+                self.add(order)
+                fixes += 1
+
+        self.fix_count += fixes
+        return fixes
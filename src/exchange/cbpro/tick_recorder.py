@@ -0,0 +1,234 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from src.exchange.backtest.tick_columns import TickColumns, encode_side
+from src.exchange.backtest.tick_store import write_tick_chunks
+import argparse
+import json
+import os
+import os.path as pth
+import re
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+
+# orjson writes and reads the message part several times faster when it is installed, json is the fallback
+try:
+    import orjson
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+except ImportError:
+    json_dumps = lambda obj: json.dumps(obj).encode()
+    json_loads = json.loads
+
+# Records buffered before a chunk is written, and seconds a chunk is held at most so little is lost in a crash
+CHUNK_RECORDS = 10000
+FLUSH_INTERVAL = 5.0
+ZLIB_LEVEL = 6
+
+# A capture file is a run of chunks appended one after the other, each is a header followed by the
+# zlib compressed ticks and messages of the chunk:
+#   magic, start_time, end_time, tick count, message count, raw length, compressed length
+# start_time and end_time are the epoch ms range of the records in the chunk, so a reader can find the
+# chunks of a time range from the headers alone. A chunk cut short by a crash is ignored when reading
+CHUNK_MAGIC = b"TKC1"
+CHUNK_HEADER = struct.Struct("<4sqqIIII")
+
+# Ticker messages as fixed size records, time is the exchange's epoch ms and received our time.monotonic()
+TICK_DTYPE = np.dtype([("time", "<i8"), ("received", "<f8"), ("product_id", "S16"), ("price", "<f8"), ("size", "<f8"),
+                       ("taker_side", "i1"), ("bid", "<f8"), ("ask", "<f8")])
+
+# Feed timestamps are UTC, the fraction of a second can have any number of digits
+FEED_TIME_RE = re.compile(r"(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2})(?:\.(\d+))?(?:Z|[+-]00:?00)?$")
+
+# Epoch ms of a feed timestamp like "2021-01-05T12:00:00.123456Z". A message without one, or with one
+# we can't read, gets the time it is recorded at instead
+def feed_time(value):
+    match = FEED_TIME_RE.match(value) if isinstance(value, str) else None
+    if match is None:
+        return int(time.time() * 1000)
+
+    # datetime.fromisoformat of python 3.8 only takes 3 or 6 digits and no Z
+    seconds, fraction = match.groups()
+    try:
+        t = datetime.fromisoformat(seconds + "+00:00").timestamp()
+    except ValueError:
+        return int(time.time() * 1000)
+    return int(t) * 1000 + int((fraction or "0")[:3].ljust(3, "0"))
+
+# Tees the live feed into an append-only capture file for replaying it later. Ticker messages are kept as
+# TICK_DTYPE records, match and level2 messages as they were decoded. Recording only buffers the record,
+# the chunk is compressed and written by a background thread, one chunk at a time in order
+class TickRecorder:
+    def __init__(self, path, chunk_records=CHUNK_RECORDS, flush_interval=FLUSH_INTERVAL, clock=time.monotonic):
+        self.path = path
+        self.chunk_records = chunk_records
+        self.flush_interval = flush_interval
+        self.clock = clock
+
+        self.fp = open(path, "ab")
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="TickRecorder")
+
+        self.ticks = []
+        self.messages = []
+        self.chunk_started = None
+        self.last_time = None
+
+        # Errors are counted by the writer thread and by whoever records, the rest only on the recording side
+        self.recorded_count = 0
+        self.chunk_count = 0
+        self.error_count = 0
+        self.error_lock = threading.Lock()
+        self.closed = False
+
+    # A recorder writing to a new capture in the folder of the optional TICK_CAPTURE_DIR system variable,
+    # None without it
+    @classmethod
+    def from_env(cls):
+        folder = os.environ.get("TICK_CAPTURE_DIR")
+        if folder is None or folder == "":
+            return None
+        os.makedirs(folder, exist_ok=True)
+        return cls(pth.join(folder, "capture_{}.tkc".format(datetime.now().strftime("%Y%m%d_%H%M%S"))))
+
+    # time_value is the "time" field of the ticker message the tick was decoded from
+    def record_tick(self, tick, time_value):
+        t = feed_time(time_value)
+        self.last_time = t
+        self.ticks.append((t, tick.received or 0.0, tick.product_id, tick.price, tick.size, encode_side(tick.taker_side), tick.best_bid, tick.best_ask))
+        self.recorded()
+
+    # Messages without a time of their own, like snapshots, get the time of the record before them
+    def record_message(self, msg):
+        t = feed_time(msg["time"]) if "time" in msg else self.last_time
+        if t is None:
+            t = feed_time(None)
+        self.last_time = t
+        self.messages.append((t, msg))
+        self.recorded()
+
+    def recorded(self):
+        self.recorded_count += 1
+        now = self.clock()
+        if self.chunk_started is None:
+            self.chunk_started = now
+        if len(self.ticks) + len(self.messages) >= self.chunk_records or now - self.chunk_started >= self.flush_interval:
+            self.flush()
+
+    # Hand what is buffered to the writer thread as a chunk
+    def flush(self):
+        if self.ticks or self.messages:
+            self.executor.submit(self.write_chunk, self.ticks, self.messages)
+            self.chunk_count += 1
+            self.ticks = []
+            self.messages = []
+        self.chunk_started = None
+
+    # Runs on the writer thread, nobody waits on the future so a failed chunk is only counted
+    def write_chunk(self, ticks, messages):
+        try:
+            self.write_chunk_data(ticks, messages)
+        except Exception:
+            self.count_error()
+
+    def write_chunk_data(self, ticks, messages):
+        tick_data = np.array(ticks, dtype=TICK_DTYPE).tobytes()
+        message_data = b"".join(json_dumps(item) + b"\n" for item in messages)
+        times = [t[0] for t in ticks] + [t for t, _ in messages]
+
+        raw = tick_data + message_data
+        data = zlib.compress(raw, ZLIB_LEVEL)
+        self.fp.write(CHUNK_HEADER.pack(CHUNK_MAGIC, min(times), max(times), len(ticks), len(messages), len(raw), len(data)))
+        self.fp.write(data)
+        self.fp.flush()
+
+    # Writes out everything recorded so far
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.executor.shutdown(wait=True)
+            self.fp.close()
+            self.closed = True
+
+    def count_error(self):
+        with self.error_lock:
+            self.error_count += 1
+
+    def metrics(self):
+        with self.error_lock:
+            errors = self.error_count
+        return {"recorded": self.recorded_count, "chunks": self.chunk_count, "errors": errors}
+
+# (offset, start_time, end_time, tick count, message count) of every chunk of a capture, read from the headers
+def capture_index(path):
+    index = []
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        offset = 0
+        while offset + CHUNK_HEADER.size <= size:
+            magic, start, end, n_ticks, n_messages, raw_len, data_len = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+            if magic != CHUNK_MAGIC:
+                raise Exception("{} is not a tick capture, bad chunk at offset {}".format(path, offset))
+            if offset + CHUNK_HEADER.size + data_len > size:
+                break
+            index.append((offset, start, end, n_ticks, n_messages))
+            offset += CHUNK_HEADER.size + data_len
+            f.seek(offset)
+    return index
+
+# Iterate over the chunks of a capture with records in start <= time < end as (ticks, messages),
+# ticks a TICK_DTYPE array and messages a list of (time, msg). Chunks outside the range are never decompressed
+def read_capture(path, start=None, end=None):
+    with open(path, "rb") as f:
+        for offset, chunk_start, chunk_end, n_ticks, n_messages in capture_index(path):
+            if (start is not None and chunk_end < start) or (end is not None and chunk_start >= end):
+                continue
+
+            f.seek(offset)
+            header = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+            raw = zlib.decompress(f.read(header[6]))
+            tick_len = n_ticks * TICK_DTYPE.itemsize
+            ticks = np.frombuffer(raw[:tick_len], dtype=TICK_DTYPE)
+            messages = [tuple(json_loads(line)) for line in raw[tick_len:].splitlines()]
+
+            if start is not None or end is not None:
+                keep = np.ones(len(ticks), dtype=bool)
+                if start is not None:
+                    keep &= ticks["time"] >= start
+                    messages = [m for m in messages if m[0] >= start]
+                if end is not None:
+                    keep &= ticks["time"] < end
+                    messages = [m for m in messages if m[0] < end]
+                ticks = ticks[keep]
+
+            yield ticks, messages
+
+# Ticks of product_id in a list of captures as the TickColumns a backtest reads, sorted by time.
+# The feed has no average price, it is the trade price like in the ticks csv of a single trade
+def capture_ticks(paths, product_id, start=None, end=None):
+    key = product_id.encode()
+    parts = []
+    for path in paths:
+        for ticks, _ in read_capture(path, start, end):
+            parts.append(ticks[ticks["product_id"] == key])
+
+    ticks = np.concatenate(parts) if parts else np.zeros(0, dtype=TICK_DTYPE)
+    # Stable, so ticks within the same ms keep the order they arrived in
+    ticks = ticks[np.argsort(ticks["time"], kind="stable")]
+    return TickColumns(time=ticks["time"], price=ticks["price"], size=ticks["size"], taker_side=ticks["taker_side"],
+                       bid=ticks["bid"], ask=ticks["ask"], avg_price=ticks["price"])
+
+# Convert the ticks of product_id in a list of captures into a TickStore for the TICKS config column
+def write_capture_tick_store(paths, product_id, root, start=None, end=None):
+    return write_tick_chunks([capture_ticks(paths, product_id, start, end)], root)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('product_id', help='product to convert the ticks of')
+    parser.add_argument('store_path', help='folder to write the tick store to')
+    parser.add_argument('capture_paths', nargs='+', help='tick captures to convert')
+    args = parser.parse_args()
+
+    store = write_capture_tick_store(args.capture_paths, args.product_id, args.store_path)
+    print("wrote {} ticks over {} days to {}".format(len(store), len(store.index), args.store_path))
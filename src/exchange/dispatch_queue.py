@@ -0,0 +1,91 @@
+import collections as col
+import time
+
+# What a full queue does with a new item
+#   conflate     the new item replaces the one waiting, only the latest is ever dispatched
+#   drop_oldest  the oldest waiting item is dropped to make room, up to maxlen items are dispatched in order.
+#                Every put is its own event, an item equal to one still waiting (two identical trades)
+#                is queued again and both are dispatched, unlike conflate nothing is merged by value
+CONFLATE = "conflate"
+DROP_OLDEST = "drop_oldest"
+POLICIES = (CONFLATE, DROP_OLDEST)
+
+# Queue length of drop_oldest queues when the DISPATCH_QUEUE config column doesn't say
+DISPATCH_QUEUE = 16
+
+# Bounded queue of items waiting to be handed to callback on the asyncio loop.
+# One item is dispatched per loop iteration so a slow callback can't keep the loop from reading
+# the feed, and whatever arrives while the loop is busy is conflated or dropped instead of piling up.
+# callback gets the item and the time.monotonic() time it was queued
+class DispatchQueue:
+    def __init__(self, callback, loop, maxlen=1, policy=CONFLATE, clock=time.monotonic):
+        if policy not in POLICIES:
+            raise Exception("policy must be one of {}, got {}".format(POLICIES, policy))
+        if maxlen < 1:
+            raise Exception("maxlen must be at least 1, got {}".format(maxlen))
+
+        self.callback = callback
+        self.loop = loop
+        self.policy = policy
+        self.maxlen = 1 if policy == CONFLATE else maxlen
+        self.clock = clock
+        self.items = col.deque()
+        self.scheduled = False
+
+        self.queued_count = 0
+        self.dispatched_count = 0
+        self.dropped_count = 0
+        self.max_depth = 0
+
+    # Policy and length from the optional DISPATCH_POLICY and DISPATCH_QUEUE config columns
+    @classmethod
+    def from_config(cls, config, callback, loop):
+        policy = config.get("DISPATCH_POLICY")
+        maxlen = config.get("DISPATCH_QUEUE")
+
+        if not isinstance(policy, str) or policy == "":
+            policy = CONFLATE
+        if maxlen is None or maxlen != maxlen:
+            maxlen = DISPATCH_QUEUE
+
+        return cls(callback, loop, int(maxlen), policy)
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        self.queued_count += 1
+
+        if len(self.items) == self.maxlen:
+            self.dropped_count += 1
+            if self.policy == CONFLATE:
+                # Keep the time the slot was first filled, that is how long the dispatch has been waiting
+                self.items[-1] = (self.items[-1][0], item)
+                return
+            self.items.popleft()
+
+        self.items.append((self.clock(), item))
+        self.max_depth = max(self.max_depth, len(self.items))
+
+        if not self.scheduled:
+            self.scheduled = True
+            self.loop.call_soon(self.dispatch)
+
+    def dispatch(self):
+        self.scheduled = False
+        if not self.items:
+            return
+
+        queued, item = self.items.popleft()
+        if self.items:
+            self.scheduled = True
+            self.loop.call_soon(self.dispatch)
+
+        self.dispatched_count += 1
+        self.callback(item, queued)
+
+    # Counters since the queue was made, max_depth since the last call
+    def metrics(self):
+        ret = {"policy": self.policy, "depth": len(self.items), "max_depth": self.max_depth, "queued": self.queued_count, "dispatched": self.dispatched_count, "dropped": self.dropped_count}
+        self.max_depth = len(self.items)
+        return ret
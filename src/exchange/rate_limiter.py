@@ -0,0 +1,153 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+# Priority lanes, lower goes first when there isn't enough budget for everyone
+PRIORITY_CANCEL = 0
+PRIORITY_RECONCILE = 1
+PRIORITY_QUOTE = 2
+
+# Requests per second and burst size of each rate limit tier
+RATE_LIMITS = {
+    "public": (3, 3),
+    "private": (5, 5),
+}
+
+# Token bucket that refills continuously at rate tokens/s up to burst tokens.
+# The token count is worked out from the monotonic clock whenever it is looked at,
+# so nothing has to run in the background to add tokens.
+class TokenBucket:
+    def __init__(self, rate, burst, clock=time.monotonic):
+        if rate <= 0 or burst <= 0:
+            raise Exception("rate and burst must be positive, got rate({}) burst({})".format(rate, burst))
+
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Take tokens if we have them, never waits
+    def take(self, tokens=1):
+        self.refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def available(self, tokens=1):
+        self.refill()
+        return self.tokens >= tokens
+
+    # Seconds until tokens will be available
+    def wait_time(self, tokens=1):
+        self.refill()
+        return max(tokens - self.tokens, 0) / self.rate
+
+# Awaitable rate limiter with one token bucket per tier and priority lanes within a tier.
+# acquire() returns straight away while there is budget and nobody is waiting. Otherwise the
+# caller waits in line by (priority, arrival order), and a single loop.call_later timer per
+# tier wakes the line up when the bucket will have enough tokens for the head of it.
+# Tokens are spent once granted, there is nothing to release.
+class RateLimiter:
+    def __init__(self, limits=RATE_LIMITS, clock=time.monotonic):
+        self.buckets = {}
+        self.waiters = {}
+        self.timers = {}
+        self.stats = {}
+        for tier, (rate, burst) in limits.items():
+            self.buckets[tier] = TokenBucket(rate, burst, clock)
+            self.waiters[tier] = []
+            self.timers[tier] = None
+            self.stats[tier] = {"granted": 0, "tokens": 0, "waited": 0, "wait_total": 0.0, "wait_max": 0.0, "cancelled": 0}
+
+        self.clock = clock
+        self.seq = itertools.count()
+
+    async def acquire(self, tokens=1, priority=PRIORITY_QUOTE, tier="private"):
+        bucket = self.buckets[tier]
+        stats = self.stats[tier]
+        if tokens > bucket.burst:
+            raise Exception("can't acquire {} tokens from the {} tier with a burst of {}".format(tokens, tier, bucket.burst))
+
+        # Fast path, nobody is waiting and we have the budget
+        if not self.waiters[tier] and bucket.take(tokens):
+            stats["granted"] += 1
+            stats["tokens"] += tokens
+            return
+
+        start = self.clock()
+        await self.queue(tokens, priority, tier, True)
+
+        waited = self.clock() - start
+        stats["granted"] += 1
+        stats["tokens"] += tokens
+        stats["waited"] += 1
+        stats["wait_total"] += waited
+        stats["wait_max"] = max(stats["wait_max"], waited)
+
+    # Wait in line until there is budget for tokens without spending them, for callers that
+    # want to decide what to send only once it can actually go out
+    async def wait(self, tokens=1, priority=PRIORITY_QUOTE, tier="private"):
+        if not self.waiters[tier] and self.buckets[tier].available(tokens):
+            return
+        await self.queue(tokens, priority, tier, False)
+
+    async def queue(self, tokens, priority, tier, take):
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters[tier], (priority, next(self.seq), tokens, take, fut))
+        self.wake(tier)
+
+        try:
+            await fut
+        except asyncio.CancelledError:
+            self.stats[tier]["cancelled"] += 1
+            raise
+
+    # Serve the front of the line for as long as the bucket allows, then set a timer for the rest
+    def wake(self, tier):
+        bucket = self.buckets[tier]
+        waiters = self.waiters[tier]
+        while waiters:
+            _, _, tokens, take, fut = waiters[0]
+            if fut.done():
+                heapq.heappop(waiters)
+            elif (take and bucket.take(tokens)) or (not take and bucket.available(tokens)):
+                heapq.heappop(waiters)
+                fut.set_result(None)
+            else:
+                break
+
+        if waiters and self.timers[tier] is None:
+            loop = asyncio.get_running_loop()
+            self.timers[tier] = loop.call_later(bucket.wait_time(waiters[0][2]), self.on_timer, tier)
+
+    def on_timer(self, tier):
+        self.timers[tier] = None
+        self.wake(tier)
+
+    # Token level metrics of every tier
+    def metrics(self):
+        ret = {}
+        for tier, bucket in self.buckets.items():
+            bucket.refill()
+            ret[tier] = dict(self.stats[tier])
+            ret[tier]["available"] = bucket.tokens
+            ret[tier]["queued"] = len([w for w in self.waiters[tier] if not w[-1].done()])
+        return ret
+
+    # Stop the timers and fail anyone still waiting
+    def close(self):
+        for tier in self.buckets:
+            if self.timers[tier] is not None:
+                self.timers[tier].cancel()
+                self.timers[tier] = None
+            for waiter in self.waiters[tier]:
+                waiter[-1].cancel()
+            self.waiters[tier] = []
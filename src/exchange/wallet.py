@@ -0,0 +1,150 @@
+# Our balances, changed only by what happens to our orders, from a single thread:
+#   place   a limit order puts funds on hold (the quote currency for a buy, the base currency for a sell)
+#   fill    our resting order traded, its hold is used up and we receive the other currency less the fee
+#   trade   we took liquidity without a resting order (market orders)
+#   cancel  whatever the order still had on hold becomes available again
+# The live exchange feeds it the user channel through on_message, the backtester calls the methods directly.
+# available, hold and balance are plain dicts that are updated in place, so references to them stay current.
+class Wallet:
+    def __init__(self):
+        self.available = {}
+        self.hold = {}
+        self.balance = {}
+
+        # Orders we put funds on hold for, order id -> [product_id, side, price, remaining size]
+        self.orders = {}
+
+        # Bumped on every change, tells a snapshot apart from changes made while it was being fetched
+        self.version = 0
+
+        self.reconcile_count = 0
+        self.skipped_count = 0
+        self.skipped_in_row = 0
+        self.drift = {}
+        self.max_drift = {}
+
+    def set(self, currency, available, hold):
+        self.available[currency] = available
+        self.hold[currency] = hold
+        self.balance[currency] = available + hold
+        self.version += 1
+
+    def add(self, currency, available=0.0, hold=0.0):
+        self.available[currency] = self.available.get(currency, 0.0) + available
+        self.hold[currency] = self.hold.get(currency, 0.0) + hold
+        self.balance[currency] = self.available[currency] + self.hold[currency]
+
+    # Currency and amount an order of size at price puts on hold
+    def held(self, product_id, side, price, size):
+        target, base = product_id.split("-")
+        if side == "buy":
+            return base, price * size
+        elif side == "sell":
+            return target, size
+        raise Exception("side argument must be either buy or sell")
+
+    def place(self, order_id, product_id, side, price, size):
+        currency, amount = self.held(product_id, side, price, size)
+        self.add(currency, available=-amount, hold=amount)
+        self.orders[order_id] = [product_id, side, price, size]
+        self.version += 1
+
+    def fill(self, order_id, price, size, fee):
+        order = self.orders.get(order_id)
+        if order is None:
+            return False
+
+        product_id, side, order_price, remaining = order
+        target, base = product_id.split("-")
+        currency, amount = self.held(product_id, side, order_price, size)
+        self.add(currency, hold=-amount)
+        if side == "buy":
+            self.add(target, available=size)
+            self.add(base, available=-fee)
+        else:
+            self.add(base, available=price * size - fee)
+
+        order[3] = remaining - size
+        self.version += 1
+        return True
+
+    def trade(self, product_id, side, price, size, fee):
+        target, base = product_id.split("-")
+        if side == "buy":
+            self.add(base, available=-price * size)
+            self.add(target, available=size)
+        elif side == "sell":
+            self.add(target, available=-size)
+            self.add(base, available=price * size)
+        else:
+            raise Exception("side argument must be either buy or sell")
+
+        self.add(base, available=-fee)
+        self.version += 1
+
+    def cancel(self, order_id):
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return False
+
+        product_id, side, price, remaining = order
+        currency, amount = self.held(product_id, side, price, remaining)
+        self.add(currency, available=amount, hold=-amount)
+        self.version += 1
+        return True
+
+    # Apply a user channel message about our orders
+    def on_message(self, msg):
+        msg_type = msg["type"]
+        if msg_type == "received":
+            # Market orders never rest, their funds are only held for as long as they take to match
+            if msg.get("order_type") == "limit":
+                self.place(msg["order_id"], msg["product_id"], msg["side"], float(msg["price"]), float(msg["size"]))
+
+        elif msg_type == "match":
+            size = float(msg["size"])
+            price = float(msg["price"])
+            if "maker_fee_rate" in msg:
+                self.fill(msg["maker_order_id"], price, size, price * size * float(msg["maker_fee_rate"]))
+            elif "taker_fee_rate" in msg:
+                # The match side is the maker's, we were on the other side of it
+                side = "sell" if msg["side"] == "buy" else "buy"
+                if not self.fill(msg["taker_order_id"], price, size, price * size * float(msg["taker_fee_rate"])):
+                    self.trade(msg["product_id"], side, price, size, price * size * float(msg["taker_fee_rate"]))
+
+        elif msg_type == "change":
+            order = self.orders.get(msg["order_id"])
+            if order is not None and "new_size" in msg:
+                # Release the part of the hold the smaller order no longer needs
+                shrink = float(msg["old_size"]) - float(msg["new_size"])
+                currency, amount = self.held(order[0], order[1], order[2], shrink)
+                self.add(currency, available=amount, hold=-amount)
+                order[3] -= shrink
+                self.version += 1
+
+        elif msg_type == "done":
+            self.cancel(msg["order_id"])
+
+    # Overwrite our balances with a REST account snapshot of currency -> (available, hold) fetched while
+    # the wallet was at version. Returns the drift of every currency, or None if our orders changed the
+    # wallet in the meantime so the snapshot can't be compared against it. After max_skips snapshots in
+    # a row were skipped the next one is taken anyway, so a busy wallet can't drift forever
+    def reconcile(self, accounts, version, max_skips=5):
+        if version != self.version and self.skipped_in_row < max_skips:
+            self.skipped_count += 1
+            self.skipped_in_row += 1
+            return None
+        self.skipped_in_row = 0
+
+        drift = {}
+        for currency, (available, hold) in accounts.items():
+            drift[currency] = (available + hold) - self.balance.get(currency, 0.0)
+            self.max_drift[currency] = max(self.max_drift.get(currency, 0.0), abs(drift[currency]))
+            self.set(currency, available, hold)
+
+        self.drift = drift
+        self.reconcile_count += 1
+        return drift
+
+    def metrics(self):
+        return {"reconciles": self.reconcile_count, "skipped": self.skipped_count, "drift": dict(self.drift), "max_drift": dict(self.max_drift), "orders": len(self.orders)}
@@ -0,0 +1,85 @@
+import math
+import time
+
+# Histogram buckets are a fixed ratio apart starting at 1us, BUCKETS_PER_OCTAVE buckets per doubling
+# gives percentiles to within about 9%, which is plenty to tell where the time goes
+MIN_LATENCY = 10**-6
+BUCKETS_PER_OCTAVE = 8
+OCTAVES = 28
+
+# Histogram of latencies in seconds with log spaced buckets, recording is O(1) and never allocates
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = [0] * (BUCKETS_PER_OCTAVE * OCTAVES)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds > MIN_LATENCY:
+            i = min(int(math.log2(seconds / MIN_LATENCY) * BUCKETS_PER_OCTAVE), len(self.buckets) - 1)
+        else:
+            i = 0
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    # Upper edge of the bucket the q quantile falls in, never more than the largest latency seen
+    def percentile(self, q):
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n > 0:
+                # The last bucket has no upper edge
+                if i == len(self.buckets) - 1:
+                    return self.max
+                return min(MIN_LATENCY * 2**((i + 1) / BUCKETS_PER_OCTAVE), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count > 0 else None
+
+# Latency histograms of the stages on the way from a tick arriving to our order reaching the exchange,
+# one per (stage, product id). Timestamps all come from time.monotonic:
+#   decode        websocket message received -> decoded into a Tick
+#   dispatch      tick queued -> handed to the agents
+#   on_tick       TradingAgent.on_tick start -> end
+#   quote_wait    waiting for rate budget before the agent decides what to send
+#   tick_to_send  tick received -> order request made
+#   rate_limit    REST request waiting on the rate limiter
+#   rest          REST request sent -> response
+#   tick_to_ack   tick received -> exchange answered the order request
+# report() sums up and resets the histograms, so each report covers the time since the last one
+class LatencyTracker:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.histograms = {}
+
+    def now(self):
+        return self.clock()
+
+    def record(self, stage, product_id, seconds):
+        key = (stage, product_id)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = LatencyHistogram()
+            self.histograms[key] = histogram
+        histogram.record(seconds)
+
+    # Time from start until now
+    def since(self, stage, product_id, start):
+        self.record(stage, product_id, self.clock() - start)
+
+    # (stage, product_id) -> {"count", "p50", "p99", "max"} in seconds
+    def report(self):
+        ret = {}
+        for key, histogram in sorted(self.histograms.items()):
+            ret[key] = {"count": histogram.count, "p50": histogram.percentile(0.5), "p99": histogram.percentile(0.99), "max": histogram.max}
+        self.histograms = {}
+        return ret
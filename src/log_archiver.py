@@ -0,0 +1,106 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import multiprocessing as mp
+import os
+import os.path as pth
+import shutil
+import subprocess as subp
+import tarfile
+import time
+
+# Upload attempts before an archive is given up on, and the backoff between them in seconds
+UPLOAD_ATTEMPTS = 5
+UPLOAD_BACKOFF = 2.0
+UPLOAD_MAX_BACKOFF = 60.0
+
+# File wrapper that hashes everything written through it, so the archive is hashed as it is made
+class HashingWriter:
+    def __init__(self, fp):
+        self.fp = fp
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.fp.write(data)
+
+    def flush(self):
+        self.fp.flush()
+
+# Compress folder into folder.tar.gz, streaming so no file is ever read into memory whole.
+# Returns the archive path and its sha256
+def archive_folder(folder):
+    folder = folder.rstrip(os.sep)
+    archive = "{}.tar.gz".format(folder)
+    with open(archive, "wb") as f:
+        writer = HashingWriter(f)
+        with tarfile.open(fileobj=writer, mode="w:gz") as tar:
+            tar.add(folder, arcname=pth.basename(folder))
+    return archive, writer.sha256.hexdigest()
+
+# Uploads archives to Storj with the uplink cli, the sha256 goes along as metadata
+class UplinkBackend:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def upload(self, archive, cksum):
+        r = subp.run(["uplink", "cp", "--metadata", '{"cksum":"' + cksum + '"}', archive, "sj://{}".format(self.drive)], stdout=subp.DEVNULL, stderr=subp.PIPE)
+        if r.returncode != 0:
+            raise Exception("uplink cp failed with code {}: {}".format(r.returncode, r.stderr.decode(errors="replace").strip()))
+
+# Copies archives into a local folder with the sha256 in a .sha256 file next to each, a stand in for
+# a real upload when testing or running without Storj
+class LocalDirBackend:
+    def __init__(self, path):
+        self.path = path
+
+    def upload(self, archive, cksum):
+        os.makedirs(self.path, exist_ok=True)
+        shutil.copy(archive, self.path)
+        with open(pth.join(self.path, pth.basename(archive) + ".sha256"), "w") as f:
+            f.write("{}  {}\n".format(cksum, pth.basename(archive)))
+
+# Upload with exponential backoff between attempts, returns how many attempts it took.
+# Raises the last error if every attempt failed
+def upload_with_retry(backend, archive, cksum, attempts=UPLOAD_ATTEMPTS, backoff=UPLOAD_BACKOFF, max_backoff=UPLOAD_MAX_BACKOFF, sleep=time.sleep):
+    delay = backoff
+    for attempt in range(1, attempts + 1):
+        try:
+            backend.upload(archive, cksum)
+            return attempt
+        except Exception:
+            if attempt == attempts:
+                raise
+            sleep(delay)
+            delay = min(delay * 2, max_backoff)
+
+# Everything that happens to a log folder once we are done writing to it, runs in the worker process.
+# The folder is only deleted once its archive is safely uploaded
+def archive_and_upload(folder, backend, attempts=UPLOAD_ATTEMPTS, backoff=UPLOAD_BACKOFF):
+    archive, cksum = archive_folder(folder)
+    tries = upload_with_retry(backend, archive, cksum, attempts, backoff)
+    shutil.rmtree(folder)
+    return {"folder": folder, "archive": archive, "sha256": cksum, "attempts": tries}
+
+# Archives and uploads old log folders in a background worker process, so compressing, hashing and
+# uploading never hold up the loop. Jobs run one at a time in the order they were submitted.
+# The worker is started with spawn, forking a process that has threads running isn't safe
+class LogArchiver:
+    def __init__(self, backend, attempts=UPLOAD_ATTEMPTS, backoff=UPLOAD_BACKOFF):
+        self.backend = backend
+        self.attempts = attempts
+        self.backoff = backoff
+        self.executor = None
+        self.closed = False
+
+    # Returns a concurrent.futures.Future of the archive_and_upload result
+    def submit(self, folder):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn"))
+        return self.executor.submit(archive_and_upload, folder, self.backend, self.attempts, self.backoff)
+
+    # Waits for the jobs that were submitted to finish
+    def close(self):
+        if not self.closed:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+            self.closed = True
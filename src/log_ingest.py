@@ -0,0 +1,149 @@
+from src.exchange.backtest.tick_columns import TickColumns, SIDE_BUY, SIDE_SELL
+from src.exchange.backtest.tick_store import write_tick_chunks
+
+import argparse
+import glob
+import os
+import os.path as pth
+import re
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import pandas as pd
+
+# Bytes of info.log parsed at a time, matching a whole block with one regex is far quicker than line by line
+BLOCK_SIZE = 16 * 1024 * 1024
+
+# Tick lines were logged under the CBProExchange prefix before they moved to TickerClient, any prefix is taken
+TICK_RE = re.compile(rb"^\[INFO\]\[[^\]\n]*?,(\d{8}_\d{6})\]:tick product_id\(([^)\n]*)\) tick_price_changes\([^)\n]*\) "
+                     rb"price\(([^)\n]*)\) taker_side\((buy|sell)\) size\(([^)\n]*)\) bid\(([^)\n]*)\) ask\(([^)\n]*)\)", re.M)
+FILL_RE = re.compile(rb"^\[INFO\]\[(?:Buyer|Seller),([^,\]\n]+),(\d{8}_\d{6})\]:fill size\(([^)\n]*)\) price\(([^)\n]*)\) "
+                     rb"side\((buy|sell)\) maker_fee_rate\(([^)\n]*)\)", re.M)
+
+TICK_KEYS = ["time", "price", "size", "taker_side", "bid", "ask"]
+FILL_KEYS = ["time", "size", "price", "side", "maker_fee_rate"]
+
+# Log lines only have a time to the second, in the time zone of the machine that wrote them
+def log_time_parser(utc_offset_hours):
+    offset = int(utc_offset_hours * 3600 * 1000)
+    cache = {}
+
+    def parse(value):
+        t = cache.get(value)
+        if t is None:
+            t = int(datetime.strptime(value.decode(), "%Y%m%d_%H%M%S").replace(tzinfo=timezone.utc).timestamp() * 1000) - offset
+            cache[value] = t
+        return t
+    return parse
+
+# Lines of info.log members of a tar.gz in blocks that end on a line break, without extracting it to disk
+def read_info_blocks(path, block_size=BLOCK_SIZE):
+    with tarfile.open(path, "r|gz") as tar:
+        for member in tar:
+            if not member.isfile() or pth.basename(member.name) != "info.log":
+                continue
+
+            f = tar.extractfile(member)
+            rest = b""
+            while True:
+                data = f.read(block_size)
+                if not data:
+                    break
+                data = rest + data
+                cut = data.rfind(b"\n") + 1
+                rest = data[cut:]
+                if cut > 0:
+                    yield data[:cut]
+            if rest:
+                yield rest + b"\n"
+
+# Number every row by how many identical rows came before it in the same archive. Overlapping archives
+# repeat the same rows with the same numbers, while trades that really did repeat within a second keep apart
+def number_repeats(df):
+    df["repeat"] = df.groupby(list(df.columns), sort=False).cumcount()
+    return df
+
+# Parse the tick and fill lines of one archive, runs in a worker process.
+# Returns (line count, product id -> ticks DataFrame, product id -> fills DataFrame)
+def parse_archive(path, utc_offset_hours=0.0, block_size=BLOCK_SIZE):
+    parse_time = log_time_parser(utc_offset_hours)
+    ticks = {}
+    fills = {}
+    lines = 0
+
+    for block in read_info_blocks(path, block_size):
+        lines += block.count(b"\n")
+        for t, product_id, price, side, size, bid, ask in TICK_RE.findall(block):
+            ticks.setdefault(product_id.decode(), []).append((parse_time(t), float(price), float(size),
+                                                              SIDE_BUY if side == b"buy" else SIDE_SELL, float(bid), float(ask)))
+        for product_id, t, size, price, side, fee in FILL_RE.findall(block):
+            fills.setdefault(product_id.decode(), []).append((parse_time(t), float(size), float(price), side.decode(), float(fee)))
+
+    tick_frames = {p: number_repeats(pd.DataFrame(rows, columns=TICK_KEYS)) for p, rows in ticks.items()}
+    fill_frames = {p: number_repeats(pd.DataFrame(rows, columns=FILL_KEYS)) for p, rows in fills.items()}
+    return lines, tick_frames, fill_frames
+
+# Stack the frames of one product from every archive, drop the rows repeated by overlapping archives and sort
+# by time. Archives are given in time order, so rows within a second stay in the order they were logged
+def merge_frames(frames, keys):
+    df = pd.concat(frames, ignore_index=True).drop_duplicates(keys + ["repeat"])
+    return df.sort_values("time", kind="stable").drop(columns="repeat").reset_index(drop=True)
+
+# Parse archives across a process pool and write for each product:
+#   out/ticks_<product>        TickStore of its ticks, avg_price is the trade price
+#   out/fills_<product>.csv    our fills (time, size, price, side, maker_fee_rate)
+# Returns the line count, seconds taken and lines per second
+def ingest(paths, out, workers=None, utc_offset_hours=0.0):
+    start = time.monotonic()
+    paths = sorted(paths, key=pth.basename)
+
+    lines = 0
+    ticks = {}
+    fills = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for n, tick_frames, fill_frames in pool.map(parse_archive, paths, [utc_offset_hours] * len(paths)):
+            lines += n
+            for product_id, df in tick_frames.items():
+                ticks.setdefault(product_id, []).append(df)
+            for product_id, df in fill_frames.items():
+                fills.setdefault(product_id, []).append(df)
+
+    os.makedirs(out, exist_ok=True)
+    tick_counts = {}
+    for product_id, frames in sorted(ticks.items()):
+        df = merge_frames(frames, TICK_KEYS)
+        columns = TickColumns(time=df["time"].to_numpy(), price=df["price"].to_numpy(), size=df["size"].to_numpy(), taker_side=df["taker_side"].to_numpy(),
+                              bid=df["bid"].to_numpy(), ask=df["ask"].to_numpy(), avg_price=df["price"].to_numpy())
+        write_tick_chunks([columns], pth.join(out, "ticks_{}".format(product_id)))
+        tick_counts[product_id] = len(df)
+
+    fill_counts = {}
+    for product_id, frames in sorted(fills.items()):
+        df = merge_frames(frames, FILL_KEYS)
+        df.to_csv(pth.join(out, "fills_{}.csv".format(product_id)), index=False)
+        fill_counts[product_id] = len(df)
+
+    seconds = time.monotonic() - start
+    return {"archives": len(paths), "lines": lines, "seconds": seconds, "lines_per_sec": lines / seconds if seconds > 0 else 0.0,
+            "ticks": tick_counts, "fills": fill_counts}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('archives', nargs='+', help='logs_*.tar.gz archives, or folders to look for them in')
+    parser.add_argument('--output', '-o', default='ingested', help='folder to write the tick stores and fill csvs to')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='number of worker processes (default: cpu count)')
+    parser.add_argument('--utc-offset', type=float, default=0.0, help='hours ahead of UTC the clock that wrote the logs was')
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.archives:
+        if pth.isdir(path):
+            paths += glob.glob(pth.join(path, "logs_*.tar.gz"))
+        else:
+            paths.append(path)
+
+    stats = ingest(paths, args.output, workers=args.workers, utc_offset_hours=args.utc_offset)
+    for product_id in sorted(set(stats["ticks"]) | set(stats["fills"])):
+        print("{} ticks({}) fills({})".format(product_id, stats["ticks"].get(product_id, 0), stats["fills"].get(product_id, 0)))
+    print("parsed {} lines from {} archives in {:.1f}s, {:.0f} lines/sec".format(stats["lines"], stats["archives"], stats["seconds"], stats["lines_per_sec"]))
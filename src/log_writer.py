@@ -0,0 +1,175 @@
+import collections as col
+import os.path as pth
+import threading
+import time
+from datetime import datetime
+
+# Levels of the records the writer gets, the same values as the LOG_* levels of the Logger
+LOG_ERROR = 1
+LOG_WARN  = 2
+LOG_INFO  = 3
+
+# Level of the record that moves the writer to new files, it isn't a line
+SWAP = 0
+
+TAGS = {LOG_ERROR: "ERR", LOG_WARN: "WARN", LOG_INFO: "INFO"}
+
+# Records that can wait to be written before new ones are dropped
+MAX_QUEUE = 100000
+
+# Seconds the writer thread sleeps between batches
+FLUSH_INTERVAL = 0.1
+
+# A message that doesn't match its args is still logged, with the args after it
+def format_msg(msg, args):
+    if not args:
+        return msg
+    try:
+        return msg.format(*args)
+    except (IndexError, KeyError, ValueError, AttributeError):
+        return "{} {}".format(msg, args)
+
+# Writes log records to info.log, warn.log and error.log of a log folder from a background thread.
+# Callers only append a raw (level, prefix, time, msg, args) record to a bounded deque, the writer thread
+# formats them and writes each file once per batch:
+#   info.log   every record
+#   warn.log   warnings and errors
+#   error.log  errors
+# Lines look like "[INFO][prefix,%Y%m%d_%H%M%S]:msg", with msg.format(*args) as the msg when there are args.
+# msg and args are only turned into a string by the writer, so they should not be changed after they are
+# logged. console echoes every line to stdout as well.
+# When the queue is full new records are dropped and counted, logging never blocks the caller
+class LogWriter:
+    def __init__(self, log_folder, console=True, max_queue=MAX_QUEUE, flush_interval=FLUSH_INTERVAL):
+        self.console = console
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+
+        self.records = col.deque()
+        self.wake = threading.Event()
+
+        self.info_fp, self.warn_fp, self.error_fp = self.open_files(log_folder)
+
+        self.queued_count = 0
+        self.written_count = 0
+        self.dropped_count = 0
+        self.batch_count = 0
+        self.max_depth = 0
+
+        # Formatting the time is one of the slower parts of a line, it only changes once a second
+        self.last_second = None
+        self.last_time = None
+
+        self.stop = False
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="LogWriter", daemon=True)
+        self.thread.start()
+
+    def open_files(self, log_folder):
+        return open(pth.join(log_folder, "info.log"), "w"), open(pth.join(log_folder, "warn.log"), "w"), open(pth.join(log_folder, "error.log"), "w")
+
+    def close_files(self):
+        self.info_fp.close()
+        self.warn_fp.close()
+        self.error_fp.close()
+
+    # Called from any thread
+    def write(self, level, prefix, msg, args=()):
+        depth = len(self.records)
+        if depth >= self.max_queue:
+            self.dropped_count += 1
+            return
+
+        self.records.append((level, prefix, time.time(), msg, args))
+        self.queued_count += 1
+        if depth >= self.max_depth:
+            self.max_depth = depth + 1
+
+    def run(self):
+        while not self.stop:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+        self.flush()
+
+    # Write out everything queued so far
+    def flush(self):
+        self.write_batch()
+
+    def write_batch(self):
+        records = self.records
+        if not records:
+            return
+
+        info = []
+        warn = []
+        error = []
+        # Only take what is there now, records added meanwhile wait for the next batch
+        for _ in range(len(records)):
+            record = records.popleft()
+            if record[0] == SWAP:
+                # Everything before the swap goes to the old files, they are done with after that
+                self.write_lines(info, warn, error)
+                info, warn, error = [], [], []
+                self.close_files()
+                _, files, on_closed = record
+                self.info_fp, self.warn_fp, self.error_fp = files
+                if on_closed is not None:
+                    on_closed()
+                continue
+
+            level, prefix, t, msg, args = record
+
+            second = int(t)
+            if second != self.last_second:
+                self.last_second = second
+                self.last_time = datetime.fromtimestamp(second).strftime("%Y%m%d_%H%M%S")
+
+            line = "[{}][{},{}]:{}\n".format(TAGS[level], prefix, self.last_time, format_msg(msg, args))
+            info.append(line)
+            if level <= LOG_WARN:
+                warn.append(line)
+                if level == LOG_ERROR:
+                    error.append(line)
+
+        self.write_lines(info, warn, error)
+        self.batch_count += 1
+
+    def write_lines(self, info, warn, error):
+        if not info:
+            return
+
+        self.info_fp.write("".join(info))
+        self.info_fp.flush()
+        if warn:
+            self.warn_fp.write("".join(warn))
+            self.warn_fp.flush()
+        if error:
+            self.error_fp.write("".join(error))
+            self.error_fp.flush()
+        if self.console:
+            print("".join(info), end="", flush=True)
+
+        self.written_count += len(info)
+
+    # Carry on in log_folder. Only the new files are opened here, the writer thread finishes writing what
+    # was queued before to the old files, closes them and then calls on_closed from its thread.
+    # The swap is queued even when the queue is full, it is never dropped
+    def swap(self, log_folder, on_closed=None):
+        files = self.open_files(log_folder)
+        self.records.append((SWAP, files, on_closed))
+        self.wake.set()
+
+    def close(self):
+        if not self.closed:
+            self.stop = True
+            self.wake.set()
+            self.thread.join()
+            self.close_files()
+            self.closed = True
+
+    # Counters since the writer was made, max_depth since the last call
+    def metrics(self):
+        ret = {"depth": len(self.records), "max_depth": self.max_depth, "queued": self.queued_count, "written": self.written_count, "dropped": self.dropped_count, "batches": self.batch_count}
+        self.max_depth = len(self.records)
+        return ret
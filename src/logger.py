@@ -3,23 +3,57 @@ import os.path as pth
 import sys
 from datetime import datetime
 import pickle as pkl
-import subprocess as subp
-import shutil
 import copy
-import hashlib
 import asyncio
+import functools
+import re
+from src.log_archiver import LogArchiver, UplinkBackend, LocalDirBackend
+from src.log_writer import LogWriter, TAGS, LOG_ERROR, LOG_WARN, LOG_INFO, format_msg
 
-LOG_ERROR = 1
-LOG_WARN  = 2
-LOG_INFO  = 3
 LOG_OFF   = 4
 
+LEVEL_NAMES = {"ERROR": LOG_ERROR, "WARN": LOG_WARN, "INFO": LOG_INFO, "OFF": LOG_OFF}
+
+# Log levels of components from a string like "TickerClient=WARN,Buyer=INFO,*=INFO". A component is
+# the part of a prefix before the first comma (Buyer for "Buyer,BTC-USD"), a whole prefix can be given
+# as well, and * sets the level of everything else
+def parse_levels(spec):
+    levels = {}
+    # Prefixes can have commas in them, so an item only ends at the comma after its level
+    end = 0
+    for match in re.finditer(r"\s*([^=]+?)\s*=\s*(\w+)\s*(,|$)", spec):
+        if match.start() != end:
+            break
+        end = match.end()
+
+        component, name = match.group(1), match.group(2).upper()
+        if name not in LEVEL_NAMES:
+            raise Exception("log level must be one of {}, got {}".format(list(LEVEL_NAMES), name))
+        levels[component] = LEVEL_NAMES[name]
+
+    if spec[end:].strip() != "":
+        raise Exception("log levels look like component=LEVEL, got {}".format(spec[end:]))
+    return levels
+
 class Logger:
-    def __init__(self):
+    # Lines are written out by a background LogWriter. console echoes them to stdout too,
+    # it defaults to the optional LOG_CONSOLE system variable and is on without it.
+    # levels is a dict of component -> LOG_* level or a string for parse_levels, it defaults
+    # to the optional LOG_LEVELS system variable and everything is logged at INFO without it.
+    # Old log folders are archived and handed to backend for upload, by default an UplinkBackend
+    # to LOG_DRIVE, or a LocalDirBackend when the optional LOG_ARCHIVE_DIR system variable is set
+    def __init__(self, console=None, levels=None, backend=None):
         self.opened = False
         self.closed = False
 
-        self.log_drive = self.get_system_variable("LOG_DRIVE")
+        if levels is None:
+            levels = os.environ.get("LOG_LEVELS", "")
+        if isinstance(levels, str):
+            levels = parse_levels(levels)
+        self.levels = levels
+
+        # Level of every prefix we have seen, worked out once
+        self.prefix_levels = {}
 
         self.log_folder = pth.join(os.getcwd(), "logs_{}".format(datetime.now().strftime("%Y%m%d_%H%M%S")))
         self.info_path = pth.join(self.log_folder, "info.log")
@@ -28,15 +62,23 @@ class Logger:
 
         os.mkdir(self.log_folder)
 
-        self.info_fp = open(self.info_path, "w")
-        self.warn_fp = open(self.warn_path, "w")
-        self.error_fp = open(self.error_path, "w")
+        if console is None:
+            console = os.environ.get("LOG_CONSOLE", "1").lower() not in ("0", "false", "no")
+        self.writer = LogWriter(self.log_folder, console)
+
+        if backend is None:
+            if "LOG_ARCHIVE_DIR" in os.environ:
+                backend = LocalDirBackend(os.environ["LOG_ARCHIVE_DIR"])
+            else:
+                self.log_drive = self.get_system_variable("LOG_DRIVE")
+                backend = UplinkBackend(self.log_drive)
+        self.archiver = LogArchiver(backend)
 
     def get_system_variable(self, name):
         try:
             return os.environ[name]
         except KeyError:
-            self.log_warn("Logger", '"{}" does not exist!'.format(name))
+            self.log_warn("Logger", '"{}" does not exist!', name)
             val = input("{}:".format(name))
             return val
 
@@ -52,52 +94,72 @@ class Logger:
     def __del__(self):
         self.close()
 
-    # Tear down object
-    def close(self):
+    # Tear down object, everything logged so far is written out first. With save the current
+    # log folder is archived as well, either way we wait for the archiver to finish its jobs
+    def close(self, save=False):
         if not self.closed:
-            self.info_fp.close()
-            self.warn_fp.close()
-            self.error_fp.close()
+            self.writer.close()
+            if save:
+                self.save_logs(self.log_folder)
+            self.archiver.close()
 
             self.closed = True
 
-    def log_error(self, prefix, msg):
-        time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        line = "[ERR][{},{}]:{}\n".format(prefix, time, msg)
-
-        print(line[:-1])
-        self.error_fp.write(line)
-        self.warn_fp.write(line)
-        self.info_fp.write(line)
-
-    def log_warn(self, prefix, msg):
-        time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        line = "[WARN][{},{}]:{}\n".format(prefix, time, msg)
-
-        print(line[:-1])
-        self.warn_fp.write(line)
-        self.info_fp.write(line)
-
-    def log_info(self, prefix, msg):
-        time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        line = "[INFO][{},{}]:{}\n".format(prefix, time, msg)
-
-        print(line[:-1])
-        self.info_fp.write(line)
-
+    # Most detailed level logged for prefix, 0 when it is LOG_OFF since nothing is logged then
+    def prefix_level(self, prefix):
+        level = self.prefix_levels.get(prefix)
+        if level is None:
+            component = prefix.split(",")[0]
+            level = self.levels.get(prefix, self.levels.get(component, self.levels.get("*", LOG_INFO)))
+            if level == LOG_OFF:
+                level = 0
+            self.prefix_levels[prefix] = level
+        return level
+
+    def enabled(self, prefix, level):
+        return level <= self.prefix_level(prefix)
+
+    # msg is only formatted with args if the line is logged at all, and then by the writer thread.
+    # Once closed there is nowhere left to write to, lines only go to the console
+    def log(self, level, prefix, msg, args):
+        if level > self.prefix_level(prefix):
+            return
+
+        if self.closed:
+            print("[{}][{},{}]:{}".format(TAGS[level], prefix, datetime.now().strftime("%Y%m%d_%H%M%S"), format_msg(msg, args)))
+        else:
+            self.writer.write(level, prefix, msg, args)
+
+    def log_error(self, prefix, msg, *args):
+        self.log(LOG_ERROR, prefix, msg, args)
+
+    def log_warn(self, prefix, msg, *args):
+        self.log(LOG_WARN, prefix, msg, args)
+
+    def log_info(self, prefix, msg, *args):
+        self.log(LOG_INFO, prefix, msg, args)
+
+    # Queue depth and drop counters of the log writer
+    def metrics(self):
+        return self.writer.metrics()
+
+    # Compress, hash and upload a log folder we are done with in the archiver's worker process,
+    # the folder is deleted once it is uploaded. Called from the loop or the writer thread
     def save_logs(self, log_folder_path):
-        # Compress old log folder and delete logs
-        old_log_compressed = "{}.tar.gz".format(log_folder_path)
-        subp.run(["tar", "cvzf", old_log_compressed, log_folder_path])
-
-        # Calculate checksum for archived logs
-        with open(old_log_compressed, "rb") as f:
-            cksum = hashlib.sha256(f.read()).hexdigest()
-    
-        # Backup logs to Storj and delete the log folder
-        subp.run(["uplink", "cp", "--metadata", '{\"cksum\":\"'+cksum+'\"}', old_log_compressed, "sj://{}".format(self.log_drive)])
-        shutil.rmtree(log_folder_path)
+        future = self.archiver.submit(log_folder_path)
+        future.add_done_callback(self.on_logs_saved)
+        return future
+
+    # Called from a thread of the archiver
+    def on_logs_saved(self, future):
+        try:
+            ret = future.result()
+            self.log_info("Logger", "archived {} sha256({}) attempts({})", ret["archive"], ret["sha256"], ret["attempts"])
+        except Exception as e:
+            self.log_error("Logger", "archiving logs failed: {}", repr(e))
 
+    # Runs on the loop, so only what has to happen at the switch is done here: the new files are opened
+    # and the writer thread hands the old folder to the archiver once it has written it out and closed it
     def new_log_folder(self):
         # Make data structure checkpoint before switching log folder
         self.make_checkpoint("end_chk.pkl")
@@ -110,18 +172,12 @@ class Logger:
 
         os.mkdir(self.log_folder)
 
-        self.close()
-
-        self.info_fp = open(self.info_path, "w")
-        self.warn_fp = open(self.warn_path, "w")
-        self.error_fp = open(self.error_path, "w")
+        # Lines logged so far go to the old folder, everything after to the new one
+        self.writer.swap(self.log_folder, functools.partial(self.save_logs, old_log_folder))
 
         # Make a checkpoint when we start the new log folder
         self.make_checkpoint("start_chk.pkl")
 
-        # Compress old log folder and delete logs
-        self.save_logs(old_log_folder)
-
         self.loop.call_later(15 * 60, self.new_log_folder)
 
     def make_checkpoint(self, fn):
@@ -193,16 +249,15 @@ class Logger:
     # and the only solution is to exit and restart
     def exception_handler(self, loop, context):
         # Try to close references to objects as nicely as possible
-        self.close()
         self.exchange.close()
 
-        # Upload last log folder we were just working on
-        self.save_logs(self.log_folder)
-        
-        # Print exception information
+        # Log exception information
         self.log_error("Main", "Exception handler called in asyncio")
         self.log_error("Main", context["message"])
-        self.log_error("Main", context["exception"])
+        self.log_error("Main", context.get("exception"))
+
+        # Write out and upload the log folder we were just working on, waits for the archiver
+        self.close(save=True)
 
         # Restart process
         sys.exit(1)
@@ -20,8 +20,7 @@ async def main(logger, exchange):
 
     all_threads_alive = True
     all_threads = threading.enumerate()
-    while loop.is_running() and all_threads_alive:
-        print("Active tasks count: ", len([task for task in asyncio.all_tasks() if not task.done()]))
+    while loop.is_running() and all_threads_alive and exchange.alive():
         all_threads_alive = True
         for thread in all_threads: 
             if not thread.is_alive():
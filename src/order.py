@@ -1,12 +1,35 @@
+import uuid
+
+# Lifecycle of an order we place:
+#   PENDING_NEW     request sent, no response yet
+#   OPEN            resting on the exchange
+#   PENDING_CANCEL  cancel sent, no response yet
+#   DONE            filled, cancelled or rejected, nothing more will happen to it
+PENDING_NEW = "pending_new"
+OPEN = "open"
+PENDING_CANCEL = "pending_cancel"
+DONE = "done"
+
 class Order:
-    def __init__(self, price=-1, order_id="", order_size=0, outstanding_order_size=0):
+    def __init__(self, price=-1, order_id="", order_size=0, outstanding_order_size=0, client_oid="", state=DONE):
         self.price = price
         self.order_id = order_id
         self.order_size = order_size
         self.outstanding_order_size = outstanding_order_size
+        self.client_oid = client_oid
+        self.state = state
+
+    # A new order we are about to send, identified by a client_oid until the exchange gives it an id
+    @classmethod
+    def pending(cls, price, order_size):
+        return cls(price=price, order_size=order_size, outstanding_order_size=order_size, client_oid=str(uuid.uuid4()), state=PENDING_NEW)
 
     def opened(self):
         return not self.order_id == ""
 
     def filled(self):
-        return abs(self.outstanding_order_size) < 10**-8
\ No newline at end of file
+        return abs(self.outstanding_order_size) < 10**-8
+
+    # Waiting on the exchange to tell us how a request for this order went
+    def in_flight(self):
+        return self.state == PENDING_NEW or self.state == PENDING_CANCEL
@@ -0,0 +1,42 @@
+# Market data records handed to the agents, decoded once from the feed with every number already a float.
+# __slots__ keeps them small and their attributes quick to reach, they are made for every tick
+
+# A trade printed on the exchange, with the top of the book at the time.
+# received is the time.monotonic() time the message came in, None when it didn't come from the live feed
+class Tick:
+    __slots__ = ("product_id", "price", "size", "taker_side", "best_bid", "best_ask", "received")
+
+    def __init__(self, product_id, price, size, taker_side, best_bid, best_ask, received=None):
+        self.product_id = product_id
+        self.price = price
+        self.size = size
+        self.taker_side = taker_side
+        self.best_bid = best_bid
+        self.best_ask = best_ask
+        self.received = received
+
+    @property
+    def maker_side(self):
+        return "sell" if self.taker_side == "buy" else "buy"
+
+    # From a ticker channel message, its side is the taker's
+    @classmethod
+    def from_ticker(cls, msg, received=None):
+        return cls(msg["product_id"], float(msg["price"]), float(msg["last_size"]), msg["side"], float(msg["best_bid"]), float(msg["best_ask"]), received)
+
+# One of our resting orders traded
+class Fill:
+    __slots__ = ("product_id", "maker_order_id", "side", "price", "size", "maker_fee_rate")
+
+    def __init__(self, product_id, maker_order_id, side, price, size, maker_fee_rate):
+        self.product_id = product_id
+        self.maker_order_id = maker_order_id
+        self.side = side
+        self.price = price
+        self.size = size
+        self.maker_fee_rate = maker_fee_rate
+
+    # From a user channel match message where we were the maker
+    @classmethod
+    def from_match(cls, msg):
+        return cls(msg["product_id"], msg.get("maker_order_id"), msg["side"], float(msg["price"]), float(msg["size"]), float(msg["maker_fee_rate"]))
@@ -0,0 +1,81 @@
+import math
+
+TICK_LOOKBACK_SAMPLES = 6
+
+# Rolling statistics of one product's tick prices, used by both the live feed and the backtester.
+# The tick to tick pct changes of the last lookback_samples prices are kept in a fixed size
+# ring buffer with running sums, so every update is O(1):
+#   mean_change()  mean pct change over the window (what the agents get as tick_price_changes)
+#   volatility()   standard deviation of the pct changes over the window
+#   ema            exponential moving average of the price
+class RollingStats:
+    def __init__(self, lookback_samples=TICK_LOOKBACK_SAMPLES, ema_span=None):
+        if lookback_samples < 2:
+            raise Exception("lookback_samples must be at least 2, got {}".format(lookback_samples))
+
+        if ema_span is None:
+            ema_span = lookback_samples
+
+        self.window = lookback_samples - 1
+        self.changes = [0.0] * self.window
+        self.pos = 0
+        self.count = 0
+        self.sum = 0.0
+        self.sum_sq = 0.0
+
+        self.last_price = None
+        self.ema_alpha = 2.0 / (ema_span + 1)
+        self.ema = None
+
+    # Per product settings come from the optional TICK_LOOKBACK_SAMPLES and EMA_SPAN config columns
+    @classmethod
+    def from_config(cls, config):
+        lookback_samples = config.get("TICK_LOOKBACK_SAMPLES")
+        ema_span = config.get("EMA_SPAN")
+
+        if lookback_samples is None or lookback_samples != lookback_samples:
+            lookback_samples = TICK_LOOKBACK_SAMPLES
+        if ema_span is not None and ema_span != ema_span:
+            ema_span = None
+
+        return cls(int(lookback_samples), ema_span)
+
+    def update(self, price):
+        if self.last_price is None:
+            self.last_price = price
+            self.ema = price
+            return
+
+        change = (price - self.last_price) / self.last_price
+        self.last_price = price
+        self.ema += self.ema_alpha * (price - self.ema)
+
+        if self.count == self.window:
+            old = self.changes[self.pos]
+            self.sum -= old
+            self.sum_sq -= old * old
+        else:
+            self.count += 1
+
+        self.changes[self.pos] = change
+        self.sum += change
+        self.sum_sq += change * change
+
+        # Re-add the window from scratch every time the ring wraps so rounding errors in the
+        # running sums can't build up, costs O(window) once per window so still O(1) per update
+        self.pos += 1
+        if self.pos == self.window:
+            self.pos = 0
+            self.sum = math.fsum(self.changes)
+            self.sum_sq = math.fsum([c * c for c in self.changes])
+
+    # We need at least two prices before there is a change to average
+    def ready(self):
+        return self.count > 0
+
+    def mean_change(self):
+        return self.sum / self.count
+
+    def volatility(self):
+        mean = self.sum / self.count
+        return math.sqrt(max(self.sum_sq / self.count - mean * mean, 0.0))
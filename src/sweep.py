@@ -0,0 +1,183 @@
+from src.exchange.backtest.backtest_exchange import BacktestExchange
+from src.exchange.backtest.tick_columns import TickColumns, COLUMNS
+from src.exchange.backtest.tick_store import TickStore
+
+import argparse
+import functools
+import gc
+import itertools
+import json
+import os
+import pathlib
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+# TradingAgent parameters that can be swept
+SWEEP_PARAMS = ("BPCM", "BTM", "DTM", "PR", "P_DIFF_THRESH", "V_DIFF_THRESH")
+
+# Logger stand-in for the workers, a sweep only keeps the summary table
+class SweepLogger:
+    def __init__(self):
+        self.errors = 0
+
+    def log_error(self, prefix, msg, *args):
+        self.errors += 1
+
+    def log_warn(self, prefix, msg, *args):
+        return
+
+    def log_info(self, prefix, msg, *args):
+        return
+
+def get_system_variable(name):
+    try:
+        return os.environ[name]
+    except KeyError:
+        print('"{}" does not exist!'.format(name))
+        return input("{}:".format(name))
+
+# Copy the tick columns into shared memory once, workers attach to these blocks instead of re-reading the csv
+def share_tick_columns(ticks):
+    blocks = []
+    spec = []
+    for name, dtype in COLUMNS:
+        arr = getattr(ticks, name)
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=dtype, buffer=shm.buf)[:] = arr
+        blocks.append(shm)
+        spec.append((name, shm.name, arr.shape[0]))
+    return blocks, spec
+
+# Map the shared blocks as read-only arrays, no copy is made
+def attach_tick_columns(spec):
+    blocks = []
+    cols = {}
+    for (name, shm_name, n), (_, dtype) in zip(spec, COLUMNS):
+        shm = shared_memory.SharedMemory(name=shm_name)
+        arr = np.ndarray((n,), dtype=dtype, buffer=shm.buf)
+        arr.flags.writeable = False
+        blocks.append(shm)
+        cols[name] = arr
+    return blocks, TickColumns(**cols)
+
+def load_ticks(path):
+    if os.path.isdir(path):
+        return TickStore(path)
+    return TickColumns.from_csv(path)
+
+# Every combination of the grid values, as a list of {param: value} dicts
+def expand_grid(grid):
+    for param in grid:
+        if param not in SWEEP_PARAMS:
+            raise Exception("can only sweep {}, got {}".format(SWEEP_PARAMS, param))
+
+    params = list(grid)
+    return [dict(zip(params, values)) for values in itertools.product(*[grid[p] for p in params])]
+
+# Runs in a worker process, everything it needs comes with the task. Attaching the shared ticks only maps
+# them, so it is cheap to do per combination and nothing is left open in the worker between tasks
+def run_combination(combo, specs, config_records, wallet_records):
+    blocks = []
+    ticks = {}
+    try:
+        for product_id, spec in specs.items():
+            # A tick store is memory mapped, so every worker opening it shares the same pages already
+            if isinstance(spec, str):
+                ticks[product_id] = TickStore(spec)
+            else:
+                spec_blocks, ticks[product_id] = attach_tick_columns(spec)
+                blocks += spec_blocks
+        return run_backtest(combo, pd.DataFrame(config_records), ticks, pd.DataFrame(wallet_records))
+    finally:
+        # The arrays must be gone before their blocks are unmapped, agents and the exchange refer to each other
+        ticks = None
+        gc.collect()
+        for shm in blocks:
+            shm.close()
+
+# Run one backtest with combo applied to every product in config, returns a row for the summary table
+def run_backtest(combo, config, ticks, wallet_sheet):
+    # Order ids are random, seed so every combination sees the same sequence
+    random.seed(0)
+
+    config = config.copy()
+    for param, value in combo.items():
+        config[param] = value
+
+    logger = SweepLogger()
+    exchange = BacktestExchange(logger, config, ticks=ticks, wallet_sheet=wallet_sheet, quiet=True)
+    start_value = exchange.portfolio_value()
+    exchange.run()
+    summary = exchange.recorder.summary()
+
+    row = dict(combo)
+    row["start_value"] = start_value
+    row["portfolio_value"] = exchange.portfolio_value()
+    row["return"] = summary["return"]
+    row["max_drawdown"] = summary["max_drawdown"]
+    row["turnover"] = summary["turnover"]
+    row["fee_total"] = summary["fee_total"]
+    row["fill_count"] = exchange.fill_count
+    row["order_count"] = exchange.order_count
+    row["cancel_count"] = exchange.cancel_count
+    row["error_count"] = logger.errors
+
+    exchange.close()
+    return row
+
+# Fan the grid out over a process pool that shares one copy of the ticks, returns the summary table.
+# ticks is a dict of product id to TickColumns or TickStore, or a single one for the first product
+def sweep(config, grid, ticks, wallet_sheet, workers=None):
+    combos = expand_grid(grid)
+    if not isinstance(ticks, dict):
+        ticks = {config["PRODUCT"].iloc[0]: ticks}
+
+    blocks = []
+    specs = {}
+    try:
+        for product_id, source in ticks.items():
+            if isinstance(source, TickStore):
+                specs[product_id] = source.root
+            else:
+                source_blocks, specs[product_id] = share_tick_columns(source)
+                blocks += source_blocks
+
+        task = functools.partial(run_combination, specs=specs, config_records=config.to_dict(orient="records"),
+                                 wallet_records=wallet_sheet.to_dict(orient="records"))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(task, combos))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    return pd.DataFrame(rows).sort_values("portfolio_value", ascending=False, kind="stable").reset_index(drop=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config_path', help='path to config file')
+    parser.add_argument('grid_path', help='path to json file mapping parameter names to lists of values')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='number of worker processes (default: cpu count)')
+    parser.add_argument('--output', '-o', default='sweep_results.csv', help='path to write the summary table to')
+    args = parser.parse_args()
+
+    config = pd.read_csv(pathlib.Path(args.config_path))
+    with open(args.grid_path) as f:
+        grid = json.load(f)
+
+    # Same tick sources as the backtester, the TICKS column of the config or PATH_TO_TICKS for the first product
+    ticks = {}
+    if "TICKS" in config.columns:
+        for row in config.to_dict(orient="records"):
+            if isinstance(row["TICKS"], str) and not row["TICKS"] == "":
+                ticks[row["PRODUCT"]] = load_ticks(row["TICKS"])
+    if len(ticks) == 0:
+        ticks[config["PRODUCT"].iloc[0]] = load_ticks(get_system_variable("PATH_TO_TICKS"))
+    wallet_sheet = pd.read_csv(get_system_variable("PATH_TO_WALLET_CSV"))
+
+    results = sweep(config, grid, ticks, wallet_sheet, workers=args.workers)
+    results.to_csv(args.output, index=False)
+    print(results.to_string())
@@ -0,0 +1,33 @@
+from src.log_writer import TAGS, LOG_ERROR, LOG_WARN, LOG_INFO, format_msg
+import pytest
+
+# Logger stand-in for the tests, nothing is written to disk. Lines that pass the level are kept
+# as (tag, prefix, message), log_folder is None so nothing is saved next to the logs either
+class FakeLogger:
+    def __init__(self):
+        self.level = LOG_INFO
+        self.log_folder = None
+        self.lines = []
+
+    def enabled(self, prefix, level):
+        return level <= self.level
+
+    def log(self, level, prefix, msg, args):
+        if self.enabled(prefix, level):
+            self.lines.append((TAGS[level], prefix, format_msg(msg, args)))
+
+    def log_error(self, prefix, msg, *args):
+        self.log(LOG_ERROR, prefix, msg, args)
+
+    def log_warn(self, prefix, msg, *args):
+        self.log(LOG_WARN, prefix, msg, args)
+
+    def log_info(self, prefix, msg, *args):
+        self.log(LOG_INFO, prefix, msg, args)
+
+    def metrics(self):
+        return {}
+
+@pytest.fixture
+def fake_logger():
+    return FakeLogger()
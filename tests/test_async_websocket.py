@@ -0,0 +1,332 @@
+from src.exchange.cbpro.async_websocket import AsyncWebsocketClient, ConnectionClosed, WebsocketConnection, WS_GUID, OP_TEXT, OP_CONTINUATION, OP_PING, OP_PONG, OP_CLOSE, mask_payload
+from src.exchange.cbpro.cbpro_websocket import TickerClient
+from src.exchange.cbpro.l2_book import L2Book
+from src.exchange.cbpro.tick_recorder import TickRecorder, read_capture
+from src.latency import LatencyTracker
+from src.rolling_stats import RollingStats
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+
+# Unmasked frame the way a server sends it
+def server_frame(opcode, payload, fin=True):
+    header = bytes([(0x80 if fin else 0) | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    else:
+        header += bytes([126]) + struct.pack("!H", len(payload))
+    return header + payload
+
+# Websocket server that answers the handshake, sends frames and records what the client sent back
+class FakeServer:
+    def __init__(self, frames):
+        self.frames = frames
+        self.received = []
+
+    async def handle(self, reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        key = [l.split(":", 1)[1].strip() for l in head.decode().split("\r\n") if l.lower().startswith("sec-websocket-key")][0]
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+        writer.write("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: {}\r\n\r\n".format(accept).encode())
+
+        conn = WebsocketConnection(reader, writer)
+        self.received.append(await conn.read_frame())
+        for frame in self.frames:
+            writer.write(frame)
+        await writer.drain()
+
+        # Read until the client answers our close
+        while True:
+            fin, opcode, payload = await conn.read_frame()
+            self.received.append((fin, opcode, payload))
+            if opcode == OP_CLOSE:
+                break
+        writer.close()
+
+class FakeClient(AsyncWebsocketClient):
+    def on_open(self):
+        self.messages = []
+        self.errors = []
+        self.done = asyncio.Event()
+
+    def on_message(self, msg):
+        self.messages.append(msg)
+
+    def on_error(self, e, data=None):
+        super().on_error(e, data)
+        self.errors.append(e)
+
+    def on_close(self):
+        self.done.set()
+
+# Test masking is its own inverse and works for any length
+def test_mask_payload():
+    mask = b"\x01\x02\x03\x04"
+    for payload in [b"", b"a", b"hello world"]:
+        masked = mask_payload(mask, payload)
+        assert len(masked) == len(payload)
+        assert mask_payload(mask, masked) == payload
+    assert mask_payload(mask, b"\x00\x00\x00\x00\x00") == b"\x01\x02\x03\x04\x01"
+
+# Test the handshake, subscribing, fragmented messages, pings and the closing handshake
+def test_client():
+    big = json.dumps({"type": "ticker", "pad": "x" * 300}).encode()
+    server = FakeServer([
+        server_frame(OP_PING, b"hi"),
+        server_frame(OP_TEXT, b'{"type": "heartbeat"}'),
+        server_frame(OP_TEXT, big[:100], fin=False),
+        server_frame(OP_CONTINUATION, big[100:]),
+        server_frame(OP_CLOSE, struct.pack("!H", 1000)),
+    ])
+
+    async def run():
+        srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = srv.sockets[0].getsockname()[1]
+
+        client = FakeClient(url="ws://127.0.0.1:{}/".format(port), products=["BTC-USD"], channels=["ticker"])
+        client.connect = WebsocketConnection.connect
+        client.start()
+        await asyncio.wait_for(client.done.wait(), 5.0)
+        srv.close()
+        await srv.wait_closed()
+        return client
+
+    client = asyncio.run(run())
+
+    fin, opcode, payload = server.received[0]
+    assert opcode == OP_TEXT
+    assert json.loads(payload) == {"type": "subscribe", "product_ids": ["BTC-USD"], "channels": ["ticker"]}
+    assert (True, OP_PONG, b"hi") in [(bool(f), o, p) for f, o, p in server.received]
+    assert server.received[-1][1] == OP_CLOSE
+
+    assert client.messages == [{"type": "heartbeat"}, json.loads(big)]
+    assert len(client.errors) == 1 and client.stop
+    assert client.alive() == False
+
+# Connection handing out queued messages, recv waits once they run out
+class FakeConnection:
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+        self.closed = False
+
+    async def send(self, text):
+        self.sent.append(json.loads(text))
+
+    async def ping(self, payload=b""):
+        return
+
+    async def recv(self):
+        if self.messages:
+            msg = self.messages.pop(0)
+            if isinstance(msg, Exception):
+                raise msg
+            return msg
+        await asyncio.Event().wait()
+
+    async def close(self, code=1000):
+        self.closed = True
+
+# Test the client only needs send, recv and close of whatever connect gives it
+def test_client_connection_seam():
+    conn = FakeConnection(['{"type": "heartbeat"}', '{"type": "ticker"}', ConnectionClosed("gone")])
+
+    async def connect(url):
+        assert url == "wss://feed"
+        return conn
+
+    async def run():
+        client = FakeClient(url="wss://feed", products="BTC-USD")
+        client.connect = connect
+        client.start()
+        await asyncio.wait_for(client.done.wait(), 5.0)
+        return client
+
+    client = asyncio.run(run())
+    assert conn.sent == [{"type": "subscribe", "product_ids": ["BTC-USD"]}]
+    assert client.messages == [{"type": "heartbeat"}, {"type": "ticker"}]
+    assert [type(e) for e in client.errors] == [ConnectionClosed]
+    assert conn.closed
+
+# Test closing the client cleans up and still leaves its task cancelled
+def test_client_close_cancels():
+    conn = FakeConnection([])
+
+    async def connect(url):
+        return conn
+
+    async def run():
+        client = FakeClient()
+        client.connect = connect
+        client.start()
+        await asyncio.sleep(0.01)
+        assert client.alive()
+        client.close()
+        try:
+            await client.task
+        except asyncio.CancelledError:
+            cancelled = True
+        else:
+            cancelled = False
+        return client, cancelled
+
+    client, cancelled = asyncio.run(run())
+    assert cancelled
+    assert client.task.cancelled()
+    assert client.done.is_set()
+    assert conn.closed
+    assert client.errors == []
+
+class FakeAgent:
+    def __init__(self):
+        self.ticks = []
+
+    def on_tick(self, tick, price, tick_price_changes):
+        assert tick.price == price
+        self.ticks.append(price)
+
+class FakeExchange:
+    def __init__(self):
+        self.tick_stats = {"BTC-USD": RollingStats()}
+        self.prodid_to_agents = {"BTC-USD": [FakeAgent()]}
+        self.configs = {"BTC-USD": {"PRODUCT": "BTC-USD"}}
+        self.books = {}
+        self.order_messages = []
+        self.latency = LatencyTracker()
+
+    def log_info(self, msg):
+        return
+
+    def on_order_message(self, msg):
+        self.order_messages.append(msg)
+
+def ticker(price):
+    return {"type": "ticker", "product_id": "BTC-USD", "price": str(price), "side": "buy", "last_size": "0.1", "best_bid": str(price), "best_ask": str(price)}
+
+# Test that messages are handled on the loop and ticks read in one go reach the agents once
+def test_ticker_client_conflates(fake_logger):
+    async def run():
+        client = TickerClient()
+        client.exchange = FakeExchange()
+        client.logger = fake_logger
+        client.loop = asyncio.get_running_loop()
+        client.last_ticks = {}
+        client.received = 0.0
+        client.make_queues()
+
+        for price in [100.0, 101.0, 102.0, 103.0]:
+            client.on_message(ticker(price))
+        client.on_message({"type": "done", "order_id": "a"})
+        assert len(client.exchange.order_messages) == 1
+
+        await asyncio.sleep(0)
+        return client.exchange
+
+    exchange = asyncio.run(run())
+    assert exchange.prodid_to_agents["BTC-USD"][0].ticks == [103.0]
+
+    # Every tick was decoded but only one was dispatched
+    report = exchange.latency.report()
+    assert report[("decode", "BTC-USD")]["count"] == 4
+    assert report[("dispatch", "BTC-USD")]["count"] == 1
+    assert report[("on_tick", "BTC-USD")]["count"] == 1
+
+class BrokenRecorder:
+    def __init__(self):
+        self.error_count = 0
+
+    def count_error(self):
+        self.error_count += 1
+
+    def record_tick(self, tick, time_value):
+        raise ValueError("bad time")
+
+    def record_message(self, msg):
+        raise ValueError("bad message")
+
+# Test a recorder that fails is counted but the feed carries on
+def test_ticker_client_recorder_errors(fake_logger):
+    async def run():
+        client = TickerClient()
+        client.exchange = FakeExchange()
+        client.logger = fake_logger
+        client.loop = asyncio.get_running_loop()
+        client.recorder = BrokenRecorder()
+        client.last_ticks = {}
+        client.received = 0.0
+        client.make_queues()
+
+        for price in [100.0, 101.0, 102.0, 103.0]:
+            client.on_message(ticker(price))
+        client.on_message({"type": "match", "product_id": "BTC-USD"})
+        await asyncio.sleep(0)
+        return client
+
+    client = asyncio.run(run())
+    assert client.recorder.error_count == 5
+    assert client.exchange.prodid_to_agents["BTC-USD"][0].ticks == [103.0]
+    assert len(client.exchange.order_messages) == 1
+
+# Test ticks, level2 and match messages are teed into the recorder when there is one
+def test_ticker_client_records(tmp_path, fake_logger):
+    async def run():
+        client = TickerClient()
+        client.exchange = FakeExchange()
+        client.logger = fake_logger
+        client.loop = asyncio.get_running_loop()
+        client.recorder = TickRecorder(str(tmp_path/"capture.tkc"))
+        client.last_ticks = {}
+        client.received = 0.0
+        client.make_queues()
+
+        msg = ticker(100.0)
+        msg["time"] = "2021-01-01T00:00:01.000000Z"
+        client.on_message(msg)
+        client.on_message({"type": "l2update", "product_id": "BTC-USD", "time": "2021-01-01T00:00:02.000000Z", "changes": []})
+        client.on_message({"type": "match", "product_id": "BTC-USD", "time": "2021-01-01T00:00:03.000000Z"})
+        client.on_message({"type": "done", "order_id": "a"})
+        client.recorder.close()
+
+    asyncio.run(run())
+    chunks = list(read_capture(str(tmp_path/"capture.tkc")))
+    assert len(chunks) == 1
+    ticks, messages = chunks[0]
+    assert list(ticks["price"]) == [100.0]
+    assert [(t, msg["type"]) for t, msg in messages] == [(1609459202000, "l2update"), (1609459203000, "match")]
+
+
+class FakeWebsocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, data):
+        self.sent.append(json.loads(data))
+
+# Test a book that went stale is subscribed to again for a new snapshot, once
+def test_ticker_client_resnapshot(fake_logger):
+    async def run():
+        client = TickerClient()
+        client.exchange = FakeExchange()
+        client.exchange.books = {"BTC-USD": L2Book(max_levels=1)}
+        client.logger = fake_logger
+        client.loop = asyncio.get_running_loop()
+        client.ws = FakeWebsocket()
+        client.last_ticks = {}
+        client.snapshot_requests = set()
+        client.make_queues()
+
+        bids = [["100.0", "1.0"], ["99.0", "1.0"], ["98.0", "1.0"]]
+        client.on_message({"type": "snapshot", "product_id": "BTC-USD", "bids": bids, "asks": [["101.0", "1.0"]]})
+        client.on_message({"type": "l2update", "product_id": "BTC-USD", "changes": [["buy", "100.0", "0"], ["buy", "99.0", "0"]]})
+        client.on_message({"type": "l2update", "product_id": "BTC-USD", "changes": [["buy", "95.0", "1.0"]]})
+        await asyncio.sleep(0)
+        assert client.snapshot_requests == {"BTC-USD"}
+
+        client.on_message({"type": "snapshot", "product_id": "BTC-USD", "bids": bids, "asks": [["101.0", "1.0"]]})
+        assert client.snapshot_requests == set()
+        return client.ws.sent
+
+    sent = asyncio.run(run())
+    assert [(m["type"], m["product_ids"], m["channels"]) for m in sent] == [("unsubscribe", ["BTC-USD"], ["level2"]), ("subscribe", ["BTC-USD"], ["level2"])]
@@ -0,0 +1,250 @@
+from src.exchange.backtest.backtest_exchange import BacktestExchange
+from src.exchange.backtest.tick_columns import TickColumns, SIDE_BUY, SIDE_SELL
+import pandas as pd
+import numpy as np
+
+def get_test_ticks():
+    ticks = {}
+    ticks["time"] = [1000, 1000, 1002, 1005, 1005]
+    ticks["price"] = [100.0, 101.0, 98.0, 104.0, 99.5]
+    ticks["size"] = [0.5, 0.25, 0.1, 0.2, 0.3]
+    ticks["taker_side"] = ["buy", "sell", "sell", "buy", "sell"]
+    ticks["bid"] = [99.9, 100.9, 97.9, 103.9, 99.4]
+    ticks["ask"] = [100.1, 101.1, 98.1, 104.1, 99.6]
+    ticks["avg_price"] = [100.0, 100.5, 99.7, 100.8, 100.5]
+    return pd.DataFrame(ticks)
+
+def get_test_exchange(tmp_path, monkeypatch, logger, ticks=None):
+    if ticks is None:
+        ticks = get_test_ticks()
+    ticks.to_csv(tmp_path/"ticks.csv", index=False)
+
+    wallet = {}
+    wallet["Currency"] = ["USD", "BTC"]
+    wallet["Available"] = [1000.0, 1.0]
+    wallet["OnHold"] = [0.0, 0.0]
+    pd.DataFrame(wallet).to_csv(tmp_path/"wallet.csv", index=False)
+
+    monkeypatch.setenv("PATH_TO_TICKS_CSV", str(tmp_path/"ticks.csv"))
+    monkeypatch.setenv("PATH_TO_WALLET_CSV", str(tmp_path/"wallet.csv"))
+
+    config = {}
+    config["PRODUCT"] = ["BTC-USD"]
+    config["TRADE"] = [False]
+    config["P_DIFF_THRESH"] = [0.001]
+    config["V_DIFF_THRESH"] = [0.25]
+    config["BPCM"] = [0.0001]
+    config["BTM"] = [175.0]
+    config["DTM"] = [9.0]
+    config["PR"] = [0.15]
+
+    return BacktestExchange(logger, pd.DataFrame(config))
+
+def on_order_placed(resp):
+    return
+
+# Seller that only records what it is sent
+class FakeAgent:
+    def __init__(self):
+        self.fills = []
+
+    def is_buyer(self):
+        return False
+
+    def on_fill(self, fill):
+        self.fills.append(fill)
+
+    def on_tick(self, tick, price, tick_price_changes):
+        return
+
+# Test that the tick sheet is converted into typed contiguous columns
+def test_tick_columns_from_frame():
+    ticks = TickColumns.from_frame(get_test_ticks())
+
+    assert len(ticks) == 5
+    assert ticks.time.dtype == np.int64
+    assert ticks.price.dtype == np.float64
+    assert ticks.taker_side.dtype == np.int8
+    assert ticks.price.flags["C_CONTIGUOUS"]
+    assert list(ticks.taker_side) == [SIDE_BUY, SIDE_SELL, SIDE_SELL, SIDE_BUY, SIDE_SELL]
+
+# Test that a bad taker side is rejected instead of matching every order
+def test_tick_columns_bad_side():
+    df = get_test_ticks()
+    df.loc[2, "taker_side"] = "hold"
+
+    try:
+        TickColumns.from_frame(df)
+        assert False
+    except Exception as e:
+        assert "buy or sell" in str(e)
+
+# Test that crossing ticks fill our resting orders and update the wallet
+def test_fills_and_balances(tmp_path, monkeypatch, fake_logger):
+    exchange = get_test_exchange(tmp_path, monkeypatch, fake_logger)
+    exchange.place_limit_order(on_order_placed=on_order_placed, size=0.05, side="buy", price=99.0, product_id="BTC-USD")
+    exchange.place_limit_order(on_order_placed=on_order_placed, size=0.05, side="sell", price=103.0, product_id="BTC-USD")
+
+    exchange.simulate()
+
+    # Sell taker at 98.0 fills our buy at 99.0, buy taker at 104.0 fills our sell at 103.0, both trades are bigger than our orders
+    assert len(exchange.open_orders) == 0
+    assert len(exchange.books["BTC-USD"].bids) == 0 and len(exchange.books["BTC-USD"].asks) == 0
+    assert abs(exchange.balance["BTC"] - 1.0) < 10**-9
+    fees = (99.0*0.05 + 103.0*0.05) * exchange.taker_fee_rate
+    assert abs(exchange.balance["USD"] - (1000.0 - 99.0*0.05 + 103.0*0.05 - fees)) < 10**-9
+
+# Test that a trade smaller than our order only partially fills it
+def test_partial_fill(tmp_path, monkeypatch, fake_logger):
+    exchange = get_test_exchange(tmp_path, monkeypatch, fake_logger)
+    exchange.place_limit_order(on_order_placed=on_order_placed, size=0.3, side="buy", price=99.0, product_id="BTC-USD")
+
+    exchange.simulate()
+
+    # Only the 0.1 sell at 98.0 crosses our bid
+    order = list(exchange.open_orders.values())[0]
+    assert abs(order["size"] - 0.2) < 10**-9
+    assert abs(exchange.balance["BTC"] - 1.1) < 10**-9
+
+# Test that cancelled orders leave the book
+def test_cancel_order(tmp_path, monkeypatch, fake_logger):
+    exchange = get_test_exchange(tmp_path, monkeypatch, fake_logger)
+    ids = []
+    exchange.place_limit_order(on_order_placed=lambda resp: ids.append(resp["id"]), size=0.3, side="buy", price=99.0, product_id="BTC-USD")
+    exchange.cancel_order(ids[0])
+
+    exchange.simulate()
+
+    assert len(exchange.open_orders) == 0
+    assert exchange.balance["BTC"] == 1.0
+
+# Test that the clock jumps straight to the next tick or scheduled event
+def test_event_time_jumping(tmp_path, monkeypatch, fake_logger):
+    ticks = get_test_ticks()
+    ONE_DAY_IN_MS = 24 * 60 * 60 * 1000
+    ticks["time"] = [1000, 1000, 1002, 1000 + ONE_DAY_IN_MS, 1000 + 30*ONE_DAY_IN_MS]
+    exchange = get_test_exchange(tmp_path, monkeypatch, fake_logger, ticks)
+
+    seen = []
+    exchange.sim_loop.call_at(1500, seen.append, "event")
+
+    steps = []
+    do_time_step = exchange.do_time_step
+    def record_step():
+        steps.append(exchange.t)
+        do_time_step()
+    exchange.do_time_step = record_step
+
+    exchange.simulate()
+
+    assert exchange.tick_stream.next_time() == None
+    assert seen == ["event"]
+    assert steps == [1000, 1002, 1500, 1000 + ONE_DAY_IN_MS, 1000 + 30*ONE_DAY_IN_MS]
+
+# Test a fill on the last tick still reaches the agent, after the ticks ran out
+def test_last_tick_fill_delivered(tmp_path, monkeypatch, fake_logger):
+    exchange = get_test_exchange(tmp_path, monkeypatch, fake_logger)
+    exchange.order_watchdog()
+    exchange.place_limit_order(on_order_placed=on_order_placed, size=0.05, side="sell", price=103.0, product_id="BTC-USD")
+
+    agent = FakeAgent()
+    exchange.prodid_to_agents["BTC-USD"] = [agent]
+
+    exchange.simulate()
+
+    # Only the buy taker at 104.0 at 1005, the last time in the sheet, crosses our sell
+    assert [(f.side, f.price, f.size) for f in agent.fills] == [("sell", 103.0, 0.05)]
+    assert exchange.t == 1005 + exchange.latency
+    assert exchange.sim_loop.next_time() is None
+
+# Test that a backtest reads a tick store folder the same as the csv it was made from
+def test_tick_store_input(tmp_path, monkeypatch, fake_logger):
+    from src.exchange.backtest.tick_store import write_tick_store
+
+    exchange = get_test_exchange(tmp_path, monkeypatch, fake_logger)
+    write_tick_store(tmp_path/"ticks.csv", str(tmp_path/"store"))
+    monkeypatch.setenv("PATH_TO_TICKS", str(tmp_path/"store"))
+    store_exchange = get_test_exchange(tmp_path, monkeypatch, fake_logger)
+
+    for ex in [exchange, store_exchange]:
+        ex.place_limit_order(on_order_placed=on_order_placed, size=0.3, side="buy", price=99.0, product_id="BTC-USD")
+        ex.simulate()
+
+    assert store_exchange.balance == exchange.balance
+    assert store_exchange.portfolio_value() == exchange.portfolio_value()
+
+def get_multi_product_exchange(tmp_path, monkeypatch, logger):
+    btc = get_test_ticks()
+    btc.to_csv(tmp_path/"btc.csv", index=False)
+
+    eth = {}
+    eth["time"] = [999, 1001, 1005]
+    eth["price"] = [10.0, 9.0, 11.0]
+    eth["size"] = [1.0, 1.0, 1.0]
+    eth["taker_side"] = ["buy", "sell", "buy"]
+    eth["bid"] = [9.9, 8.9, 10.9]
+    eth["ask"] = [10.1, 9.1, 11.1]
+    eth["avg_price"] = [10.0, 9.5, 10.5]
+    pd.DataFrame(eth).to_csv(tmp_path/"eth.csv", index=False)
+
+    wallet = {}
+    wallet["Currency"] = ["USD", "BTC", "ETH"]
+    wallet["Available"] = [1000.0, 1.0, 10.0]
+    wallet["OnHold"] = [0.0, 0.0, 0.0]
+    pd.DataFrame(wallet).to_csv(tmp_path/"wallet.csv", index=False)
+    monkeypatch.setenv("PATH_TO_WALLET_CSV", str(tmp_path/"wallet.csv"))
+
+    config = {}
+    config["PRODUCT"] = ["BTC-USD", "ETH-USD"]
+    config["TRADE"] = [False, False]
+    config["TICKS"] = [str(tmp_path/"btc.csv"), str(tmp_path/"eth.csv")]
+
+    return BacktestExchange(logger, pd.DataFrame(config))
+
+# Test that each product's orders only fill against that product's ticks
+def test_multi_product_fills(tmp_path, monkeypatch, fake_logger):
+    exchange = get_multi_product_exchange(tmp_path, monkeypatch, fake_logger)
+    assert exchange.t == 999
+
+    # 9.5 is only crossed by the ETH sell at 9.0, the BTC ticks never trade that low
+    exchange.place_limit_order(on_order_placed=on_order_placed, size=0.5, side="buy", price=9.5, product_id="ETH-USD")
+    exchange.place_limit_order(on_order_placed=on_order_placed, size=0.5, side="buy", price=9.5, product_id="BTC-USD")
+
+    exchange.simulate()
+
+    assert abs(exchange.balance["ETH"] - 10.5) < 10**-9
+    assert exchange.balance["BTC"] == 1.0
+    assert len(exchange.open_orders) == 1
+
+    # Each product is marked at its own latest price
+    assert exchange.last_price == {"BTC-USD": 100.5, "ETH-USD": 10.5}
+    expected = exchange.balance["USD"] + exchange.balance["BTC"]*100.5 + exchange.balance["ETH"]*10.5
+    assert abs(exchange.portfolio_value() - expected) < 10**-9
+
+# Test that currencies quoted in another coin are valued through that coin's price
+def test_currency_price_chain(tmp_path, monkeypatch, fake_logger):
+    exchange = get_test_exchange(tmp_path, monkeypatch, fake_logger)
+    exchange.product_ids = ["ETH-BTC", "BTC-USD"]
+    exchange.last_price = {"ETH-BTC": 0.05, "BTC-USD": 100.0}
+
+    assert exchange.currency_price("USD") == 1.0
+    assert exchange.currency_price("BTC") == 100.0
+    assert abs(exchange.currency_price("ETH") - 5.0) < 10**-9
+
+# Test that quiet mode prints nothing per step and writes the trade ledger at the end
+def test_quiet_recording(tmp_path, monkeypatch, capsys, fake_logger):
+    monkeypatch.setenv("BACKTEST_QUIET", "1")
+    exchange = get_test_exchange(tmp_path, monkeypatch, fake_logger)
+    exchange.logger.log_folder = str(tmp_path)
+    exchange.place_limit_order(on_order_placed=on_order_placed, size=0.3, side="buy", price=99.0, product_id="BTC-USD")
+
+    exchange.run()
+
+    assert capsys.readouterr().out == ""
+    assert len([l for l in exchange.logger.lines if "portfolio value" in l[2]]) == 0
+
+    data = np.load(tmp_path/"backtest.npz")
+    assert len(data["orders"]) == 1
+    assert len(data["fills"]) == 1
+    assert abs(data["fills"]["size"][0] - 0.1) < 10**-9
+    assert abs(data["equity"]["equity"][-1] - exchange.portfolio_value()) < 10**-9
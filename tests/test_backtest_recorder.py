@@ -0,0 +1,81 @@
+from src.exchange.backtest.backtest_recorder import BacktestRecorder, RecordBuffer, equity_capacity, ORDER_PLACED, ORDER_CANCELLED
+import numpy as np
+
+# Test that the buffer grows past its initial capacity without losing rows
+def test_record_buffer_grows():
+    buf = RecordBuffer([("time", np.int64), ("value", np.float64)], capacity=2)
+    for k in range(11):
+        buf.append((k, k * 0.5))
+
+    assert len(buf) == 11
+    assert list(buf.values()["time"]) == list(range(11))
+    assert buf.values()["value"][-1] == 5.0
+
+# Test that the equity curve is only sampled once per interval
+def test_sample_interval():
+    rec = BacktestRecorder({"USD", "BTC"}, ["BTC-USD"], sample_interval=100)
+    for t in range(0, 1000, 10):
+        if rec.sample_due(t):
+            rec.sample(t, 1000.0, {"USD": 500.0, "BTC": 5.0})
+
+    equity = rec.equity.values()
+    assert list(equity["time"]) == list(range(0, 1000, 100))
+    assert list(equity["balances"][0]) == [5.0, 500.0]
+
+# Test the equity buffer is sized up front for every sample the ticks allow, one per tick or per interval
+def test_equity_preallocated():
+    assert equity_capacity(None, None, 100) is None
+    assert equity_capacity(5, 10000, 100) == 6
+    assert equity_capacity(1000, 950, 100) == 11
+
+    rec = BacktestRecorder({"USD", "BTC"}, ["BTC-USD"], sample_interval=100, tick_count=1000, time_span=950)
+    data = rec.equity.data
+    for t in range(0, 960, 10):
+        if rec.sample_due(t):
+            rec.sample(t, 1000.0, {})
+    rec.sample(960, 1000.0, {})
+    assert len(rec.equity) == 11
+    assert rec.equity.data is data
+
+# Test a run that starts with nothing gives nan or inf instead of raising
+def test_summary_zero_equity():
+    rec = BacktestRecorder({"USD", "BTC"}, ["BTC-USD"], sample_interval=1)
+    rec.sample(0, 0.0, {})
+    rec.sample(1, 0.0, {})
+    stats = rec.summary()
+    assert stats["return"] != stats["return"]
+    assert stats["turnover"] != stats["turnover"]
+
+    rec.sample(2, 10.0, {})
+    assert rec.summary()["return"] == float("inf")
+
+# Test the summary statistics against values worked out by hand
+def test_summary():
+    rec = BacktestRecorder({"USD", "BTC"}, ["BTC-USD"], sample_interval=1)
+    for t, equity in enumerate([100.0, 120.0, 90.0, 110.0]):
+        rec.sample(t, equity, {})
+    rec.record_order(0, "BTC-USD", "buy", ORDER_PLACED, 10.0, 1.0)
+    rec.record_order(1, "BTC-USD", "buy", ORDER_CANCELLED, 10.0, 1.0)
+    rec.record_order(1, "BTC-USD", "sell", ORDER_PLACED, 12.0, 1.0)
+    rec.record_fill(1, "BTC-USD", "buy", 10.0, 2.0, 0.04)
+    rec.record_fill(2, "BTC-USD", "sell", 12.0, 1.0, 0.024)
+
+    stats = rec.summary()
+    assert abs(stats["return"] - 0.1) < 10**-12
+    assert abs(stats["max_drawdown"] - 0.25) < 10**-12
+    assert abs(stats["turnover"] - 32.0 / 105.0) < 10**-12
+    assert abs(stats["fee_total"] - 0.064) < 10**-12
+    assert stats["fill_count"] == 2
+    assert stats["order_count"] == 2
+
+# Test that the buffers are written out and read back
+def test_save(tmp_path):
+    rec = BacktestRecorder({"USD", "BTC"}, ["BTC-USD"])
+    rec.sample(0, 100.0, {"USD": 100.0})
+    rec.record_fill(1, "BTC-USD", "sell", 12.0, 1.0, 0.024)
+    rec.save(tmp_path/"backtest.npz")
+
+    data = np.load(tmp_path/"backtest.npz")
+    assert data["equity"]["equity"][0] == 100.0
+    assert data["fills"]["price"][0] == 12.0
+    assert list(data["currencies"]) == ["BTC", "USD"]
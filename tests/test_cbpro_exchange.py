@@ -0,0 +1,156 @@
+from src.exchange.cbpro.cbpro_exchange import CBProExchange, RECONCILE_MIN_INTERVAL, RECONCILE_MAX_INTERVAL
+from src.exchange.cbpro.order_index import OrderIndex
+from src.exchange.rate_limiter import RateLimiter
+from src.log_writer import LOG_ERROR, LOG_INFO
+from src.latency import LatencyTracker
+import asyncio
+
+# Agent that records the quotes it acts on, each request takes a while to come back
+class FakeAgent:
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.product_id = "BTC-USD"
+        self.desired_quote = None
+        self.desired_quote_time = None
+        self.sent = []
+
+    def on_tick(self, price):
+        self.desired_quote = (price, 1.0)
+        self.exchange.update_quote(self)
+
+    def reconcile_quote(self):
+        self.sent.append(self.desired_quote)
+        self.desired_quote = None
+        return self.exchange.spawn(asyncio.sleep(0.05))
+
+# REST client that lists a fixed set of open orders
+class FakeRestClient:
+    def __init__(self):
+        self.orders = []
+        self.calls = 0
+
+    async def get_orders(self, tokens=1):
+        self.calls += 1
+        return self.orders
+
+    async def place_market_order(self, **kwargs):
+        raise ConnectionError("reset by peer")
+
+# Exchange with just what quoting needs, no connections are made
+def get_test_exchange(limits, logger):
+    exchange = CBProExchange.__new__(CBProExchange)
+    exchange.opened = True
+    exchange.closed = False
+    exchange.tasks = set()
+    exchange.quoting = set()
+    exchange.rate_limiter = RateLimiter(limits)
+    exchange.logger = logger
+    logger.log_folder = "."
+    exchange.latency = LatencyTracker()
+    exchange.order_index = OrderIndex()
+    exchange.reconcile_interval = RECONCILE_MIN_INTERVAL
+    exchange.reconcile_handle = None
+    return exchange
+
+# Test that ticks arriving while a quote is in flight collapse into the latest one
+def test_quote_conflation(fake_logger):
+    exchange = get_test_exchange({"private": (100, 5)}, fake_logger)
+    agent = FakeAgent(exchange)
+
+    async def run():
+        exchange.loop = asyncio.get_running_loop()
+        for price in [1.0, 2.0, 3.0, 4.0]:
+            agent.on_tick(price)
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.2)
+
+    asyncio.run(run())
+    exchange.closed = True
+    assert agent.sent == [(1.0, 1.0), (4.0, 1.0)]
+    assert len(exchange.quoting) == 0
+
+# Test that while out of budget only the latest desired quote goes out
+def test_quote_waits_for_budget(fake_logger):
+    exchange = get_test_exchange({"private": (10, 1)}, fake_logger)
+    agent = FakeAgent(exchange)
+
+    async def run():
+        exchange.loop = asyncio.get_running_loop()
+        await exchange.rate_limiter.acquire()
+        for price in [1.0, 2.0, 3.0]:
+            agent.on_tick(price)
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.3)
+
+    asyncio.run(run())
+    exchange.closed = True
+    assert agent.sent == [(3.0, 1.0)]
+
+# Test that reconciliation backs off while the index is right and comes back after a gap
+def test_adaptive_reconcile(fake_logger):
+    exchange = get_test_exchange({"private": (100, 5)}, fake_logger)
+    exchange.rest_client = FakeRestClient()
+
+    async def run():
+        exchange.loop = asyncio.get_running_loop()
+        intervals = []
+        for _ in range(6):
+            await exchange.reconcile_orders_async()
+            exchange.reconcile_handle.cancel()
+            exchange.reconcile_handle = None
+            intervals.append(exchange.reconcile_interval)
+
+        # The stream missed an order
+        exchange.rest_client.orders = [{"id": "a", "product_id": "BTC-USD", "side": "buy", "price": "1.0", "size": "1.0", "filled_size": "0.0"}]
+        await exchange.reconcile_orders_async()
+        intervals.append(exchange.reconcile_interval)
+
+        # A gap in the stream brings the next reconciliation forward
+        exchange.reconcile_interval = RECONCILE_MAX_INTERVAL
+        exchange.order_stream_gap("test")
+        await asyncio.sleep(0.01)
+        return intervals
+
+    intervals = asyncio.run(run())
+    exchange.closed = True
+    assert intervals == [30.0, 60.0, 120.0, 240.0, 240.0, 240.0, 15.0]
+    assert "a" in exchange.order_index
+    assert exchange.rest_client.calls == 8
+
+# Test a market order that fails without an answer is still answered, with an error
+def test_market_order_failure_answered(fake_logger):
+    exchange = get_test_exchange({"private": (100, 5)}, fake_logger)
+    exchange.rest_client = FakeRestClient()
+    answers = []
+
+    asyncio.run(exchange.place_market_order_async(answers.append, size=1.0, side="buy", product_id="BTC-USD"))
+    exchange.closed = True
+    assert len(answers) == 1
+    assert "reset by peer" in answers[0]["message"]
+
+class FakeTickers:
+    def __init__(self):
+        self.queues = {}
+
+# Test the metrics are only collected, and their histograms reset, when the report would be logged
+def test_report_metrics_gated(fake_logger):
+    exchange = get_test_exchange({"private": (100, 5)}, fake_logger)
+    exchange.ws_tickers = FakeTickers()
+    exchange.recorder = None
+
+    async def run():
+        exchange.loop = asyncio.get_running_loop()
+        exchange.latency.record("on_tick", "BTC-USD", 0.001)
+
+        exchange.logger.level = LOG_ERROR
+        exchange.report_metrics()
+        assert exchange.logger.lines == []
+        assert ("on_tick", "BTC-USD") in exchange.latency.histograms
+
+        exchange.logger.level = LOG_INFO
+        exchange.report_metrics()
+        assert any(line[2].startswith("latency stage(on_tick)") for line in exchange.logger.lines)
+        assert exchange.latency.histograms == {}
+
+    asyncio.run(run())
+    exchange.closed = True
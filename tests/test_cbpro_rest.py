@@ -0,0 +1,125 @@
+from src.exchange.cbpro.cbpro_rest import AsyncRestClient
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+import asyncio
+import base64
+import json
+import time
+import requests
+
+# Stand-in for the REST api, answers every request after DELAY seconds
+class FakeApiHandler(BaseHTTPRequestHandler):
+    DELAY = 0.2
+
+    def do_GET(self):
+        time.sleep(self.DELAY)
+
+        body = {"path": self.path, "signed": "CB-ACCESS-SIGN" in self.headers}
+        headers = {}
+        # Two pages of orders
+        if self.path == "/orders":
+            body = [{"id": "1"}]
+            headers["cb-after"] = "1"
+        elif self.path.startswith("/orders?"):
+            body = [{"id": "2"}]
+
+        self.reply(body, headers)
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.reply(data)
+
+    def reply(self, body, headers={}):
+        out = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        return
+
+def get_test_client(timeout=5.0):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeApiHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    secret = base64.b64encode(b"secret").decode()
+    client = AsyncRestClient("key", secret, "passphrase", "http://127.0.0.1:{}/".format(server.server_port), timeout=timeout)
+    return server, client
+
+# Test that requests are signed, in flight at the same time and don't block the loop
+def test_concurrent_requests():
+    server, client = get_test_client()
+
+    async def run():
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        start = time.monotonic()
+        resps = await asyncio.gather(*[client.get_accounts() for _ in range(4)])
+        elapsed = time.monotonic() - start
+        task.cancel()
+        return resps, elapsed, ticks
+
+    resps, elapsed, ticks = asyncio.run(run())
+    client.close()
+    server.shutdown()
+
+    assert resps == [{"path": "/accounts", "signed": True}] * 4
+    # Four 0.2s requests in series would take 0.8s
+    assert elapsed < 0.6
+    # The loop kept running while we waited
+    assert ticks > 5
+
+# Test the order payload and pagination
+def test_orders():
+    server, client = get_test_client()
+
+    async def run():
+        placed = await client.place_limit_order(product_id="BTC-USD", side="buy", price=100.0, size=0.1, post_only=True, client_oid=None)
+        orders = await client.get_orders()
+        return placed, orders
+
+    placed, orders = asyncio.run(run())
+    client.close()
+    server.shutdown()
+
+    assert placed == {"product_id": "BTC-USD", "side": "buy", "type": "limit", "price": 100.0, "size": 0.1, "post_only": True}
+    assert [o["id"] for o in orders] == ["1", "2"]
+
+# Test that a request that takes too long raises instead of hanging
+def test_timeout():
+    server, client = get_test_client(timeout=0.05)
+
+    try:
+        asyncio.run(client.get_accounts())
+        assert False
+    except requests.exceptions.Timeout:
+        pass
+
+    client.close()
+    server.shutdown()
+
+# Test that closing cancels the requests still waiting for a worker
+def test_close_cancels_waiting():
+    server, client = get_test_client()
+
+    async def run():
+        tasks = [asyncio.ensure_future(client.get_accounts()) for _ in range(10)]
+        await asyncio.sleep(0.05)
+        assert len(client.pending) == 10
+        client.close()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    resps = asyncio.run(run())
+    server.shutdown()
+
+    # Eight were in flight on the workers, the other two never went out
+    assert sum(isinstance(r, asyncio.CancelledError) for r in resps) == 2
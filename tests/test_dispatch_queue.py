@@ -0,0 +1,100 @@
+from src.exchange.dispatch_queue import DispatchQueue, CONFLATE, DROP_OLDEST, DISPATCH_QUEUE
+
+# Loop that holds on to call_soon callbacks until the test runs them
+class FakeLoop:
+    def __init__(self):
+        self.callbacks = []
+
+    def call_soon(self, callback, *args):
+        self.callbacks.append((callback, args))
+
+    def run_once(self):
+        callbacks = self.callbacks
+        self.callbacks = []
+        for callback, args in callbacks:
+            callback(*args)
+
+    def run(self):
+        while self.callbacks:
+            self.run_once()
+
+# Clock we can move by hand
+class FakeClock:
+    def __init__(self):
+        self.t = 100.0
+
+    def __call__(self):
+        return self.t
+
+# Test that a conflating queue only dispatches the latest item, timed from when the slot was filled
+def test_conflate():
+    loop = FakeLoop()
+    clock = FakeClock()
+    got = []
+    queue = DispatchQueue(lambda item, queued: got.append((item, queued)), loop, maxlen=8, policy=CONFLATE, clock=clock)
+
+    queue.put(1)
+    clock.t += 1.0
+    queue.put(2)
+    queue.put(3)
+    assert len(queue) == 1 and len(loop.callbacks) == 1
+
+    loop.run()
+    assert got == [(3, 100.0)]
+
+    metrics = queue.metrics()
+    assert metrics["queued"] == 3 and metrics["dispatched"] == 1 and metrics["dropped"] == 2
+    assert metrics["max_depth"] == 1 and metrics["depth"] == 0
+
+# Test that a drop_oldest queue dispatches in order, one item per loop iteration, and stays bounded
+def test_drop_oldest():
+    loop = FakeLoop()
+    got = []
+    queue = DispatchQueue(lambda item, queued: got.append(item), loop, maxlen=3, policy=DROP_OLDEST)
+
+    for i in range(5):
+        queue.put(i)
+    assert len(queue) == 3
+
+    loop.run_once()
+    assert got == [2]
+
+    # More arrives while the rest waits
+    queue.put(5)
+    loop.run()
+    assert got == [2, 3, 4, 5]
+
+    metrics = queue.metrics()
+    assert metrics["dropped"] == 2 and metrics["dispatched"] == 4 and metrics["max_depth"] == 3
+    assert queue.metrics()["max_depth"] == 0
+
+# Test that equal items are separate events in a drop_oldest queue, each one is dispatched
+def test_drop_oldest_keeps_duplicates():
+    loop = FakeLoop()
+    got = []
+    queue = DispatchQueue(lambda item, queued: got.append(item), loop, maxlen=3, policy=DROP_OLDEST)
+
+    trade = ("BTC-USD", 100.0, 0.5)
+    queue.put(trade)
+    queue.put(trade)
+    queue.put(("BTC-USD", 101.0, 0.5))
+    queue.put(trade)
+    assert len(queue) == 3
+
+    loop.run()
+    assert got == [trade, ("BTC-USD", 101.0, 0.5), trade]
+    assert queue.metrics()["dropped"] == 1
+
+# Test the policy and length come from the config
+def test_from_config():
+    queue = DispatchQueue.from_config({"PRODUCT": "BTC-USD"}, None, FakeLoop())
+    assert queue.policy == CONFLATE and queue.maxlen == 1
+
+    queue = DispatchQueue.from_config({"DISPATCH_POLICY": "drop_oldest", "DISPATCH_QUEUE": float("nan")}, None, FakeLoop())
+    assert queue.policy == DROP_OLDEST and queue.maxlen == DISPATCH_QUEUE
+
+    try:
+        DispatchQueue.from_config({"DISPATCH_POLICY": "drop_newest"}, None, FakeLoop())
+        assert False
+    except Exception as e:
+        assert "policy" in str(e)
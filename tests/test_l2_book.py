@@ -0,0 +1,79 @@
+from src.exchange.cbpro.l2_book import L2Book
+
+def snapshot():
+    return {"type": "snapshot", "product_id": "BTC-USD", "bids": [["100.0", "1.0"], ["99.0", "2.0"], ["98.0", "3.0"]], "asks": [["101.0", "3.0"], ["102.0", "1.0"], ["103.0", "1.0"]]}
+
+def l2update(*changes):
+    return {"type": "l2update", "product_id": "BTC-USD", "changes": [list(c) for c in changes]}
+
+# Test the top of the book, depth and microprice after a snapshot
+def test_snapshot():
+    book = L2Book()
+    assert book.best_bid() is None and book.microprice() is None
+
+    book.on_snapshot(snapshot())
+    assert book.ready
+    assert book.best_bid() == 100.0 and book.best_ask() == 101.0
+    assert book.depth_at("buy", 99.0) == 2.0 and book.depth_at("sell", 99.0) == 0.0
+    assert book.depth("buy", 2) == 3.0 and book.depth("sell", 3) == 5.0
+    assert abs(book.microprice() - (100.0 * 3.0 + 101.0 * 1.0) / 4.0) < 10**-9
+
+# Test updates move the top of the book and only top of book changes are reported
+def test_update():
+    book = L2Book()
+    book.on_snapshot(snapshot())
+
+    assert book.on_update(l2update(("buy", "98.0", "5.0"))) == False
+    assert book.depth_at("buy", 98.0) == 5.0
+
+    assert book.on_update(l2update(("buy", "100.0", "0"))) == True
+    assert book.best_bid() == 99.0
+
+    assert book.on_update(l2update(("sell", "100.5", "0.5"))) == True
+    assert book.best_ask() == 100.5
+    assert book.update_count == 3
+
+# Test that only max_levels levels per side are served, with as many again kept behind them
+def test_bounded():
+    book = L2Book(max_levels=1)
+    book.on_snapshot(snapshot())
+    assert list(book.bids.keys()) == [99.0, 100.0]
+    assert list(book.asks.keys()) == [101.0, 102.0]
+    assert book.depth("buy", 3) == 1.0 and book.depth("sell", 3) == 3.0
+
+    book.on_update(l2update(("buy", "100.5", "1.0"), ("sell", "104.0", "1.0"), ("sell", "100.8", "1.0")))
+    assert list(book.bids.keys()) == [100.0, 100.5]
+    assert list(book.asks.keys()) == [100.8, 101.0]
+    assert book.ready
+
+# Test deletes that leave a cut side with fewer than max_levels levels make the book stale
+# rather than let a level far from the market show as the best
+def test_delete_after_cut():
+    book = L2Book(max_levels=2)
+    bids = [[str(100.0 - i), "1.0"] for i in range(10)]
+    book.on_snapshot({"type": "snapshot", "product_id": "BTC-USD", "bids": bids, "asks": [["101.0", "1.0"]]})
+    assert list(book.bids.keys()) == [97.0, 98.0, 99.0, 100.0]
+
+    # The kept levels refill the top
+    assert book.on_update(l2update(("buy", "100.0", "0"), ("buy", "99.0", "0")))
+    assert book.ready and book.best_bid() == 98.0
+
+    # One level left of a side we know is deeper, 97 is not known to be the best any more
+    assert book.on_update(l2update(("buy", "98.0", "0")))
+    assert book.ready == False
+
+    # Updates wait for the next snapshot
+    assert book.on_update(l2update(("buy", "90.0", "1.0"))) == False
+    assert 90.0 not in book.bids
+    book.on_snapshot({"type": "snapshot", "product_id": "BTC-USD", "bids": [["97.0", "1.0"], ["96.0", "1.0"]], "asks": [["101.0", "1.0"]]})
+    assert book.ready and book.best_bid() == 97.0
+
+    # A side that was never cut can go down to nothing and still be right
+    assert book.on_update(l2update(("sell", "101.0", "0")))
+    assert book.ready and book.best_ask() is None
+
+# Test the book is only made for products that ask for one
+def test_from_config():
+    assert L2Book.from_config({"PRODUCT": "BTC-USD"}) is None
+    assert L2Book.from_config({"L2_LEVELS": float("nan")}) is None
+    assert L2Book.from_config({"L2_LEVELS": 10.0}).max_levels == 10
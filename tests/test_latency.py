@@ -0,0 +1,50 @@
+from src.latency import LatencyHistogram, LatencyTracker
+
+# Clock we can move by hand
+class FakeClock:
+    def __init__(self):
+        self.t = 100.0
+
+    def __call__(self):
+        return self.t
+
+# Test percentiles land within a bucket of the real value and never pass the max
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(0.5) is None
+
+    for i in range(1, 1001):
+        histogram.record(i / 1000000.0)
+
+    assert histogram.count == 1000
+    assert histogram.max == 0.001
+    assert 0.0005 <= histogram.percentile(0.5) <= 0.0005 * 1.1
+    assert 0.00099 <= histogram.percentile(0.99) <= 0.001
+    assert histogram.percentile(1.0) == 0.001
+    assert abs(histogram.mean() - 0.0005005) < 10**-12
+
+# Test tiny and huge latencies go in the end buckets
+def test_histogram_range():
+    histogram = LatencyHistogram()
+    histogram.record(0.0)
+    histogram.record(10**6)
+    assert histogram.buckets[0] == 1 and histogram.buckets[-1] == 1
+    assert histogram.percentile(1.0) == 10**6
+
+# Test stages are kept per product and reports start over
+def test_tracker():
+    clock = FakeClock()
+    tracker = LatencyTracker(clock)
+
+    start = tracker.now()
+    clock.t += 0.002
+    tracker.since("rest", "BTC-USD", start)
+    tracker.record("rest", "ETH-USD", 0.004)
+    tracker.record("rest", "ETH-USD", 0.001)
+
+    report = tracker.report()
+    assert list(report.keys()) == [("rest", "BTC-USD"), ("rest", "ETH-USD")]
+    assert report[("rest", "BTC-USD")]["count"] == 1
+    assert abs(report[("rest", "BTC-USD")]["max"] - 0.002) < 10**-12
+    assert report[("rest", "ETH-USD")]["max"] == 0.004
+    assert tracker.report() == {}
@@ -0,0 +1,83 @@
+from src.log_archiver import archive_folder, upload_with_retry, LocalDirBackend, LogArchiver
+import hashlib
+import os
+import os.path as pth
+import tarfile
+
+def make_log_folder(tmp_path):
+    folder = pth.join(str(tmp_path), "logs_20240101_000000")
+    os.mkdir(folder)
+    with open(pth.join(folder, "info.log"), "w") as f:
+        f.write("[INFO][Main,20240101_000000]:line\n" * 1000)
+    with open(pth.join(folder, "error.log"), "w") as f:
+        f.write("")
+    return folder
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+# Fails the first failures uploads
+class FlakyBackend:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def upload(self, archive, cksum):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise Exception("upload failed")
+
+# Test the archive is a valid tar.gz of the folder and hashed as it is written
+def test_archive_folder(tmp_path):
+    folder = make_log_folder(tmp_path)
+    archive, cksum = archive_folder(folder)
+
+    assert archive == folder + ".tar.gz"
+    assert cksum == file_sha256(archive)
+    with tarfile.open(archive, "r:gz") as tar:
+        names = sorted(tar.getnames())
+        assert names == ["logs_20240101_000000", "logs_20240101_000000/error.log", "logs_20240101_000000/info.log"]
+        assert tar.extractfile("logs_20240101_000000/info.log").read().count(b"\n") == 1000
+
+# Test the local backend copies the archive with its checksum next to it
+def test_local_dir_backend(tmp_path):
+    folder = make_log_folder(tmp_path)
+    archive, cksum = archive_folder(folder)
+    dest = pth.join(str(tmp_path), "uploads")
+
+    LocalDirBackend(dest).upload(archive, cksum)
+    assert file_sha256(pth.join(dest, pth.basename(archive))) == cksum
+    with open(pth.join(dest, pth.basename(archive) + ".sha256")) as f:
+        assert f.read().split() == [cksum, pth.basename(archive)]
+
+# Test uploads are retried with exponential backoff, capped, and the error raised when every attempt fails
+def test_upload_with_retry():
+    sleeps = []
+    backend = FlakyBackend(3)
+    assert upload_with_retry(backend, "a.tar.gz", "0", attempts=5, backoff=1.0, max_backoff=3.0, sleep=sleeps.append) == 4
+    assert sleeps == [1.0, 2.0, 3.0]
+
+    sleeps = []
+    backend = FlakyBackend(10)
+    try:
+        upload_with_retry(backend, "a.tar.gz", "0", attempts=3, backoff=1.0, sleep=sleeps.append)
+        assert False
+    except Exception as e:
+        assert str(e) == "upload failed"
+    assert backend.calls == 3
+    assert sleeps == [1.0, 2.0]
+
+# Test a folder goes through the worker process and is only deleted once it is uploaded
+def test_log_archiver(tmp_path):
+    folder = make_log_folder(tmp_path)
+    dest = pth.join(str(tmp_path), "uploads")
+    archiver = LogArchiver(LocalDirBackend(dest))
+
+    ret = archiver.submit(folder).result(timeout=60)
+    archiver.close()
+
+    assert ret["folder"] == folder
+    assert ret["attempts"] == 1
+    assert pth.exists(folder) == False
+    assert file_sha256(pth.join(dest, pth.basename(ret["archive"]))) == ret["sha256"]
@@ -0,0 +1,69 @@
+from src.log_ingest import parse_archive, ingest
+from src.log_archiver import archive_folder
+from src.exchange.backtest.tick_columns import SIDE_BUY, SIDE_SELL
+from src.exchange.backtest.tick_store import open_ticks
+import numpy as np
+import os
+import pandas as pd
+
+T0 = 1609459200000 # 2021-01-01 00:00:00
+
+def tick_line(prefix, second, product_id, price, side="buy"):
+    return "[INFO][{},20210101_0000{:02d}]:tick product_id({}) tick_price_changes(0.5) price({}) taker_side({}) size(0.1) bid({}) ask({})\n".format(
+        prefix, second, product_id, price, side, price - 1, price + 1)
+
+def fill_line(prefix, second, price):
+    return "[INFO][{},20210101_0000{:02d}]:fill size(0.01) price({}) side(buy) maker_fee_rate(0.005)\n".format(prefix, second, price)
+
+def make_archive(tmp_path, name, lines):
+    folder = os.path.join(str(tmp_path), name)
+    os.mkdir(folder)
+    with open(os.path.join(folder, "info.log"), "w") as f:
+        f.write("".join(lines))
+    with open(os.path.join(folder, "warn.log"), "w") as f:
+        f.write(tick_line("TickerClient", 59, "BTC-USD", 1.0))
+    return archive_folder(folder)[0]
+
+# Test both tick prefixes and fills are parsed, the other lines only counted, also across block boundaries
+def test_parse_archive(tmp_path):
+    lines = [tick_line("CBProExchange", 1, "BTC-USD", 100.0),
+             "[INFO][Buyer,BTC-USD,20210101_000001]:buy 0.01 @ 99.0 success\n",
+             tick_line("TickerClient", 2, "ETH-USD", 10.5, "sell"),
+             fill_line("Buyer,BTC-USD", 3, 99.0),
+             "[WARN][TickerClient,20210101_000003]:tick product_id(BTC-USD) is not a tick line\n"]
+    archive = make_archive(tmp_path, "logs_20210101_000000", lines)
+
+    for block_size in [7, 1024]:
+        n, ticks, fills = parse_archive(archive, block_size=block_size)
+        assert n == 5
+        assert sorted(ticks) == ["BTC-USD", "ETH-USD"]
+        assert ticks["BTC-USD"][["time", "price", "size", "taker_side", "bid", "ask"]].values.tolist() == [[T0 + 1000, 100.0, 0.1, SIDE_BUY, 99.0, 101.0]]
+        assert ticks["ETH-USD"]["taker_side"].tolist() == [SIDE_SELL]
+        assert fills["BTC-USD"][["time", "price", "side"]].values.tolist() == [[T0 + 3000, 99.0, "buy"]]
+
+    # The clock that wrote the logs was an hour ahead of UTC
+    n, ticks, fills = parse_archive(archive, utc_offset_hours=1.0)
+    assert ticks["BTC-USD"]["time"].tolist() == [T0 + 1000 - 3600000]
+
+# Test lines repeated by overlapping archives are dropped but trades that really repeated are kept
+def test_ingest(tmp_path):
+    first = [tick_line("TickerClient", 1, "BTC-USD", 100.0), tick_line("TickerClient", 1, "BTC-USD", 100.0),
+             tick_line("TickerClient", 2, "BTC-USD", 101.0), fill_line("Seller,BTC-USD", 2, 101.0)]
+    second = [tick_line("TickerClient", 2, "BTC-USD", 101.0), fill_line("Seller,BTC-USD", 2, 101.0),
+              tick_line("TickerClient", 3, "BTC-USD", 99.0, "sell"), tick_line("TickerClient", 3, "ETH-USD", 10.0)]
+    archives = [make_archive(tmp_path, "logs_20210101_000000", first), make_archive(tmp_path, "logs_20210101_000002", second)]
+
+    stats = ingest(list(reversed(archives)), str(tmp_path/"out"), workers=2)
+    assert stats["archives"] == 2 and stats["lines"] == 8
+    assert stats["lines_per_sec"] > 0
+    assert stats["ticks"] == {"BTC-USD": 4, "ETH-USD": 1}
+    assert stats["fills"] == {"BTC-USD": 1}
+
+    ticks = list(open_ticks(str(tmp_path/"out"/"ticks_BTC-USD")))[0]
+    assert list(ticks.time) == [T0 + 1000, T0 + 1000, T0 + 2000, T0 + 3000]
+    assert list(ticks.price) == [100.0, 100.0, 101.0, 99.0]
+    assert np.array_equal(ticks.avg_price, ticks.price)
+    assert list(ticks.taker_side) == [SIDE_BUY, SIDE_BUY, SIDE_BUY, SIDE_SELL]
+
+    fills = pd.read_csv(tmp_path/"out"/"fills_BTC-USD.csv")
+    assert fills.values.tolist() == [[T0 + 2000, 0.01, 101.0, "buy", 0.005]]
@@ -0,0 +1,69 @@
+from src.log_writer import LogWriter, LOG_ERROR, LOG_WARN, LOG_INFO
+import os
+import re
+import threading
+
+def read(folder, name):
+    with open(os.path.join(folder, name)) as f:
+        return f.read().splitlines()
+
+# Test that every level is fanned out to the right files in the usual line format
+def test_fan_out(tmp_path):
+    writer = LogWriter(str(tmp_path), console=False)
+    writer.write(LOG_INFO, "A", "info line")
+    writer.write(LOG_WARN, "B", "warn line")
+    writer.write(LOG_ERROR, "C", {"message": "error"})
+    writer.close()
+
+    info = read(tmp_path, "info.log")
+    assert len(info) == 3
+    assert re.match(r"^\[INFO\]\[A,\d{8}_\d{6}\]:info line$", info[0])
+    assert info[1].startswith("[WARN][B,") and info[2].startswith("[ERR][C,")
+    assert info[2].endswith("]:{'message': 'error'}")
+    assert read(tmp_path, "warn.log") == info[1:]
+    assert read(tmp_path, "error.log") == info[2:]
+
+    metrics = writer.metrics()
+    assert metrics["queued"] == 3 and metrics["written"] == 3 and metrics["dropped"] == 0
+
+# Test that a full queue drops new records instead of blocking
+def test_bounded(tmp_path):
+    writer = LogWriter(str(tmp_path), console=False, max_queue=5, flush_interval=60.0)
+    for i in range(8):
+        writer.write(LOG_INFO, "A", i)
+
+    metrics = writer.metrics()
+    assert metrics["depth"] == 5 and metrics["max_depth"] == 5 and metrics["dropped"] == 3
+    writer.close()
+    assert [line.split(":")[-1] for line in read(tmp_path, "info.log")] == ["0", "1", "2", "3", "4"]
+
+# Test that swapping folders writes what was logged before to the old files, on the writer thread,
+# and only then says the old files are done with. A swap into a full queue still happens
+def test_swap(tmp_path):
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+
+    closed = []
+    def on_closed():
+        closed.append((threading.current_thread().name, read(first, "info.log")))
+
+    writer = LogWriter(str(first), console=False, flush_interval=60.0)
+    writer.write(LOG_INFO, "A", "before")
+    writer.swap(str(second), on_closed)
+    writer.write(LOG_INFO, "A", "after")
+    writer.close()
+
+    assert len(closed) == 1
+    assert closed[0][0] == "LogWriter"
+    assert [line.split(":")[-1] for line in closed[0][1]] == ["before"]
+    assert [line.split(":")[-1] for line in read(second, "info.log")] == ["after"]
+
+    writer = LogWriter(str(second), console=False, max_queue=1, flush_interval=60.0)
+    writer.write(LOG_INFO, "A", "kept")
+    writer.write(LOG_INFO, "A", "dropped")
+    writer.swap(str(first), lambda: closed.append(None))
+    writer.close()
+    assert len(closed) == 2
+    assert [line.split(":")[-1] for line in read(second, "info.log")] == ["kept"]
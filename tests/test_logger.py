@@ -0,0 +1,99 @@
+from src.logger import Logger, parse_levels, LOG_ERROR, LOG_WARN, LOG_INFO, LOG_OFF
+import os
+import tarfile
+
+# Counts how often it is turned into a string
+class Counted:
+    def __init__(self):
+        self.count = 0
+
+    def __format__(self, spec):
+        self.count += 1
+        return "counted"
+
+def get_test_logger(tmp_path, monkeypatch, levels):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LOG_DRIVE", "test")
+    return Logger(console=False, levels=levels)
+
+def read_info(logger):
+    with open(logger.info_path) as f:
+        return f.read().splitlines()
+
+# Test the level spec of every component
+def test_parse_levels():
+    assert parse_levels("") == {}
+    assert parse_levels("TickerClient=WARN, Buyer=info,*=ERROR") == {"TickerClient": LOG_WARN, "Buyer": LOG_INFO, "*": LOG_ERROR}
+    assert parse_levels("Seller,ETH-USD=OFF,*=WARN") == {"Seller,ETH-USD": LOG_OFF, "*": LOG_WARN}
+    for spec in ["Buyer=LOUD", "Buyer", "Buyer=INFO,Seller"]:
+        try:
+            parse_levels(spec)
+            assert False
+        except Exception as e:
+            assert "log level" in str(e)
+
+# Test per component levels and that lines that aren't logged are never formatted
+def test_levels(tmp_path, monkeypatch):
+    logger = get_test_logger(tmp_path, monkeypatch, "TickerClient=WARN,Seller,ETH-USD=OFF,*=INFO")
+    assert logger.enabled("Buyer,BTC-USD", LOG_INFO)
+    assert logger.enabled("TickerClient", LOG_INFO) == False
+    assert logger.enabled("TickerClient", LOG_ERROR)
+    assert logger.enabled("Seller,ETH-USD", LOG_ERROR) == False
+    assert logger.enabled("Seller,BTC-USD", LOG_INFO)
+
+    arg = Counted()
+    logger.log_info("TickerClient", "tick {}", arg)
+    logger.log_info("Seller,ETH-USD", "noop {}", arg)
+    logger.log_warn("TickerClient", "gap {}", arg)
+    logger.log_info("Buyer,BTC-USD", "noop price({}) size({})", 1.5, 2)
+    logger.log_info("Buyer,BTC-USD", {"message": "not a format"})
+    logger.close()
+
+    lines = [line.split("]:", 1)[1] for line in read_info(logger)]
+    assert lines == ["gap counted", "noop price(1.5) size(2)", "{'message': 'not a format'}"]
+    assert arg.count == 1
+
+# Test a message that doesn't fit its args is still logged
+def test_bad_format(tmp_path, monkeypatch):
+    logger = get_test_logger(tmp_path, monkeypatch, {})
+    logger.log_info("Buyer", "price({}) size({})", 1.5)
+    logger.close()
+    assert read_info(logger)[0].endswith("]:price({}) size({}) (1.5,)")
+
+# Test the log folder is archived to LOG_ARCHIVE_DIR with everything logged in it when the logger closes
+def test_close_save(tmp_path, monkeypatch):
+    monkeypatch.setenv("LOG_ARCHIVE_DIR", str(tmp_path / "uploads"))
+    logger = get_test_logger(tmp_path, monkeypatch, {})
+    logger.log_info("Buyer", "last line")
+    logger.close(save=True)
+
+    assert os.path.exists(logger.log_folder) == False
+    archive = os.path.basename(logger.log_folder) + ".tar.gz"
+    assert os.path.exists(str(tmp_path / "uploads" / archive))
+    assert os.path.exists(str(tmp_path / "uploads" / (archive + ".sha256")))
+
+class FakeLoop:
+    def call_later(self, delay, callback):
+        return
+
+# Test rotation hands the old folder to the archiver once the writer thread has written it out
+def test_new_log_folder(tmp_path, monkeypatch):
+    monkeypatch.setenv("LOG_ARCHIVE_DIR", str(tmp_path / "uploads"))
+    logger = get_test_logger(tmp_path, monkeypatch, {})
+    logger.loop = FakeLoop()
+    old_folder = logger.log_folder
+    logger.log_info("Buyer", "old line")
+
+    # Folder names are made to the second, the new one goes in another folder so it can't clash
+    (tmp_path / "next").mkdir()
+    monkeypatch.chdir(tmp_path / "next")
+    logger.new_log_folder()
+    logger.log_info("Buyer", "new line")
+    logger.close()
+
+    with tarfile.open(str(tmp_path / "uploads" / (os.path.basename(old_folder) + ".tar.gz"))) as tar:
+        info = tar.extractfile(os.path.basename(old_folder) + "/info.log").read().decode()
+    assert "]:old line" in info
+    assert "new line" not in info
+    assert os.path.exists(old_folder) == False
+    assert [line.split("]:")[1] for line in read_info(logger)][-1] == "new line"
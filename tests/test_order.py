@@ -1,4 +1,4 @@
-from src.order import Order
+from src.order import Order, OPEN, PENDING_CANCEL, DONE
 
 # Completely empty order
 def test_order_opened_empty():
@@ -22,4 +22,19 @@ def test_order_opened_partial_fill():
 # Completely empty order
 def test_order_opened_full_fill():
     o = Order(price=100, order_size=1, order_id="blah-blah-blah", outstanding_order_size=10**-12)
-    assert o.opened() == True and o.filled() == True 
\ No newline at end of file
+    assert o.opened() == True and o.filled() == True 
+# A new order is in flight until the exchange answers
+def test_order_pending():
+    o = Order.pending(price=100, order_size=1)
+    assert o.in_flight() and o.opened() == False
+    assert len(o.client_oid) == 36
+    assert Order.pending(price=100, order_size=1).client_oid != o.client_oid
+
+    o.state = OPEN
+    assert o.in_flight() == False
+
+    o.state = PENDING_CANCEL
+    assert o.in_flight()
+
+    o.state = DONE
+    assert o.in_flight() == False
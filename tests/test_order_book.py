@@ -0,0 +1,55 @@
+from src.exchange.backtest.order_book import SimOrderBook
+from src.exchange.backtest.tick_columns import encode_side, SIDE_BUY, SIDE_SELL
+
+def make_order(order_id, side, price, size):
+    order = {}
+    order["id"] = order_id
+    order["side"] = side
+    order["side_code"] = encode_side(side)
+    order["price"] = price
+    order["size"] = size
+    return order
+
+# Test that a sell trade fills the highest bids first and stops at its own size
+def test_match_price_priority():
+    book = SimOrderBook()
+    book.add(make_order("a", "buy", 99.0, 1.0))
+    book.add(make_order("b", "buy", 101.0, 0.5))
+    book.add(make_order("c", "buy", 100.0, 0.5))
+
+    fills = book.match(SIDE_SELL, 98.0, 1.25)
+
+    assert [(o["id"], s) for o,s in fills] == [("b", 0.5), ("c", 0.5), ("a", 0.25)]
+    assert list(book.bids.keys()) == [99.0]
+    assert book.bids[99.0]["a"]["size"] == 0.75
+
+# Test that orders at the same price fill in the order they were placed
+def test_match_time_priority():
+    book = SimOrderBook()
+    book.add(make_order("first", "sell", 100.0, 0.5))
+    book.add(make_order("second", "sell", 100.0, 0.5))
+
+    fills = book.match(SIDE_BUY, 101.0, 0.75)
+
+    assert [(o["id"], s) for o,s in fills] == [("first", 0.5), ("second", 0.25)]
+    assert list(book.asks[100.0].keys()) == ["second"]
+
+# Test that trades on the same side or at our price don't cross
+def test_match_no_cross():
+    book = SimOrderBook()
+    book.add(make_order("a", "buy", 100.0, 1.0))
+    book.add(make_order("b", "sell", 102.0, 1.0))
+
+    assert book.match(SIDE_BUY, 99.0, 1.0) == []
+    assert book.match(SIDE_SELL, 100.0, 1.0) == []
+    assert book.match(SIDE_BUY, 102.0, 1.0) == []
+
+# Test removing orders and cleaning up empty price levels
+def test_remove():
+    book = SimOrderBook()
+    a = make_order("a", "buy", 100.0, 1.0)
+    book.add(a)
+
+    assert book.remove(a) == True
+    assert book.remove(a) == False
+    assert len(book.bids) == 0
@@ -0,0 +1,83 @@
+from src.exchange.cbpro.order_index import OrderIndex
+
+# Clock we can move by hand
+class FakeClock:
+    def __init__(self):
+        self.t = 100.0
+
+    def __call__(self):
+        return self.t
+
+def received(order_id, side="buy", product_id="BTC-USD", size="1.0", price="100.0"):
+    return {"type": "received", "order_type": "limit", "order_id": order_id, "product_id": product_id, "side": side, "size": size, "price": price, "client_oid": "c-" + order_id}
+
+# Test an order's life through the user channel messages
+def test_order_lifecycle():
+    index = OrderIndex()
+    index.on_message(received("a"))
+    index.on_message(received("b", side="sell"))
+    index.on_message(received("c", product_id="ETH-USD"))
+
+    assert [o["id"] for o in index.open_orders("BTC-USD", "buy")] == ["a"]
+    assert [o["id"] for o in index.open_orders("BTC-USD", "sell")] == ["b"]
+    assert index.open_orders("ETH-USD", "sell") == []
+
+    index.on_message({"type": "open", "order_id": "a", "product_id": "BTC-USD", "side": "buy", "price": "100.0", "remaining_size": "1.0"})
+    index.on_message({"type": "match", "maker_order_id": "a", "taker_order_id": "x", "size": "0.25", "price": "100.0"})
+    index.on_message({"type": "change", "order_id": "a", "old_size": "1.0", "new_size": "0.9", "price": "100.0"})
+    order = index.orders["a"]
+    assert order["status"] == "open"
+    assert abs(order["remaining_size"] - 0.65) < 10**-12
+
+    index.on_message({"type": "done", "order_id": "a", "reason": "canceled"})
+    assert "a" not in index
+    assert index.open_orders("BTC-USD", "buy") == []
+    assert index.message_count == 7
+
+    # Ticker messages are none of its business
+    assert index.on_message({"type": "ticker"}) == False
+
+# Test that a late place response doesn't bring back an order the stream already saw finish
+def test_track_after_done():
+    index = OrderIndex()
+    index.on_message({"type": "done", "order_id": "a", "reason": "filled"})
+    index.track({"id": "a", "product_id": "BTC-USD", "side": "buy", "price": "100.0", "size": "1.0", "filled_size": "0.0", "status": "pending"})
+    assert len(index) == 0
+
+    index.track({"id": "b", "product_id": "BTC-USD", "side": "buy", "price": "100.0", "size": "1.0", "filled_size": "0.5", "status": "pending"})
+    assert index.orders["b"]["remaining_size"] == 0.5
+
+    # Failed requests have no order to track
+    index.track({"message": "Post only mode"})
+    assert len(index) == 1
+
+# Test reconciling against a REST snapshot
+def test_reconcile():
+    clock = FakeClock()
+    index = OrderIndex(clock=clock)
+    index.on_message(received("stale"))
+    index.on_message(received("gone"))
+    index.on_message({"type": "done", "order_id": "gone"})
+
+    clock.t += 1
+    started = clock()
+    clock.t += 1
+    # Placed while the snapshot was being taken
+    index.on_message(received("new"))
+
+    snapshot = [{"id": "missed", "product_id": "BTC-USD", "side": "sell", "price": "101.0", "size": "2.0", "filled_size": "0.5"},
+                {"id": "gone", "product_id": "BTC-USD", "side": "buy", "price": "100.0", "size": "1.0", "filled_size": "0.0"}]
+    fixes = index.reconcile(snapshot, started)
+
+    assert fixes == 2
+    assert sorted(index.orders) == ["missed", "new"]
+    assert index.orders["missed"]["remaining_size"] == 1.5
+    assert index.reconcile(snapshot, started) == 0
+    assert index.fix_count == 2
+
+# Test that the memory of finished orders is bounded
+def test_done_memory():
+    index = OrderIndex(done_memory=3)
+    for k in range(10):
+        index.on_message({"type": "done", "order_id": str(k)})
+    assert sorted(index.done_ids) == ["7", "8", "9"]
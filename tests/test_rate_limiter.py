@@ -0,0 +1,131 @@
+from src.exchange.rate_limiter import TokenBucket, RateLimiter, PRIORITY_CANCEL, PRIORITY_RECONCILE, PRIORITY_QUOTE
+import asyncio
+import threading
+import time
+
+# Clock we can move by hand
+class FakeClock:
+    def __init__(self):
+        self.t = 100.0
+
+    def __call__(self):
+        return self.t
+
+# Test that tokens come back with time and stop at the burst size
+def test_bucket_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=4, burst=2, clock=clock)
+
+    assert bucket.take(2)
+    assert bucket.take() == False
+    assert bucket.wait_time() == 0.25
+
+    clock.t += 0.25
+    assert bucket.take()
+    assert bucket.take() == False
+
+    clock.t += 10
+    bucket.refill()
+    assert bucket.tokens == 2
+
+# Test that there is no background thread and no waiting while there is budget
+def test_acquire_without_waiting():
+    threads_before = len(threading.enumerate())
+    limiter = RateLimiter({"private": (1, 3)})
+
+    async def run():
+        start = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.05
+    assert len(threading.enumerate()) == threads_before
+
+    metrics = limiter.metrics()["private"]
+    assert metrics["granted"] == 3
+    assert metrics["waited"] == 0
+    assert metrics["available"] < 1
+
+# Test that once the budget runs out, waiters are woken up at the refill rate
+def test_acquire_waits_for_tokens():
+    limiter = RateLimiter({"private": (20, 1)})
+
+    async def run():
+        start = time.monotonic()
+        for _ in range(4):
+            await limiter.acquire()
+        return time.monotonic() - start
+
+    # 3 tokens at 20/s
+    elapsed = asyncio.run(run())
+    assert 0.14 < elapsed < 0.5
+    assert limiter.metrics()["private"]["waited"] == 3
+
+# Test that cancels and reconciliation go ahead of quotes that were waiting before them
+def test_priority_lanes():
+    limiter = RateLimiter({"private": (20, 1)})
+    order = []
+
+    async def request(name, priority):
+        await limiter.acquire(priority=priority)
+        order.append(name)
+
+    async def run():
+        await limiter.acquire()
+        tasks = [asyncio.create_task(request("quote_1", PRIORITY_QUOTE)),
+                 asyncio.create_task(request("quote_2", PRIORITY_QUOTE)),
+                 asyncio.create_task(request("reconcile", PRIORITY_RECONCILE)),
+                 asyncio.create_task(request("cancel", PRIORITY_CANCEL))]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["cancel", "reconcile", "quote_1", "quote_2"]
+
+# Test that tiers have separate budgets and a cancelled waiter gives up its place
+def test_tiers_and_cancel():
+    limiter = RateLimiter({"private": (1, 1), "public": (1, 1)})
+
+    async def run():
+        await limiter.acquire(tier="private")
+        await asyncio.wait_for(limiter.acquire(tier="public"), 0.05)
+
+        try:
+            await asyncio.wait_for(limiter.acquire(tier="private"), 0.05)
+            assert False
+        except asyncio.TimeoutError:
+            pass
+        limiter.close()
+
+    asyncio.run(run())
+    metrics = limiter.metrics()
+    assert metrics["private"]["cancelled"] == 1
+    assert metrics["private"]["queued"] == 0
+    assert metrics["public"]["granted"] == 1
+
+# Test that asking for more tokens than the bucket can ever hold fails instead of waiting forever
+def test_acquire_too_many():
+    limiter = RateLimiter({"private": (5, 5)})
+    try:
+        asyncio.run(limiter.acquire(6))
+        assert False
+    except Exception as e:
+        assert "burst" in str(e)
+
+# Test that wait() holds its place in line but leaves the tokens for the request that follows
+def test_wait_does_not_spend():
+    limiter = RateLimiter({"private": (20, 1)})
+
+    async def run():
+        await limiter.wait()
+        assert limiter.metrics()["private"]["available"] == 1
+
+        await limiter.acquire()
+        start = time.monotonic()
+        await limiter.wait()
+        waited = time.monotonic() - start
+        await limiter.acquire()
+        return waited
+
+    assert asyncio.run(run()) > 0.04
+    assert limiter.metrics()["private"]["granted"] == 2
@@ -0,0 +1,27 @@
+from src.records import Tick, Fill
+from src.exchange.cbpro.async_websocket import AsyncWebsocketClient
+
+# Test a ticker message is decoded with every number a float
+def test_tick_from_ticker():
+    msg = AsyncWebsocketClient().decode('{"type": "ticker", "product_id": "BTC-USD", "price": "100.5", "side": "buy", "last_size": "0.25", "best_bid": "100.4", "best_ask": "100.6"}')
+    tick = Tick.from_ticker(msg)
+
+    assert tick.product_id == "BTC-USD"
+    assert tick.price == 100.5 and tick.size == 0.25
+    assert tick.best_bid == 100.4 and tick.best_ask == 100.6
+    assert tick.taker_side == "buy" and tick.maker_side == "sell"
+
+    # Records have no __dict__, so no stray attributes
+    try:
+        tick.extra = 1
+        assert False
+    except AttributeError:
+        pass
+
+# Test a match message where we were the maker is decoded into a fill
+def test_fill_from_match():
+    msg = {"type": "match", "product_id": "BTC-USD", "maker_order_id": "a", "taker_order_id": "b", "side": "sell", "price": "100.0", "size": "0.5", "maker_fee_rate": "0.005"}
+    fill = Fill.from_match(msg)
+
+    assert fill.maker_order_id == "a" and fill.side == "sell"
+    assert fill.price == 100.0 and fill.size == 0.5 and fill.maker_fee_rate == 0.005
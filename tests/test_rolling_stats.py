@@ -0,0 +1,60 @@
+from src.rolling_stats import RollingStats, TICK_LOOKBACK_SAMPLES
+import collections as col
+import numpy as np
+
+# The windowed mean the TickerClient used to recompute from scratch on every tick
+def naive_mean_change(samples):
+    changes = [(p - prev_p)/prev_p for prev_p, p in zip(samples, samples[1:])]
+    return sum(changes)/len(changes)
+
+# Test that the incremental mean matches recomputing it over the window every tick
+def test_mean_change_matches_window():
+    rng = np.random.default_rng(0)
+    prices = list(30000 + np.cumsum(rng.normal(0, 5, 500)))
+
+    stats = RollingStats()
+    samples = col.deque(maxlen=TICK_LOOKBACK_SAMPLES)
+    for price in prices:
+        stats.update(price)
+        samples.append(price)
+
+        assert stats.ready() == (len(samples) > 1)
+        if stats.ready():
+            assert abs(stats.mean_change() - naive_mean_change(list(samples))) < 10**-15
+
+# Test that the volatility is the standard deviation of the changes in the window
+def test_volatility():
+    rng = np.random.default_rng(1)
+    prices = list(100 + np.cumsum(rng.normal(0, 0.5, 200)))
+
+    stats = RollingStats(lookback_samples=11)
+    for price in prices:
+        stats.update(price)
+
+    window = np.array(prices[-11:])
+    changes = np.diff(window)/window[:-1]
+    assert abs(stats.volatility() - changes.std()) < 10**-12
+
+# Test the exponential moving average
+def test_ema():
+    stats = RollingStats(lookback_samples=3, ema_span=3)
+    for price in [10.0, 20.0, 20.0]:
+        stats.update(price)
+
+    # alpha = 0.5: 10 -> 15 -> 17.5
+    assert stats.ema == 17.5
+
+# Test that per product settings come from the config with defaults for missing values
+def test_from_config():
+    assert RollingStats.from_config({"PRODUCT": "BTC-USD"}).window == TICK_LOOKBACK_SAMPLES - 1
+    assert RollingStats.from_config({"TICK_LOOKBACK_SAMPLES": float("nan")}).window == TICK_LOOKBACK_SAMPLES - 1
+
+    stats = RollingStats.from_config({"TICK_LOOKBACK_SAMPLES": 20.0, "EMA_SPAN": 9})
+    assert stats.window == 19
+    assert stats.ema_alpha == 0.2
+
+    try:
+        RollingStats(lookback_samples=1)
+        assert False
+    except Exception as e:
+        assert "at least 2" in str(e)
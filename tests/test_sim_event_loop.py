@@ -0,0 +1,59 @@
+from src.exchange.backtest.sim_event_loop import SimEventLoop
+
+# Test that events run in time order and only once they are due
+def test_sim_loop_time_order():
+    loop = SimEventLoop(t=100)
+    ran = []
+    loop.call_at(130, ran.append, "c")
+    loop.call_at(110, ran.append, "a")
+    loop.call_later(20, ran.append, "b")
+
+    assert loop.next_time() == 110
+
+    loop.run_until(115)
+    assert ran == ["a"]
+    assert loop.time() == 115
+
+    loop.run_until(130)
+    assert ran == ["a", "b", "c"]
+    assert len(loop) == 0
+    assert loop.next_time() == None
+
+# Test that events due at the same time run in the order they were scheduled
+def test_sim_loop_ties_deterministic():
+    loop = SimEventLoop(t=0)
+    ran = []
+    for k in range(50):
+        loop.call_at(5, ran.append, k)
+
+    loop.run_until(5)
+    assert ran == list(range(50))
+
+# Test that cancelled events never run and don't count as the next event
+def test_sim_loop_cancel():
+    loop = SimEventLoop(t=0)
+    ran = []
+    handle = loop.call_at(1, ran.append, "cancelled")
+    loop.call_at(2, ran.append, "kept")
+    handle.cancel()
+
+    assert handle.cancelled() == True
+    assert loop.next_time() == 2
+
+    loop.run_until(2)
+    assert ran == ["kept"]
+
+# Test that a callback can reschedule itself like the order watchdog does
+def test_sim_loop_reschedule():
+    loop = SimEventLoop(t=0)
+    ran = []
+
+    def watchdog():
+        ran.append(loop.time())
+        loop.call_later(10, watchdog)
+
+    loop.call_soon(watchdog)
+    for t in range(0, 35):
+        loop.run_until(t)
+
+    assert ran == [0, 10, 20, 30]
@@ -0,0 +1,93 @@
+from src.sweep import sweep, run_backtest, run_combination, expand_grid, share_tick_columns, attach_tick_columns
+from src.exchange.backtest.tick_columns import TickColumns
+import pandas as pd
+import numpy as np
+
+def get_test_data():
+    n = 2000
+    rng = np.random.default_rng(0)
+    price = 30000 + np.cumsum(rng.normal(0, 5, n))
+    ticks = {}
+    ticks["time"] = 1600000000000 + np.sort(rng.integers(0, n*200, n))
+    ticks["price"] = price
+    ticks["size"] = rng.uniform(0.001, 0.5, n)
+    ticks["taker_side"] = np.where(rng.random(n) < 0.5, "buy", "sell")
+    ticks["bid"] = price - 0.01
+    ticks["ask"] = price + 0.01
+    ticks["avg_price"] = price
+
+    wallet = {}
+    wallet["Currency"] = ["USD", "BTC"]
+    wallet["Available"] = [10000.0, 0.3]
+    wallet["OnHold"] = [0.0, 0.0]
+
+    config = {}
+    config["PRODUCT"] = ["BTC-USD"]
+    config["TRADE"] = [True]
+    config["P_DIFF_THRESH"] = [0.001]
+    config["V_DIFF_THRESH"] = [0.25]
+    config["BPCM"] = [0.0001]
+    config["BTM"] = [5.0]
+    config["DTM"] = [9.0]
+    config["PR"] = [0.15]
+
+    return pd.DataFrame(config), TickColumns.from_frame(pd.DataFrame(ticks)), pd.DataFrame(wallet)
+
+# Test that the grid expands into every combination and rejects unknown parameters
+def test_expand_grid():
+    combos = expand_grid({"BTM": [1.0, 5.0], "DTM": [3.0, 9.0, 12.0]})
+    assert len(combos) == 6
+    assert {"BTM": 5.0, "DTM": 12.0} in combos
+
+    try:
+        expand_grid({"NOT_A_PARAM": [1]})
+        assert False
+    except Exception as e:
+        assert "NOT_A_PARAM" in str(e)
+
+# Test that workers see the same ticks through shared memory without copying them
+def test_share_tick_columns():
+    _, ticks, _ = get_test_data()
+    blocks, spec = share_tick_columns(ticks)
+    try:
+        views, shared = attach_tick_columns(spec)
+        assert np.array_equal(shared.price, ticks.price)
+        assert np.array_equal(shared.taker_side, ticks.taker_side)
+        assert shared.price.flags["WRITEABLE"] == False
+        for shm in views:
+            shm.close()
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+# Test that the pooled sweep produces one row per combination matching a backtest run in process
+def test_sweep_matches_single_run():
+    config, ticks, wallet = get_test_data()
+    results = sweep(config, {"BTM": [1.0, 5.0], "DTM": [3.0, 9.0]}, ticks, wallet, workers=2)
+
+    assert len(results) == 4
+    assert list(results["portfolio_value"]) == sorted(results["portfolio_value"], reverse=True)
+    assert (results["order_count"] > 0).all()
+
+    single = run_backtest({"BTM": 1.0, "DTM": 9.0}, config, ticks, wallet)
+    row = results[(results["BTM"] == 1.0) & (results["DTM"] == 9.0)].iloc[0]
+    assert row["portfolio_value"] == single["portfolio_value"]
+    assert row["fill_count"] == single["fill_count"]
+    assert row["order_count"] == single["order_count"]
+
+# Test a worker task attaches the shared ticks itself, runs quietly and matches a run on the ticks in process
+def test_run_combination(capsys):
+    config, ticks, wallet = get_test_data()
+    blocks, spec = share_tick_columns(ticks)
+    try:
+        row = run_combination({"BTM": 1.0}, {"BTC-USD": spec}, config.to_dict(orient="records"), wallet.to_dict(orient="records"))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    assert capsys.readouterr().out == ""
+    single = run_backtest({"BTM": 1.0}, config, ticks, wallet)
+    assert row["portfolio_value"] == single["portfolio_value"]
+    assert row["order_count"] == single["order_count"]
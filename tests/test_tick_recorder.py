@@ -0,0 +1,99 @@
+from src.exchange.cbpro.tick_recorder import TickRecorder, capture_index, read_capture, capture_ticks, write_capture_tick_store, feed_time
+from src.exchange.backtest.tick_columns import SIDE_BUY, SIDE_SELL
+from src.exchange.backtest.tick_store import open_ticks
+from src.records import Tick
+import numpy as np
+import os
+import time
+
+T0 = 1609459200000 # 2021-01-01
+
+def feed_time_str(t):
+    return "{}.{:06d}Z".format(np.datetime64(t // 1000, "s").astype(str), (t % 1000) * 1000)
+
+# Records 30 ticks alternating between two products and a level2 update after every third one
+def record_test_feed(path, chunk_records=8):
+    recorder = TickRecorder(str(path), chunk_records=chunk_records)
+    for i in range(30):
+        product_id = "BTC-USD" if i % 2 == 0 else "ETH-USD"
+        tick = Tick(product_id, 100.0 + i, 0.1, "buy" if i % 3 else "sell", 99.5 + i, 100.5 + i, received=float(i))
+        recorder.record_tick(tick, feed_time_str(T0 + 1000 * i))
+        if i % 3 == 0:
+            recorder.record_message({"type": "l2update", "product_id": product_id, "time": feed_time_str(T0 + 1000 * i), "changes": [["buy", str(99.5 + i), "1.0"]]})
+    recorder.close()
+    return recorder
+
+# Test feed timestamps are parsed to epoch ms
+def test_feed_time():
+    assert feed_time("2021-01-01T00:00:00.123456Z") == T0 + 123
+    assert feed_time(feed_time_str(T0 + 5001)) == T0 + 5001
+
+    # Any number of digits in the fraction, and no time zone
+    assert feed_time("2021-01-01T00:00:00.1Z") == T0 + 100
+    assert feed_time("2021-01-01T00:00:00.12345678Z") == T0 + 123
+    assert feed_time("2021-01-01T00:00:01") == T0 + 1000
+
+    # The time it is recorded at when there is nothing we can read
+    for value in [None, "", "yesterday", "2021-13-01T00:00:00Z"]:
+        assert abs(feed_time(value) - time.time() * 1000) < 60000
+
+# Test everything recorded is read back chunk by chunk with the time range of each chunk in its header
+def test_record_and_read(tmp_path):
+    recorder = record_test_feed(tmp_path/"capture.tkc")
+    assert recorder.metrics() == {"recorded": 40, "chunks": 5, "errors": 0}
+
+    index = capture_index(str(tmp_path/"capture.tkc"))
+    assert len(index) == 5
+    assert index[0][1] == T0 and index[-1][2] == T0 + 29000
+    assert all(index[i][2] <= index[i + 1][1] for i in range(len(index) - 1))
+
+    chunks = list(read_capture(str(tmp_path/"capture.tkc")))
+    ticks = np.concatenate([t for t, _ in chunks])
+    messages = [m for _, chunk in chunks for m in chunk]
+    assert len(ticks) == 30 and len(messages) == 10
+    assert list(ticks["price"]) == [100.0 + i for i in range(30)]
+    assert ticks["product_id"][1] == b"ETH-USD"
+    assert ticks["taker_side"][0] == SIDE_SELL and ticks["taker_side"][1] == SIDE_BUY
+    assert messages[1] == (T0 + 3000, {"type": "l2update", "product_id": "ETH-USD", "time": feed_time_str(T0 + 3000), "changes": [["buy", "102.5", "1.0"]]})
+
+    # Only the chunks overlapping a range are read and the records outside it are left out
+    chunks = list(read_capture(str(tmp_path/"capture.tkc"), T0 + 10000, T0 + 20000))
+    assert len(chunks) < 5
+    ticks = np.concatenate([t for t, _ in chunks])
+    assert list(ticks["time"]) == [T0 + 1000 * i for i in range(10, 20)]
+
+# Test chunks that fail on the writer thread and failures counted while recording all add up
+def test_error_count(tmp_path):
+    recorder = TickRecorder(str(tmp_path/"capture.tkc"), chunk_records=1)
+    recorder.fp.close()
+    for i in range(200):
+        recorder.record_message({"type": "match", "time": feed_time_str(T0 + i)})
+        recorder.count_error()
+    recorder.executor.shutdown(wait=True)
+    assert recorder.metrics() == {"recorded": 200, "chunks": 200, "errors": 400}
+
+# Test a chunk cut short by a crash is left out
+def test_torn_chunk(tmp_path):
+    path = str(tmp_path/"capture.tkc")
+    record_test_feed(path)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 10)
+    assert len(capture_index(path)) == 4
+    assert sum(len(t) for t, _ in read_capture(path)) == 24
+
+# Test converting a capture gives a tick store the backtest reads, per product and sorted by time
+def test_capture_tick_store(tmp_path):
+    record_test_feed(tmp_path/"a.tkc")
+    recorder = TickRecorder(str(tmp_path/"b.tkc"))
+    recorder.record_tick(Tick("BTC-USD", 50.0, 1.0, "buy", 49.0, 51.0), feed_time_str(T0 + 500))
+    recorder.close()
+
+    ticks = capture_ticks([str(tmp_path/"a.tkc"), str(tmp_path/"b.tkc")], "BTC-USD")
+    assert list(ticks.time) == [T0, T0 + 500] + [T0 + 1000 * i for i in range(2, 30, 2)]
+    assert np.array_equal(ticks.avg_price, ticks.price)
+
+    store = write_capture_tick_store([str(tmp_path/"a.tkc"), str(tmp_path/"b.tkc")], "BTC-USD", str(tmp_path/"store"))
+    assert len(store) == 16
+    got = list(open_ticks(str(tmp_path/"store")))[0]
+    for name in ["time", "price", "size", "taker_side", "bid", "ask", "avg_price"]:
+        assert np.array_equal(getattr(got, name), getattr(ticks, name))
@@ -0,0 +1,78 @@
+from src.exchange.backtest.tick_store import TickStore, write_tick_store, open_ticks, parse_time, MS_PER_DAY
+from src.exchange.backtest.tick_columns import TickColumns
+import pandas as pd
+import numpy as np
+
+DAY0 = 18628 * MS_PER_DAY # 2021-01-01
+
+def get_test_ticks():
+    n = 1000
+    rng = np.random.default_rng(0)
+    price = 100 + np.cumsum(rng.normal(0, 0.1, n))
+    ticks = {}
+    # Spread over 4 days with an empty day in between
+    ticks["time"] = DAY0 + np.sort(np.concatenate([rng.integers(0, 2*MS_PER_DAY, n - 100), rng.integers(3*MS_PER_DAY, 4*MS_PER_DAY, 100)]))
+    ticks["price"] = price
+    ticks["size"] = rng.uniform(0.001, 0.5, n)
+    ticks["taker_side"] = np.where(rng.random(n) < 0.5, "buy", "sell")
+    ticks["bid"] = price - 0.01
+    ticks["ask"] = price + 0.01
+    ticks["avg_price"] = price
+    return pd.DataFrame(ticks)
+
+# Test that converting a csv gives back the same ticks split by day
+def test_write_tick_store(tmp_path):
+    df = get_test_ticks()
+    df.to_csv(tmp_path/"ticks.csv", index=False)
+
+    # Small chunksize so days get split across csv chunks
+    store = write_tick_store(tmp_path/"ticks.csv", str(tmp_path/"store"), chunksize=97)
+
+    assert len(store) == len(df)
+    assert list(store.index["day"]) == ["20210101", "20210102", "20210104"]
+
+    expected = TickColumns.from_csv(tmp_path/"ticks.csv")
+    got = TickColumns.concatenate(list(store.chunks()))
+    for name in ["time", "price", "size", "taker_side", "bid", "ask", "avg_price"]:
+        assert np.array_equal(getattr(got, name), getattr(expected, name))
+
+    # Columns are memory mapped rather than read into memory
+    assert isinstance(store.day_columns("20210101").price.base, np.memmap)
+
+# Test that a time range only yields the ticks inside it
+def test_tick_store_range(tmp_path):
+    df = get_test_ticks()
+    df.to_csv(tmp_path/"ticks.csv", index=False)
+    write_tick_store(tmp_path/"ticks.csv", str(tmp_path/"store"))
+
+    start = DAY0 + MS_PER_DAY + 1000
+    end = DAY0 + 3*MS_PER_DAY + MS_PER_DAY//2
+    expected = df[(df["time"] >= start) & (df["time"] < end)]
+
+    chunks = list(open_ticks(str(tmp_path/"store"), start, end))
+    assert len(chunks) == 2
+    got = TickColumns.concatenate(chunks)
+    assert np.array_equal(got.time, expected["time"].to_numpy())
+
+    # The csv path gives the same answer
+    got = TickColumns.concatenate(list(open_ticks(str(tmp_path/"ticks.csv"), start, end)))
+    assert np.array_equal(got.time, expected["time"].to_numpy())
+
+# Test that unsorted csvs are rejected
+def test_write_tick_store_unsorted(tmp_path):
+    df = get_test_ticks()
+    df = df.iloc[::-1]
+    df.to_csv(tmp_path/"ticks.csv", index=False)
+
+    try:
+        write_tick_store(tmp_path/"ticks.csv", str(tmp_path/"store"))
+        assert False
+    except Exception as e:
+        assert "sorted" in str(e)
+
+# Test parsing the backtest range boundaries
+def test_parse_time():
+    assert parse_time(None) == None
+    assert parse_time("20210101") == DAY0
+    assert parse_time("2021-01-02") == DAY0 + MS_PER_DAY
+    assert parse_time(str(DAY0 + 5)) == DAY0 + 5
@@ -0,0 +1,52 @@
+from src.exchange.backtest.tick_stream import TickStream, tick_extent
+from src.exchange.backtest.tick_columns import TickColumns
+import numpy as np
+
+def make_ticks(times):
+    n = len(times)
+    price = np.arange(n, dtype=np.float64) + 100.0
+    return TickColumns(time=times, price=price, size=np.ones(n), taker_side=np.zeros(n),
+                       bid=price - 0.5, ask=price + 0.5, avg_price=price)
+
+# Pop every due cursor one tick at a time and record which product each tick came from
+def drain(stream):
+    out = []
+    while stream.next_time() is not None:
+        t = stream.next_time()
+        cursor = stream.pop_due(t)
+        while cursor is not None:
+            out.append((int(cursor.time()), cursor.product_id))
+            cursor.i += 1
+            stream.push(cursor)
+            cursor = stream.pop_due(t)
+    return out
+
+# Test that ticks from several products come out merged by timestamp, ties in source order
+def test_merge_by_time():
+    stream = TickStream({
+        "BTC-USD": make_ticks([1, 4, 4, 9]),
+        "ETH-USD": make_ticks([2, 4, 10]),
+    })
+
+    assert drain(stream) == [(1, "BTC-USD"), (2, "ETH-USD"), (4, "BTC-USD"), (4, "BTC-USD"), (4, "ETH-USD"), (9, "BTC-USD"), (10, "ETH-USD")]
+
+# Test that chunked sources are read chunk by chunk, skipping empty chunks
+def test_merge_chunks():
+    stream = TickStream({
+        "BTC-USD": [make_ticks([1, 3]), make_ticks([]), make_ticks([5])],
+        "ETH-USD": iter([make_ticks([2]), make_ticks([6])]),
+    })
+
+    assert [t for t, _ in drain(stream)] == [1, 2, 3, 5, 6]
+
+# Test that nothing is due before its time and empty sources don't block the stream
+def test_pop_due():
+    stream = TickStream({"BTC-USD": make_ticks([5]), "ETH-USD": []})
+
+    assert stream.pop_due(4) == None
+    assert stream.pop_due(5).product_id == "BTC-USD"
+
+# Test the tick count and time span are only known when no source is a stream of chunks
+def test_tick_extent():
+    assert tick_extent({"BTC-USD": make_ticks([1, 4, 9]), "ETH-USD": make_ticks([2, 12])}) == (5, 11)
+    assert tick_extent({"BTC-USD": make_ticks([1, 4]), "ETH-USD": iter([make_ticks([2])])}) == (None, None)
@@ -0,0 +1,168 @@
+from src.agents.buyer import Buyer
+from src.agents.seller import Seller
+from src.exchange.cbpro.l2_book import L2Book
+from src.records import Tick, Fill
+from src.order import OPEN, PENDING_NEW, PENDING_CANCEL, DONE
+
+# Exchange that holds on to every request so the test decides when and how it is answered
+class FakeExchange:
+    def __init__(self):
+        self.requests = []
+        self.cancelled = []
+        self.available = {"BTC": 1.0, "USD": 1000.0}
+        self.hold = {"BTC": 0.0, "USD": 0.0}
+        self.balance = {"BTC": 1.0, "USD": 1000.0}
+
+    def update_quote(self, agent):
+        agent.reconcile_quote()
+
+    def place_limit_order(self, on_order_placed, **kwargs):
+        self.requests.append(("place", kwargs, on_order_placed, None))
+        return len(self.requests)
+
+    def replace_limit_order(self, prev_order, on_order_placed, on_order_cancelled=None, **kwargs):
+        self.requests.append(("replace", kwargs, on_order_placed, on_order_cancelled))
+        return len(self.requests)
+
+    def cancel_order(self, order_id, on_order_cancelled=None):
+        self.cancelled.append(order_id)
+
+def get_test_agent(logger, cls=Buyer):
+    config = {"PRODUCT": "BTC-USD", "TRADE": True, "P_DIFF_THRESH": 0.01, "V_DIFF_THRESH": 0.5, "BPCM": 0.001, "BTM": 1.0, "DTM": 1.0, "PR": 0.1}
+    agent = cls(config)
+    agent.exchange = FakeExchange()
+    agent.logger = logger
+    agent.quote_increment = 2
+    agent.base_increment = 4
+    agent.base_min_size = 0.0001
+    return agent
+
+def tick(agent, price):
+    agent.on_tick(Tick("BTC-USD", price, 1.0, "buy", price, price), price, 0.0)
+
+def accept(resp_id, kwargs):
+    return {"id": resp_id, "price": kwargs["price"], "size": kwargs["size"], "filled_size": 0.0}
+
+# Test that a new order is pending until the exchange answers and no second request goes out meanwhile
+def test_no_overlapping_requests(fake_logger):
+    agent = get_test_agent(fake_logger)
+    tick(agent, 100.0)
+
+    assert len(agent.exchange.requests) == 1
+    kind, kwargs, on_order_placed, _ = agent.exchange.requests[0]
+    assert kind == "place"
+    assert agent.order.state == PENDING_NEW
+    assert kwargs["client_oid"] in agent.orders
+
+    # Price moved a lot but the order is still in flight
+    tick(agent, 50.0)
+    assert len(agent.exchange.requests) == 1
+    assert agent.desired_quote is not None
+
+    # The quote that waited goes out as soon as the exchange answers, without waiting for another tick
+    first = agent.order
+    on_order_placed(accept("a", kwargs))
+    assert first.order_id == "a"
+    assert len(agent.exchange.requests) == 2
+    kind, kwargs, _, _ = agent.exchange.requests[1]
+    assert kind == "replace"
+    assert kwargs["price"] < 50.0
+    assert first.state == PENDING_CANCEL
+    assert agent.order.state == PENDING_NEW
+    assert agent.desired_quote is None
+
+# Test the replace state transitions, balances are left to the exchange's wallet
+def test_replace(fake_logger):
+    agent = get_test_agent(fake_logger)
+    tick(agent, 100.0)
+    _, kwargs, on_order_placed, _ = agent.exchange.requests[0]
+    on_order_placed(accept("a", kwargs))
+    first = agent.order
+    assert agent.exchange.hold["USD"] == 0.0
+
+    tick(agent, 90.0)
+    kind, kwargs, on_order_placed, on_order_cancelled = agent.exchange.requests[1]
+    assert kind == "replace"
+    assert first.state == PENDING_CANCEL
+    assert agent.order.state == PENDING_NEW
+    assert agent.order.price == kwargs["price"]
+    assert len(agent.orders) == 2
+
+    on_order_cancelled(["a"])
+    on_order_placed(accept("b", kwargs))
+    assert first.state == DONE
+    assert agent.order.state == OPEN
+    assert list(agent.orders.values()) == [agent.order]
+    assert agent.exchange.hold["USD"] == 0.0 and agent.exchange.available["USD"] == 1000.0
+
+# Test that an order whose cancel failed is still tracked as open, then dropped once the exchange no longer lists it
+def test_failed_cancel(fake_logger):
+    agent = get_test_agent(fake_logger, Seller)
+    tick(agent, 100.0)
+    _, kwargs, on_order_placed, _ = agent.exchange.requests[0]
+    on_order_placed(accept("a", kwargs))
+    first = agent.order
+
+    tick(agent, 120.0)
+    _, kwargs, on_order_placed, on_order_cancelled = agent.exchange.requests[1]
+    on_order_placed(accept("b", kwargs))
+    on_order_cancelled({"message": "rate limit exceeded"})
+    assert first.state == OPEN
+    assert agent.find_order("a") is first
+    assert agent.order.order_id == "b"
+
+    # The watchdog cancels it again as it isn't our quote, and forgets it once it is gone
+    agent.on_order_watchdog([{"id": "a"}, {"id": "b"}])
+    assert agent.exchange.cancelled == ["a"]
+    agent.on_order_watchdog([{"id": "b"}])
+    assert agent.find_order("a") is None
+    assert agent.order.order_id == "b"
+
+# Test that a rejected order and fills for an order being cancelled are handled
+def test_reject_and_fill(fake_logger):
+    agent = get_test_agent(fake_logger, Seller)
+    tick(agent, 100.0)
+    _, kwargs, on_order_placed, _ = agent.exchange.requests[0]
+    on_order_placed({"message": "Post only mode"})
+    assert agent.order.opened() == False
+    assert len(agent.orders) == 0
+
+    tick(agent, 100.0)
+    _, kwargs, on_order_placed, _ = agent.exchange.requests[1]
+    on_order_placed(accept("c", kwargs))
+    first = agent.order
+
+    tick(agent, 120.0)
+    agent.on_fill(Fill("BTC-USD", "c", "sell", first.price, first.order_size / 2, 0.0))
+    assert abs(first.outstanding_order_size - first.order_size / 2) < 10**-9
+    assert agent.order.outstanding_order_size == agent.order.order_size
+
+# Test that the watchdog leaves in flight orders alone and drops orders the exchange no longer has
+def test_watchdog(fake_logger):
+    agent = get_test_agent(fake_logger)
+    tick(agent, 100.0)
+    _, kwargs, on_order_placed, _ = agent.exchange.requests[0]
+
+    agent.on_order_watchdog([])
+    assert agent.order.state == PENDING_NEW
+
+    on_order_placed(accept("a", kwargs))
+    agent.on_order_watchdog([{"id": "a"}, {"id": "x"}])
+    assert agent.exchange.cancelled == ["x"]
+    assert agent.order.order_id == "a"
+
+    agent.on_order_watchdog([])
+    assert agent.order.opened() == False
+    assert len(agent.orders) == 0
+
+# Test agents quote off the book when they have one and off the tick otherwise
+def test_agent_best_prices(fake_logger):
+    agent = get_test_agent(fake_logger)
+    tick = Tick("BTC-USD", 100.0, 1.0, "buy", 90.0, 110.0)
+    assert agent.best_bid(tick) == 90.0
+
+    agent.book = L2Book()
+    assert agent.best_ask(tick) == 110.0
+
+    agent.book.on_snapshot({"bids": [["100.0", "1.0"]], "asks": [["101.0", "3.0"]]})
+    assert agent.best_bid(tick) == 100.0 and agent.best_ask(tick) == 101.0
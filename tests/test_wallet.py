@@ -0,0 +1,84 @@
+from src.exchange.wallet import Wallet
+
+def get_test_wallet():
+    wallet = Wallet()
+    wallet.set("USD", 1000.0, 0.0)
+    wallet.set("BTC", 1.0, 0.0)
+    return wallet
+
+def close(a, b):
+    return abs(a - b) < 10**-9
+
+# Test holds, fills and cancels of a buy order
+def test_buy_order():
+    wallet = get_test_wallet()
+    wallet.place("a", "BTC-USD", "buy", 100.0, 2.0)
+    assert close(wallet.available["USD"], 800.0) and close(wallet.hold["USD"], 200.0)
+    assert close(wallet.balance["USD"], 1000.0)
+
+    wallet.fill("a", 100.0, 0.5, 0.1)
+    assert close(wallet.hold["USD"], 150.0)
+    assert close(wallet.available["USD"], 799.9)
+    assert close(wallet.balance["BTC"], 1.5)
+
+    assert wallet.cancel("a")
+    assert close(wallet.hold["USD"], 0.0)
+    assert close(wallet.balance["USD"], 1000.0 - 50.0 - 0.1)
+    assert wallet.cancel("a") == False
+
+# Test holds and fills of a sell order, and a trade without a resting order
+def test_sell_order_and_trade():
+    wallet = get_test_wallet()
+    wallet.place("b", "BTC-USD", "sell", 100.0, 0.4)
+    assert close(wallet.available["BTC"], 0.6) and close(wallet.hold["BTC"], 0.4)
+
+    wallet.fill("b", 100.0, 0.4, 0.2)
+    assert close(wallet.hold["BTC"], 0.0)
+    assert close(wallet.balance["USD"], 1039.8)
+
+    wallet.trade("BTC-USD", "buy", 100.0, 0.1, 0.05)
+    assert close(wallet.balance["BTC"], 0.7)
+    assert close(wallet.balance["USD"], 1029.75)
+
+# Test the user channel messages drive the wallet
+def test_on_message():
+    wallet = get_test_wallet()
+    wallet.on_message({"type": "received", "order_type": "limit", "order_id": "a", "product_id": "BTC-USD", "side": "buy", "price": "100.0", "size": "2.0"})
+    wallet.on_message({"type": "open", "order_id": "a", "product_id": "BTC-USD", "side": "buy", "price": "100.0", "remaining_size": "2.0"})
+    wallet.on_message({"type": "match", "maker_order_id": "a", "taker_order_id": "x", "product_id": "BTC-USD", "side": "buy", "price": "100.0", "size": "1.0", "maker_fee_rate": "0.001"})
+    wallet.on_message({"type": "change", "order_id": "a", "old_size": "1.0", "new_size": "0.5", "price": "100.0"})
+    assert close(wallet.hold["USD"], 50.0)
+    wallet.on_message({"type": "done", "order_id": "a", "reason": "canceled", "remaining_size": "0.5"})
+
+    assert close(wallet.hold["USD"], 0.0)
+    assert close(wallet.balance["USD"], 900.0 - 0.1)
+    assert close(wallet.balance["BTC"], 2.0)
+    assert len(wallet.orders) == 0
+
+    # We took liquidity with a market order, the match side is the maker's
+    wallet.on_message({"type": "match", "maker_order_id": "y", "taker_order_id": "m", "product_id": "BTC-USD", "side": "sell", "price": "100.0", "size": "1.0", "taker_fee_rate": "0.002"})
+    assert close(wallet.balance["BTC"], 3.0)
+    assert close(wallet.balance["USD"], 800.0 - 0.1 - 0.2)
+
+# Test that snapshots correct drift, unless the wallet changed while they were fetched
+def test_reconcile():
+    wallet = get_test_wallet()
+
+    version = wallet.version
+    drift = wallet.reconcile({"USD": (990.0, 0.0), "BTC": (1.0, 0.0)}, version)
+    assert close(drift["USD"], -10.0) and drift["BTC"] == 0.0
+    assert wallet.balance["USD"] == 990.0
+
+    for k in range(5):
+        version = wallet.version
+        wallet.place(str(k), "BTC-USD", "sell", 100.0, 0.1)
+        assert wallet.reconcile({"USD": (0.0, 0.0)}, version) is None
+
+    # Too many skipped in a row, the next snapshot is taken anyway
+    version = wallet.version
+    wallet.cancel("0")
+    assert wallet.reconcile({"USD": (980.0, 0.0)}, version) == {"USD": -10.0}
+
+    metrics = wallet.metrics()
+    assert metrics["reconciles"] == 2 and metrics["skipped"] == 5
+    assert metrics["max_drift"]["USD"] == 10.0